@@ -28,6 +28,8 @@ from typing import Dict, List, Optional, Tuple
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
+from src.transcriber import get_model_pool, get_decoded_audio_cache
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -66,6 +68,7 @@ class GPUTranscriber:
         self.num_workers = num_workers
         self.model = None
         self.device = None
+        self._pooled_model = None
         
         # 初始化设备和模型
         self._initialize()
@@ -130,19 +133,21 @@ class GPUTranscriber:
             cache_dir = project_root / '.cache' / 'whisper'
             cache_dir.mkdir(parents=True, exist_ok=True)
             
-            # 加载模型
-            self.model = whisper.load_model(
-                name=self.model_name,
-                device=self.device,
-                download_root=str(cache_dir)
-            )
-            
-            # 如果使用GPU且支持FP16，转换模型
+            # 如果使用GPU且支持FP16，使用half精度的模型
+            # 只转换模型到half，不转换输入，Whisper内部会处理输入类型转换
+            precision = 'float32'
             if self.device.type == 'cuda' and self.compute_type == 'float16':
                 logger.info("启用FP16混合精度推理")
-                # 只转换模型到half，不转换输入
-                # Whisper内部会处理输入类型转换
-                self.model = self.model.half()
+                precision = 'float16'
+            
+            # 从进程级模型池获取模型，同一进程内复用已加载的权重
+            self._pooled_model = get_model_pool().acquire(
+                self.model_name,
+                device=str(self.device),
+                precision=precision,
+                download_root=str(cache_dir)
+            )
+            self.model = self._pooled_model.model
             
             load_time = time.time() - start_time
             logger.info(f"模型加载完成，耗时: {load_time:.1f} 秒")
@@ -224,8 +229,9 @@ class GPUTranscriber:
         params = {**default_params, **kwargs}
         
         try:
-            # 执行转录
-            result = self.model.transcribe(str(audio_path), **params)
+            # 执行转录，解码结果缓存在音频文件旁，换模型或参数重转时无需重新解码
+            audio = get_decoded_audio_cache().load(audio_path)
+            result = self._pooled_model.transcribe(audio, **params)
             
             # 记录时间和内存
             transcribe_time = time.time() - start_time
@@ -241,6 +247,13 @@ class GPUTranscriber:
             logger.error(f"转录失败: {e}")
             raise
     
+    def close(self):
+        """归还模型池中的模型引用"""
+        if self._pooled_model:
+            self._pooled_model.release()
+            self._pooled_model = None
+            self.model = None
+    
     def transcribe_batch(self, audio_paths: List[str], **kwargs) -> List[Dict]:
         """
         批量转录音频文件
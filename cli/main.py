@@ -45,6 +45,9 @@ def main():
   # 批量下载UP主所有视频（新功能）
   bili2text user-videos --uid 123456  # 通过UID下载
   bili2text user-videos --user "UP主名称" --audio-only  # 通过用户名下载音频
+  
+  # 作为远程工作节点从Web应用领取转录任务
+  bili2text worker --server http://192.168.1.10:5000 --models medium,large-v3
         """
     )
     
@@ -133,6 +136,22 @@ def main():
     user_videos_parser.add_argument('--proxy-url', default='http://127.0.0.1:7890',
                                    help='代理地址 (默认: http://127.0.0.1:7890)')
     
+    # 远程工作节点命令
+    worker_parser = subparsers.add_parser('worker', help='作为远程工作节点领取Web应用的转录任务')
+    worker_parser.add_argument('--server', default='http://127.0.0.1:5000',
+                              help='Web应用地址 (默认: http://127.0.0.1:5000)')
+    worker_parser.add_argument('--token', help='工作节点令牌，默认读取环境变量 WORKER_TOKEN')
+    worker_parser.add_argument('--worker-id', help='工作节点ID，默认由主机名和进程号生成')
+    worker_parser.add_argument('--models', help='支持的模型，逗号分隔，默认不限')
+    worker_parser.add_argument('--work-dir', help='下载音频的工作目录')
+    worker_parser.add_argument('--poll-interval', type=float, default=5,
+                              help='没有任务时的轮询间隔（秒）')
+    worker_parser.add_argument('--window', type=int, default=180,
+                              help='转录窗口时长（秒），每个窗口完成后上报片段')
+    worker_parser.add_argument('--device', choices=['auto', 'cuda', 'cpu'], default=None,
+                              help='计算设备选择')
+    worker_parser.add_argument('--proxy-url', help='任务要求使用代理时的代理地址')
+    
     # 解析参数
     args = parser.parse_args()
     
@@ -189,6 +208,9 @@ def main():
         elif args.command == 'user-videos':
             from cli.download_user_videos import main as user_videos_main
             user_videos_main(args)
+        elif args.command == 'worker':
+            from cli.worker import main as worker_main
+            worker_main(args)
     except KeyboardInterrupt:
         print("\n用户中断操作")
         sys.exit(1)
@@ -37,6 +37,7 @@ try:
     import torch
     import whisper
     from tqdm import tqdm
+    from src.transcriber import get_decoded_audio_cache
     WHISPER_AVAILABLE = True
 except ImportError as e:
     WHISPER_AVAILABLE = False
@@ -155,9 +156,9 @@ def transcribe_video(model, video_path, output_dir, device_info):
             logger.info("使用模拟模式进行转录")
             text = f"这是来自视频 {video_path.name} 的模拟转录文本。实际使用时需要安装Whisper库。"
         else:
-            # 实际转录
+            # 实际转录，解码结果缓存在视频文件旁，重复转录时无需重新解码
             result = model.transcribe(
-                str(video_path),
+                get_decoded_audio_cache().load(video_path),
                 verbose=False,
                 initial_prompt='简体中文，加上标点符号。',
                 language='zh'
@@ -0,0 +1,53 @@
+"""
+Bili2Text - 远程转录工作节点
+============================
+
+功能：从Web应用领取转录任务，在本机下载和转录，上报进度并上传结果。
+可在多台机器上各运行一个或多个工作节点，分担Web应用的转录负载。
+"""
+
+import os
+import sys
+import logging
+import threading
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from webapp.core.remote_worker import HttpTransport, RemoteWorker
+
+
+def main(args):
+    """工作节点主函数"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+
+    models = [model.strip() for model in args.models.split(',')] if args.models else None
+    worker = RemoteWorker(
+        HttpTransport(args.server, token=args.token or os.environ.get('WORKER_TOKEN')),
+        worker_id=args.worker_id,
+        models=models,
+        work_dir=args.work_dir,
+        poll_interval=args.poll_interval,
+        window_seconds=args.window,
+        proxy_url=args.proxy_url,
+        device=args.device
+    )
+
+    print("=" * 50)
+    print("Bili2Text - 远程转录工作节点")
+    print("=" * 50)
+    print(f"服务地址: {args.server}")
+    print(f"工作节点: {worker.worker_id}")
+    print(f"支持模型: {', '.join(models) if models else '全部'}")
+    print(f"工作目录: {worker.work_dir}")
+    print("=" * 50)
+
+    stop_event = threading.Event()
+    try:
+        worker.run(stop_event)
+    except KeyboardInterrupt:
+        stop_event.set()
+    finally:
+        print(f"\n已完成 {worker.completed} 个任务，失败 {worker.failed} 个")
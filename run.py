@@ -7,7 +7,7 @@ import os
 import sys
 import argparse
 import logging
-from webapp.app import create_app
+from webapp.app import get_app
 
 def setup_logging(debug=False):
     """设置日志"""
@@ -36,8 +36,8 @@ def main():
     # 设置日志
     setup_logging(args.debug)
     
-    # 创建应用
-    app = create_app()
+    # 获取应用（与 webapp.app:app 是同一个实例）
+    app = get_app()
     socketio = app.socketio
     
     if args.production:
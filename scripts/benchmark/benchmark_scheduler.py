@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+调度策略基准测试 - 用记录的工作负载离线比较各调度策略的等待时间
+
+工作负载来源:
+    --workload  JSON文件，任务记录列表，每项包含 arrival、duration、model_name、priority、client_id
+    --database  SQLite数据库，从 tasks 表回放历史任务
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from webapp.core.scheduler import POLICIES, create_policy, simulate_workload
+
+
+def load_workload_from_json(path):
+    """从JSON文件加载工作负载"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_workload_from_database(path, limit=None):
+    """从tasks表加载历史工作负载"""
+    conn = sqlite3.connect(path)
+    try:
+        query = 'SELECT task_id, created_at, duration, model_name, options, client_id FROM tasks ORDER BY created_at'
+        if limit:
+            query += f' LIMIT {int(limit)}'
+        rows = conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+    workload = []
+    start = None
+    for task_id, created_at, duration, model_name, options, client_id in rows:
+        created = datetime.fromisoformat(created_at)
+        start = start or created
+        options = json.loads(options) if options else {}
+        workload.append({
+            'task_id': task_id,
+            'arrival': (created - start).total_seconds(),
+            'duration': duration,
+            'model_name': model_name,
+            'priority': options.get('priority', 0),
+            'client_id': client_id or options.get('client_id', 'default')
+        })
+    return workload
+
+
+def main():
+    parser = argparse.ArgumentParser(description='调度策略基准测试')
+    parser.add_argument('--workload', help='工作负载JSON文件')
+    parser.add_argument('--database', help='SQLite数据库文件')
+    parser.add_argument('--limit', type=int, help='最多回放的任务数')
+    parser.add_argument('--workers', type=int, default=2, help='并行处理槽数量')
+    parser.add_argument('--aging-factor', type=float, default=1.0, help='老化系数')
+    parser.add_argument('--policies', default=','.join(POLICIES), help='参与比较的策略，逗号分隔')
+    parser.add_argument('--affinity-windows', default='0,8', help='参与比较的模型亲和重排窗口，逗号分隔')
+    parser.add_argument('--affinity-max-wait', type=float, default=300, help='模型亲和最多推迟的等待时间（秒）')
+    parser.add_argument('--swap-cost', type=float, default=20, help='切换模型的加载耗时（秒）')
+    args = parser.parse_args()
+
+    if args.workload:
+        workload = load_workload_from_json(args.workload)
+    elif args.database:
+        workload = load_workload_from_database(args.database, args.limit)
+    else:
+        parser.error('必须提供 --workload 或 --database')
+
+    print(f"📋 工作负载: {len(workload)} 个任务, 工作槽: {args.workers}, 模型切换耗时: {args.swap_cost} 秒")
+    print("=" * 82)
+    print(f"{'策略':<10}{'亲和窗口':>10}{'平均等待':>12}{'P95等待':>12}{'最大等待':>12}{'平均完成':>12}{'模型切换':>10}")
+
+    for name in args.policies.split(','):
+        for window in args.affinity_windows.split(','):
+            policy = create_policy(name.strip(), aging_factor=args.aging_factor)
+            metrics = simulate_workload(
+                policy, workload, workers=args.workers,
+                affinity_window=int(window), affinity_max_wait=args.affinity_max_wait,
+                swap_cost=args.swap_cost
+            )
+            if not metrics:
+                continue
+            print(f"{name:<10}{int(window):>10}{metrics['mean_wait']:>12.1f}{metrics['p95_wait']:>12.1f}"
+                  f"{metrics['max_wait']:>12.1f}{metrics['mean_turnaround']:>12.1f}{metrics['model_swaps']:>10}")
+
+
+if __name__ == '__main__':
+    main()
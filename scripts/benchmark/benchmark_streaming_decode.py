@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+流式解码基准测试 - 比较整段解码与流式解码在不同音频时长下的内存峰值（RSS）
+
+每次测量在独立子进程中进行，ru_maxrss 即为该次解码+分窗转录的内存峰值。
+默认使用空模型，只测量解码与窗口切分本身；--model 可指定真实的Whisper模型。
+
+测试音频:
+    --durations  按时长（分钟）用ffmpeg生成正弦波测试音频（AAC，44.1kHz双声道）
+    --source     使用已有的音频文件
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import argparse
+import subprocess
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.transcriber import StreamingAudio, get_model_pool, probe_duration, transcribe_windowed
+
+
+class NullModel:
+    """不做推理的模型，只消费窗口数据"""
+
+    def transcribe(self, audio, before_window=None, **kwargs):
+        float(audio.sum())
+        return {'text': '', 'segments': [], 'language': kwargs.get('language')}
+
+
+def generate_audio(path, duration):
+    """生成指定时长的测试音频"""
+    cmd = [
+        'ffmpeg', '-nostdin', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={duration}',
+        '-ac', '2', '-c:a', 'aac', '-b:a', '64k', path
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def decode_full(path):
+    """整段解码（与 TaskManager._load_audio 相同）"""
+    import numpy as np
+
+    cmd = [
+        'ffmpeg', '-nostdin', '-threads', '0', '-i', path,
+        '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', '16000', '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True, check=True)
+    return np.frombuffer(result.stdout, np.int16).flatten().astype(np.float32) / 32768.0
+
+
+def run_child(mode, path, window, model_name):
+    """子进程：执行一次解码+分窗转录并输出内存峰值"""
+    import numpy  # noqa: F401  基线包含numpy本身的占用
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if model_name:
+        model = get_model_pool().acquire(model_name)
+    else:
+        model = NullModel()
+    model_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start_time = time.time()
+    if mode == 'stream':
+        with StreamingAudio(path) as audio:
+            transcribe_windowed(model, audio, window_seconds=window)
+    else:
+        audio = decode_full(path)
+        transcribe_windowed(model, audio, window_seconds=window)
+    elapsed = time.time() - start_time
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'baseline_mb': round(baseline_kb / 1024, 1),
+        'model_mb': round((model_kb - baseline_kb) / 1024, 1),
+        'peak_mb': round(peak_kb / 1024, 1),
+        'audio_mb': round((peak_kb - model_kb) / 1024, 1),
+        'elapsed': round(elapsed, 2)
+    }))
+
+
+def measure(mode, path, window, model_name):
+    """在独立子进程中测量"""
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', mode, '--source', path, '--window', str(window)]
+    if model_name:
+        cmd += ['--model', model_name]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='流式解码内存基准测试')
+    parser.add_argument('--durations', default='10,30,60,120,240', help='测试音频时长（分钟），逗号分隔')
+    parser.add_argument('--source', help='使用已有的音频文件')
+    parser.add_argument('--window', type=int, default=180, help='转录窗口时长（秒）')
+    parser.add_argument('--model', help='Whisper模型名称，默认不做推理')
+    parser.add_argument('--modes', default='full,stream', help='参与比较的解码方式，逗号分隔')
+    parser.add_argument('--output', help='将结果保存为JSON文件')
+    parser.add_argument('--child', choices=['full', 'stream'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.source, args.window, args.model)
+        return
+
+    modes = [mode.strip() for mode in args.modes.split(',')]
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix='bili2text_bench_') as temp_dir:
+        if args.source:
+            sources = [(args.source, probe_duration(args.source) or 0)]
+        else:
+            sources = []
+            for minutes in args.durations.split(','):
+                duration = float(minutes) * 60
+                path = os.path.join(temp_dir, f'sine_{minutes.strip()}min.m4a')
+                print(f"🎵 生成测试音频: {minutes.strip()} 分钟")
+                generate_audio(path, duration)
+                sources.append((path, duration))
+
+        print(f"📋 窗口: {args.window} 秒, 模型: {args.model or '无（只解码）'}")
+        print("=" * 72)
+        print(f"{'时长(分)':<10}{'方式':<10}{'峰值RSS(MB)':>14}{'音频占用(MB)':>14}{'耗时(秒)':>12}")
+
+        for path, duration in sources:
+            for mode in modes:
+                metrics = measure(mode, path, args.window, args.model)
+                results.append(dict(metrics, mode=mode, duration=duration, source=os.path.basename(path)))
+                print(f"{duration / 60:<10.0f}{mode:<10}{metrics['peak_mb']:>14.1f}"
+                      f"{metrics['audio_mb']:>14.1f}{metrics['elapsed']:>12.2f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+"""
+转录核心模块
+"""
+
+from src.transcriber.model_pool import ModelPool, PooledModel, get_model_pool
+from src.transcriber.audio_cache import DecodedAudioCache, get_decoded_audio_cache
+from src.transcriber.streaming import StreamingAudio, probe_duration
+from src.transcriber.windowed import transcribe_windowed
+from src.transcriber.process_pool import TranscriptionProcessPool, TranscriptionCancelled
+
+__all__ = [
+    'ModelPool', 'PooledModel', 'get_model_pool',
+    'DecodedAudioCache', 'get_decoded_audio_cache',
+    'StreamingAudio', 'probe_duration',
+    'transcribe_windowed',
+    'TranscriptionProcessPool', 'TranscriptionCancelled'
+]
@@ -0,0 +1,227 @@
+"""
+解码音频缓存
+将音频解码后的16kHz单声道float32 PCM以 .npy 文件保存在源文件旁，
+再次转录（换模型、换语言）时以内存映射方式零拷贝加载，无需重新运行ffmpeg。
+源文件大小或修改时间变化时缓存失效，总大小超出预算时按最近使用时间淘汰。
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+CACHE_SUFFIX = '.pcm16k.npy'
+META_SUFFIX = '.pcm16k.json'
+
+DEFAULT_MAX_SIZE = int(os.environ.get('DECODED_AUDIO_CACHE_MAX_SIZE', 5 * 1024 * 1024 * 1024))  # 5GB
+
+
+class DecodedAudioCache:
+    """解码音频缓存"""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, decoder=None):
+        """
+        初始化解码音频缓存
+
+        Args:
+            max_size: 缓存文件总大小上限（字节）
+            decoder: 默认解码函数 decoder(source_path) -> numpy数组，默认使用 whisper.load_audio
+        """
+        self.max_size = max_size
+        self._decoder = decoder or _whisper_decode
+        self._entries = {}
+        self._path_locks = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def set_max_size(self, max_size):
+        """调整缓存预算"""
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def load(self, source_path, decoder=None):
+        """
+        获取解码后的波形
+
+        Args:
+            source_path: 音频或视频文件路径
+            decoder: 缓存未命中时使用的解码函数，默认使用初始化时的解码函数
+
+        Returns:
+            numpy.ndarray: 只读的内存映射数组（float32，16kHz单声道）
+        """
+        import numpy as np
+
+        source_path = os.path.abspath(str(source_path))
+        cache_path = source_path + CACHE_SUFFIX
+
+        with self._path_lock(source_path):
+            if self._is_valid(source_path):
+                try:
+                    audio = np.load(cache_path, mmap_mode='r')
+                    os.utime(cache_path)
+                    with self._lock:
+                        self.hits += 1
+                        self._entries[cache_path] = (os.path.getsize(cache_path), time.time())
+                    return audio
+                except (OSError, ValueError) as e:
+                    logger.warning(f"读取解码音频缓存失败 {cache_path}: {e}")
+
+            with self._lock:
+                self.misses += 1
+            audio = (decoder or self._decoder)(source_path)
+            self._store(source_path, np.asarray(audio, dtype=np.float32))
+
+        try:
+            return np.load(cache_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return audio
+
+    def contains(self, source_path):
+        """源文件是否已有有效的缓存（不计入命中统计）"""
+        return self._is_valid(os.path.abspath(str(source_path)))
+
+    def invalidate(self, source_path):
+        """删除源文件对应的缓存"""
+        source_path = os.path.abspath(str(source_path))
+        for path in (source_path + CACHE_SUFFIX, source_path + META_SUFFIX):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._entries.pop(source_path + CACHE_SUFFIX, None)
+
+    def scan(self, *roots):
+        """登记目录下已有的缓存文件，用于进程启动后恢复淘汰所需的索引"""
+        found = 0
+        for root in roots:
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    if not filename.endswith(CACHE_SUFFIX):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    with self._lock:
+                        self._entries[path] = (stat.st_size, stat.st_mtime)
+                    found += 1
+
+        with self._lock:
+            self._evict()
+        return found
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size_bytes': sum(size for size, _ in self._entries.values()),
+                'max_size_bytes': self.max_size
+            }
+
+    def _is_valid(self, source_path):
+        """缓存存在且源文件大小和修改时间未变化"""
+        cache_path = source_path + CACHE_SUFFIX
+        meta_path = source_path + META_SUFFIX
+        if not os.path.exists(cache_path) or not os.path.exists(meta_path):
+            return False
+
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            stat = os.stat(source_path)
+        except (OSError, ValueError):
+            return False
+
+        if meta.get('source_size') == stat.st_size and meta.get('source_mtime_ns') == stat.st_mtime_ns:
+            return True
+
+        logger.info(f"源文件已变化，解码音频缓存失效: {source_path}")
+        with self._lock:
+            self.invalidations += 1
+        self.invalidate(source_path)
+        return False
+
+    def _store(self, source_path, audio):
+        """写入缓存文件"""
+        import numpy as np
+
+        cache_path = source_path + CACHE_SUFFIX
+        temp_path = source_path + '.pcm16k.tmp.npy'
+        try:
+            stat = os.stat(source_path)
+            np.save(temp_path, audio)
+            os.replace(temp_path, cache_path)
+            with open(source_path + META_SUFFIX, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'source_size': stat.st_size,
+                    'source_mtime_ns': stat.st_mtime_ns,
+                    'samples': int(audio.shape[0]),
+                    'sample_rate': SAMPLE_RATE
+                }, f)
+        except OSError as e:
+            logger.warning(f"写入解码音频缓存失败 {cache_path}: {e}")
+            return
+
+        with self._lock:
+            self._entries[cache_path] = (os.path.getsize(cache_path), time.time())
+            self._evict()
+
+    def _evict(self):
+        """按最近使用时间淘汰，直到不超过预算（调用方持有 self._lock）"""
+        total = sum(size for size, _ in self._entries.values())
+        for cache_path, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_size:
+                break
+            for path in (cache_path, cache_path[:-len(CACHE_SUFFIX)] + META_SUFFIX):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            del self._entries[cache_path]
+            total -= size
+            self.evictions += 1
+            logger.info(f"解码音频缓存淘汰: {cache_path}")
+
+    def _path_lock(self, source_path):
+        """同一源文件的解码串行进行，避免重复解码"""
+        with self._lock:
+            return self._path_locks.setdefault(source_path, threading.Lock())
+
+
+def _whisper_decode(source_path):
+    """使用 whisper.load_audio 解码"""
+    import whisper
+
+    return whisper.load_audio(source_path)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_decoded_audio_cache():
+    """获取进程级共享的解码音频缓存"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = DecodedAudioCache()
+        return _default_cache
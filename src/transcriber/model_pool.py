@@ -0,0 +1,321 @@
+"""
+Whisper模型池
+进程内共享的模型缓存，按 (模型名称, 设备, 精度) 复用已加载的权重，
+支持内存预算、LRU淘汰和引用计数
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 模型常驻内存估算（GB，float32），实际大小在加载后按参数量重新计算
+MODEL_MEMORY_ESTIMATES = {
+    'tiny': 0.2,
+    'base': 0.4,
+    'small': 1.0,
+    'medium': 3.0,
+    'large': 6.0,
+    'large-v2': 6.0,
+    'large-v3': 6.0
+}
+
+DEFAULT_MEMORY_BUDGET_GB = float(os.environ.get('WHISPER_MODEL_POOL_BUDGET_GB', 12))
+
+
+class PooledModel:
+    """模型池中的一个模型实例"""
+
+    def __init__(self, pool, key, model, size_bytes):
+        self.pool = pool
+        self.key = key
+        self.model = model
+        self.size_bytes = size_bytes
+        self.refcount = 0
+        self.last_used = time.time()
+        # Whisper的kv-cache钩子不可重入，同一实例上的推理需要串行
+        self.lock = threading.Lock()
+
+    @property
+    def model_name(self):
+        return self.key[0]
+
+    @property
+    def device(self):
+        return self.key[1]
+
+    @property
+    def precision(self):
+        return self.key[2]
+
+    def transcribe(self, audio, before_window=None, **kwargs):
+        """
+        在独占锁内执行转录
+
+        Args:
+            audio: 音频路径或16kHz波形
+            before_window: 每个30秒解码窗口开始前调用的回调，抛出异常即可中止转录
+        """
+        with self.lock:
+            if before_window is None:
+                return self.model.transcribe(audio, **kwargs)
+
+            # whisper.transcribe 按窗口逐段调用 model.decode，在实例上临时包装即可插入检查点
+            decode = self.model.decode
+
+            def checked_decode(*args, **decode_kwargs):
+                before_window()
+                return decode(*args, **decode_kwargs)
+
+            self.model.decode = checked_decode
+            try:
+                return self.model.transcribe(audio, **kwargs)
+            finally:
+                del self.model.decode
+
+    def release(self):
+        """归还模型引用"""
+        self.pool.release(self)
+
+
+class ModelPool:
+    """Whisper模型池"""
+
+    def __init__(self, memory_budget_gb=DEFAULT_MEMORY_BUDGET_GB, loader=None):
+        """
+        初始化模型池
+
+        Args:
+            memory_budget_gb: 模型常驻内存预算（GB），超出时淘汰最久未使用的空闲模型
+            loader: 模型加载函数 (model_name, device, precision, download_root) -> model，
+                    默认使用 whisper.load_model
+        """
+        self.memory_budget_bytes = int(memory_budget_gb * 1024 ** 3)
+        self._loader = loader or _load_whisper_model
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._condition = threading.Condition()
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_count = 0
+        self.total_load_time = 0.0
+        self.load_times = {}
+
+    def set_memory_budget(self, memory_budget_gb):
+        """调整内存预算"""
+        with self._condition:
+            self.memory_budget_bytes = int(memory_budget_gb * 1024 ** 3)
+            self._evict_idle(0)
+
+    def acquire(self, model_name, device=None, precision=None, download_root=None):
+        """
+        获取模型引用，未加载时加载模型
+
+        Args:
+            model_name: Whisper模型名称
+            device: 设备 (cpu, cuda, cuda:0 ...)，默认自动检测
+            precision: 计算精度 (float16, float32)，CPU上固定为float32
+            download_root: 模型文件缓存目录，仅在加载时使用
+
+        Returns:
+            PooledModel: 使用完毕后需调用 release()
+        """
+        key = self._make_key(model_name, device, precision)
+
+        with self._condition:
+            while True:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    entry.refcount += 1
+                    entry.last_used = time.time()
+                    self._entries.move_to_end(key)
+                    return entry
+
+                if key not in self._loading:
+                    break
+                # 其他线程正在加载同一模型，等待其完成
+                self._condition.wait()
+
+            self.misses += 1
+            self._loading[key] = True
+            self._evict_idle(self._estimate_size(key))
+
+        try:
+            start_time = time.time()
+            logger.info(f"模型池加载模型: {key}")
+            model = self._loader(key[0], key[1], key[2], download_root)
+            load_time = time.time() - start_time
+            logger.info(f"模型加载完成 {key}，耗时: {load_time:.1f} 秒")
+        except Exception:
+            with self._condition:
+                del self._loading[key]
+                self._condition.notify_all()
+            raise
+
+        with self._condition:
+            del self._loading[key]
+            entry = PooledModel(self, key, model, _measure_model_size(model) or self._estimate_size(key))
+            entry.refcount = 1
+            self._entries[key] = entry
+
+            self.load_count += 1
+            self.total_load_time += load_time
+            self.load_times[_format_key(key)] = round(load_time, 3)
+
+            if self._used_bytes() > self.memory_budget_bytes:
+                logger.warning(
+                    f"模型池超出内存预算: {self._used_bytes() / 1024 ** 3:.1f}GB / "
+                    f"{self.memory_budget_bytes / 1024 ** 3:.1f}GB"
+                )
+            self._condition.notify_all()
+            return entry
+
+    def release(self, entry):
+        """归还模型引用"""
+        with self._condition:
+            entry.refcount = max(0, entry.refcount - 1)
+            entry.last_used = time.time()
+            if entry.refcount == 0:
+                self._evict_idle(0)
+
+    @contextmanager
+    def lease(self, model_name, device=None, precision=None, download_root=None):
+        """以上下文管理器方式使用模型"""
+        entry = self.acquire(model_name, device, precision, download_root)
+        try:
+            yield entry
+        finally:
+            self.release(entry)
+
+    def clear(self):
+        """卸载所有空闲模型"""
+        with self._condition:
+            for key in [k for k, e in self._entries.items() if e.refcount == 0]:
+                self._remove(key)
+
+    def get_stats(self):
+        """获取模型池统计信息"""
+        with self._condition:
+            lookups = self.hits + self.misses
+            average_load_time = self.total_load_time / self.load_count if self.load_count else 0
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'evictions': self.evictions,
+                'load_count': self.load_count,
+                'total_load_time': round(self.total_load_time, 3),
+                'average_load_time': round(average_load_time, 3),
+                'estimated_time_saved': round(self.hits * average_load_time, 3),
+                'load_times': dict(self.load_times),
+                'memory_used_bytes': self._used_bytes(),
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'models': [
+                    {
+                        'model_name': entry.model_name,
+                        'device': entry.device,
+                        'precision': entry.precision,
+                        'size_bytes': entry.size_bytes,
+                        'refcount': entry.refcount,
+                        'last_used': entry.last_used
+                    }
+                    for entry in self._entries.values()
+                ]
+            }
+
+    def _make_key(self, model_name, device, precision):
+        """生成模型键"""
+        device = _resolve_device(device)
+        if not device.startswith('cuda'):
+            precision = 'float32'
+        return (model_name, device, precision or 'float32')
+
+    def _estimate_size(self, key):
+        """估算模型内存占用"""
+        size_gb = MODEL_MEMORY_ESTIMATES.get(key[0], 3.0)
+        if key[2] == 'float16':
+            size_gb *= 0.5
+        return int(size_gb * 1024 ** 3)
+
+    def _used_bytes(self):
+        return sum(entry.size_bytes for entry in self._entries.values())
+
+    def _evict_idle(self, incoming_bytes):
+        """按LRU顺序淘汰空闲模型，直到预算足够容纳新模型"""
+        for key in list(self._entries.keys()):
+            if self._used_bytes() + incoming_bytes <= self.memory_budget_bytes:
+                break
+            if self._entries[key].refcount == 0:
+                self._remove(key)
+                self.evictions += 1
+
+    def _remove(self, key):
+        """卸载模型"""
+        entry = self._entries.pop(key)
+        logger.info(f"模型池卸载模型: {key}")
+        entry.model = None
+        if key[1].startswith('cuda'):
+            try:
+                import torch
+                torch.cuda.empty_cache()
+            except ImportError:
+                pass
+
+
+def _resolve_device(device):
+    """规范化设备名称"""
+    if device is None or str(device) == 'auto':
+        try:
+            import torch
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        except ImportError:
+            device = 'cpu'
+    device = str(device)
+    if device == 'cuda':
+        device = 'cuda:0'
+    return device
+
+
+def _format_key(key):
+    return '/'.join(key)
+
+
+def _measure_model_size(model):
+    """按参数和缓冲区计算模型实际占用"""
+    try:
+        size = sum(p.numel() * p.element_size() for p in model.parameters())
+        size += sum(b.numel() * b.element_size() for b in model.buffers())
+        return size
+    except Exception:
+        return None
+
+
+def _load_whisper_model(model_name, device, precision, download_root=None):
+    """加载Whisper模型"""
+    import whisper
+
+    model = whisper.load_model(model_name, device=device, download_root=download_root)
+    if precision == 'float16' and device.startswith('cuda'):
+        model = model.half()
+    return model
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_model_pool():
+    """获取进程级共享模型池"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ModelPool()
+        return _default_pool
@@ -0,0 +1,528 @@
+"""
+转录进程池
+Whisper推理在独立的工作进程中运行，每个进程有自己的模型池和固定的PyTorch线程数，
+Web进程只负责收发消息，推理占满CPU时API和WebSocket心跳不受GIL影响。
+调用方独占一个工作进程直到转录结束，优先选择已加载同一模型的空闲进程。
+
+工作进程由 src.transcriber.process_pool.main 启动（不会像 multiprocessing 的 spawn
+那样重新导入Web应用的主模块），通过 multiprocessing.connection 的双向连接收发消息。
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import importlib
+import threading
+import subprocess
+from multiprocessing.connection import Listener, Client
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+# 等待工作进程消息的轮询间隔（秒），同时用于检查取消和进程存活
+POLL_INTERVAL = 0.5
+
+# 等待新启动的工作进程连接的时间（秒）
+CONNECT_TIMEOUT = 60
+
+AUTHKEY_ENV = 'BILI2TEXT_WORKER_AUTHKEY'
+
+
+class TranscriptionCancelled(Exception):
+    """转录在工作进程中被取消"""
+
+
+class _WorkerSlot:
+    """一个工作进程及其连接"""
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.models = []
+        self.model_stats = None
+        self.busy = False
+        self.busy_request = None
+        self.jobs = 0
+        self.last_used = 0.0
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+
+class TranscriptionProcessPool:
+    """转录工作进程池"""
+
+    def __init__(self, size=2, threads=0, memory_budget_gb=12, device=None, loader=None,
+                 cancel_grace=10):
+        """
+        初始化进程池，工作进程在首次使用时启动
+
+        Args:
+            size: 工作进程数量
+            threads: 每个进程的PyTorch线程数，0 表示按CPU核数平均分配
+            memory_budget_gb: 每个进程的模型常驻内存预算（GB），各进程可能各自加载同一个模型，不在进程间平分
+            device: 推理设备，默认自动检测
+            loader: 模型加载函数的导入路径（module:function），默认加载Whisper模型
+            cancel_grace: 取消后等待工作进程响应的时间（秒），超时则终止该进程
+        """
+        self.size = max(1, size)
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.size)
+        self.memory_budget_gb = memory_budget_gb
+        self.device = device
+        self.loader = loader
+        self.cancel_grace = cancel_grace
+        self._authkey = os.urandom(16)
+        self._slots = [_WorkerSlot(i) for i in range(self.size)]
+        self._condition = threading.Condition()
+        self._request_seq = 0
+        self._closed = False
+
+        self.started = 0
+        self.restarts = 0
+        self.affinity_hits = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def transcribe(self, model_name, audio, options=None, window_seconds=0, on_segments=None,
+                   is_cancelled=None):
+        """
+        在工作进程中转录
+
+        Args:
+            model_name: Whisper模型名称
+            audio: 音频描述 dict，mode 为 file（工作进程自行解码）、npy（内存映射加载解码缓存）
+                   或 stream（流式解码），path 为对应文件路径，duration 为可选的音频时长
+            options: Whisper转录参数
+            window_seconds: 分窗转录的窗口时长（秒），0 表示整段转录
+            on_segments: 分窗转录每个窗口完成后的回调，在调用方线程中执行
+            is_cancelled: 返回是否已取消的函数，取消后工作进程在下一个窗口前中止
+
+        Returns:
+            dict: 与 whisper.transcribe 相同结构的结果
+
+        Raises:
+            TranscriptionCancelled: 转录被取消
+        """
+        slot = self._acquire(model_name)
+        try:
+            return self._run(slot, {
+                'model_name': model_name,
+                'audio': audio,
+                'options': options or {},
+                'window_seconds': window_seconds
+            }, on_segments, is_cancelled)
+        finally:
+            self._release(slot)
+
+    def get_stats(self):
+        """获取进程池统计信息"""
+        with self._condition:
+            return {
+                'size': self.size,
+                'threads_per_process': self.threads,
+                'started': self.started,
+                'restarts': self.restarts,
+                'affinity_hits': self.affinity_hits,
+                'completed': self.completed,
+                'cancelled': self.cancelled,
+                'failed': self.failed,
+                'processes': [{
+                    'index': slot.index,
+                    'pid': slot.process.pid if slot.process else None,
+                    'alive': slot.alive,
+                    'busy': slot.busy,
+                    'models': list(slot.models),
+                    'jobs': slot.jobs,
+                    'model_pool': slot.model_stats
+                } for slot in self._slots]
+            }
+
+    def get_model_pool_stats(self):
+        """汇总各工作进程的模型池统计（与 ModelPool.get_stats 结构相同，模型列表附带进程序号）"""
+        with self._condition:
+            reports = [(slot.index, slot.model_stats) for slot in self._slots if slot.model_stats]
+
+        totals = {key: 0 for key in ('hits', 'misses', 'evictions', 'load_count', 'total_load_time', 'memory_used_bytes')}
+        load_times = {}
+        models = []
+        for index, stats in reports:
+            for key in totals:
+                totals[key] += stats.get(key, 0)
+            load_times.update(stats.get('load_times', {}))
+            models.extend(dict(model, process=index) for model in stats.get('models', []))
+
+        lookups = totals['hits'] + totals['misses']
+        average_load_time = totals['total_load_time'] / totals['load_count'] if totals['load_count'] else 0
+        return dict(
+            totals,
+            hit_rate=totals['hits'] / lookups if lookups else 0,
+            total_load_time=round(totals['total_load_time'], 3),
+            average_load_time=round(average_load_time, 3),
+            estimated_time_saved=round(totals['hits'] * average_load_time, 3),
+            load_times=load_times,
+            memory_budget_bytes=int(self.memory_budget_gb * 1024 ** 3) * self.size,
+            models=models
+        )
+
+    def shutdown(self, timeout=5):
+        """停止所有工作进程"""
+        with self._condition:
+            self._closed = True
+            slots = list(self._slots)
+            self._condition.notify_all()
+
+        for slot in slots:
+            if slot.alive and not slot.busy:
+                try:
+                    slot.conn.send(None)
+                except OSError:
+                    pass
+        deadline = time.time() + timeout
+        for slot in slots:
+            if slot.process is None:
+                continue
+            try:
+                slot.process.wait(max(0.1, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                pass
+            self._terminate(slot)
+
+    def _acquire(self, model_name):
+        """独占一个空闲进程：优先已加载该模型的进程，其次尚未加载模型的进程，最后最久未使用的进程"""
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError('转录进程池已关闭')
+                idle = [slot for slot in self._slots if not slot.busy]
+                if idle:
+                    break
+                self._condition.wait()
+
+            warm = [slot for slot in idle if model_name in slot.models and slot.alive]
+            if warm:
+                slot = warm[0]
+                self.affinity_hits += 1
+            else:
+                slot = min(idle, key=lambda s: (bool(s.models), s.last_used))
+            slot.busy = True
+
+        try:
+            if not slot.alive:
+                self._start(slot)
+        except Exception:
+            self._release(slot)
+            raise
+        return slot
+
+    def _release(self, slot):
+        with self._condition:
+            slot.busy = False
+            slot.last_used = time.time()
+            self._condition.notify()
+
+    def _start(self, slot):
+        """启动（或重启）工作进程并等待其连接"""
+        restarted = slot.process is not None
+        self._terminate(slot)
+
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = dict(os.environ, **{AUTHKEY_ENV: self._authkey.hex()})
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [project_root, env.get('PYTHONPATH')]))
+
+        with Listener(authkey=self._authkey) as listener:
+            cmd = [
+                sys.executable, '-c', 'from src.transcriber.process_pool import main; main()',
+                '--address', str(listener.address),
+                '--threads', str(self.threads),
+                '--memory-budget', str(self.memory_budget_gb)
+            ]
+            if self.device:
+                cmd += ['--device', self.device]
+            if self.loader:
+                cmd += ['--loader', self.loader]
+            slot.process = subprocess.Popen(cmd, cwd=project_root, env=env)
+
+            # accept 会一直阻塞，工作进程启动失败或超时时由监视线程自行连接以解除阻塞
+            connected = threading.Event()
+            failed = threading.Event()
+            watcher = threading.Thread(
+                target=self._watch_startup, args=(slot.process, listener.address, connected, failed),
+                daemon=True
+            )
+            watcher.start()
+            conn = listener.accept()
+            connected.set()
+
+        if failed.is_set():
+            conn.close()
+            self._terminate(slot)
+            raise RuntimeError(f'转录工作进程 #{slot.index} 启动失败')
+        slot.conn = conn
+
+        slot.models = []
+        slot.model_stats = None
+        with self._condition:
+            self.started += 1
+            if restarted:
+                self.restarts += 1
+        logger.info(f"转录工作进程已启动: #{slot.index} pid={slot.process.pid}, 线程数={self.threads}")
+
+    def _watch_startup(self, process, address, connected, failed):
+        deadline = time.time() + CONNECT_TIMEOUT
+        while not connected.wait(0.2):
+            if process.poll() is not None or time.time() > deadline:
+                failed.set()
+                try:
+                    Client(address, authkey=self._authkey).close()
+                except (OSError, EOFError):
+                    pass
+                return
+
+    def _terminate(self, slot):
+        if slot.conn is not None:
+            slot.conn.close()
+            slot.conn = None
+        if slot.process is not None and slot.process.poll() is None:
+            slot.process.terminate()
+            try:
+                slot.process.wait(5)
+            except subprocess.TimeoutExpired:
+                slot.process.kill()
+
+    def _run(self, slot, request, on_segments, is_cancelled):
+        """发送请求并在调用方线程中处理工作进程的消息，直到得到结果"""
+        with self._condition:
+            self._request_seq += 1
+            request_id = request['id'] = self._request_seq
+            slot.jobs += 1
+
+        slot.busy_request = request_id
+        try:
+            slot.conn.send(('transcribe', request))
+            return self._wait(slot, request_id, on_segments, is_cancelled)
+        except (OSError, EOFError) as e:
+            slot.busy_request = None
+            self._terminate(slot)
+            self._count('failed')
+            raise RuntimeError(f'转录工作进程异常退出: {e}')
+        except BaseException:
+            # 回调出错等情况下工作进程可能仍在处理该请求，终止进程以免影响下一个请求
+            if slot.busy_request == request_id:
+                self._terminate(slot)
+            raise
+        finally:
+            slot.busy_request = None
+
+    def _wait(self, slot, request_id, on_segments, is_cancelled):
+        """处理工作进程的消息直到得到结果，工作进程结束该请求时清除 busy_request"""
+        cancel_deadline = None
+
+        while True:
+            if cancel_deadline is None and is_cancelled and is_cancelled():
+                slot.conn.send(('cancel', request_id))
+                cancel_deadline = time.time() + self.cancel_grace
+            elif cancel_deadline is not None and time.time() > cancel_deadline:
+                # 工作进程卡在单个窗口内（例如整段解码），终止进程，下次使用时重启
+                logger.warning(f"转录工作进程 #{slot.index} 未响应取消，终止进程")
+                slot.busy_request = None
+                self._terminate(slot)
+                self._count('cancelled')
+                raise TranscriptionCancelled()
+
+            if not slot.conn.poll(POLL_INTERVAL):
+                if not slot.alive:
+                    raise EOFError(f'exitcode={slot.process.returncode}')
+                continue
+
+            message = slot.conn.recv()
+            kind, message_id, payload = message[:3]
+            if message_id != request_id:
+                continue
+
+            if kind == 'segments':
+                if on_segments and cancel_deadline is None:
+                    on_segments(*payload)
+                continue
+
+            slot.busy_request = None
+            slot.model_stats = message[3]
+            slot.models = [model['model_name'] for model in slot.model_stats['models']]
+            if kind == 'result':
+                self._count('completed')
+                return payload
+            if kind == 'cancelled':
+                self._count('cancelled')
+                raise TranscriptionCancelled()
+            self._count('failed')
+            raise RuntimeError(payload)
+
+    def _count(self, outcome):
+        with self._condition:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+
+class _WorkerConnection:
+    """工作进程一侧的连接：转录过程中收到的取消消息记录下来，由检查点回调抛出"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cancelled = set()
+        self.pending = []
+
+    def receive(self):
+        """取下一个请求，连接关闭或收到 None 时返回 None"""
+        while True:
+            if self.pending:
+                message = self.pending.pop(0)
+            else:
+                try:
+                    message = self.conn.recv()
+                except EOFError:
+                    return None
+            if message is None:
+                return None
+            if message[0] == 'cancel':
+                self.cancelled.add(message[1])
+                continue
+            return message[1]
+
+    def check_cancelled(self, request_id):
+        while self.conn.poll():
+            message = self.conn.recv()
+            if message is not None and message[0] == 'cancel':
+                self.cancelled.add(message[1])
+            else:
+                self.pending.append(message)
+        if request_id in self.cancelled:
+            raise TranscriptionCancelled()
+
+    def send(self, message):
+        self.conn.send(message)
+
+
+def _worker_main(address, threads, memory_budget_gb, device=None, loader=None):
+    """工作进程入口：连接进程池并依次处理转录请求"""
+    # 在导入 torch 之前限制 OpenMP/MKL 线程数
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[name] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    from src.transcriber.model_pool import ModelPool
+
+    if loader:
+        module_name, _, attr = loader.partition(':')
+        loader = getattr(importlib.import_module(module_name), attr)
+    model_pool = ModelPool(memory_budget_gb, loader=loader)
+
+    authkey = bytes.fromhex(os.environ.pop(AUTHKEY_ENV))
+    worker = _WorkerConnection(Client(address, authkey=authkey))
+
+    while True:
+        request = worker.receive()
+        if request is None:
+            break
+
+        request_id = request['id']
+        try:
+            result = _handle_request(model_pool, request, worker, device)
+            reply = ('result', request_id, result)
+        except TranscriptionCancelled:
+            reply = ('cancelled', request_id, None)
+        except Exception as e:
+            logger.error(f"工作进程转录失败: {e}")
+            reply = ('error', request_id, f'{type(e).__name__}: {e}')
+
+        worker.cancelled.discard(request_id)
+        worker.send(reply + (model_pool.get_stats(),))
+
+
+def _handle_request(model_pool, request, worker, device):
+    """在工作进程中执行一次转录"""
+    from src.transcriber.streaming import StreamingAudio
+    from src.transcriber.windowed import transcribe_windowed
+
+    request_id = request['id']
+    audio_spec = request['audio']
+    options = request['options']
+    window_seconds = request['window_seconds']
+    check_cancelled = lambda: worker.check_cancelled(request_id)
+
+    def on_segments(segments, decoded_seconds, total_seconds):
+        worker.send(('segments', request_id, (segments, decoded_seconds, total_seconds)))
+
+    with model_pool.lease(request['model_name'], device) as pooled_model:
+        check_cancelled()
+
+        if audio_spec['mode'] == 'stream':
+            with StreamingAudio(audio_spec['path'], duration=audio_spec.get('duration')) as stream:
+                result = transcribe_windowed(
+                    pooled_model, stream, window_seconds=window_seconds,
+                    on_segments=on_segments, before_window=check_cancelled, **options
+                )
+            # 取消导致的提前结束不能作为完整结果
+            check_cancelled()
+            return result
+
+        if audio_spec['mode'] == 'npy':
+            import numpy as np
+            audio = np.load(audio_spec['path'], mmap_mode='r')
+        else:
+            audio = _decode_audio(audio_spec['path'])
+        check_cancelled()
+
+        if window_seconds > 0:
+            return transcribe_windowed(
+                pooled_model, audio, window_seconds=window_seconds,
+                on_segments=on_segments, before_window=check_cancelled, **options
+            )
+        return pooled_model.transcribe(audio, before_window=check_cancelled, **options)
+
+
+def _decode_audio(path):
+    """使用ffmpeg整段解码为16kHz单声道波形"""
+    import numpy as np
+
+    cmd = [
+        'ffmpeg', '-nostdin', '-threads', '0', '-i', path,
+        '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(SAMPLE_RATE), '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise Exception(f"音频解码失败: {result.stderr.decode('utf-8', errors='ignore')}")
+    return np.frombuffer(result.stdout, np.int16).flatten().astype(np.float32) / 32768.0
+
+
+def _parse_address(value):
+    """Listener 地址：Unix套接字/命名管道路径，或 (host, port)"""
+    if value.startswith('('):
+        host, port = value.strip('()').split(',')
+        return host.strip().strip("'\""), int(port)
+    return value
+
+
+def main(argv=None):
+    """工作进程命令行入口"""
+    parser = argparse.ArgumentParser(description='Bili2Text 转录工作进程')
+    parser.add_argument('--address', required=True)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--memory-budget', type=float, default=12)
+    parser.add_argument('--device')
+    parser.add_argument('--loader')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    _worker_main(_parse_address(args.address), args.threads, args.memory_budget, args.device, args.loader)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+流式音频解码
+ffmpeg 将音频解码为16kHz单声道PCM后通过管道按需读取，只保留当前转录窗口所需的数据，
+每个任务的内存峰值与音频总时长无关（约为两个窗口的大小）
+"""
+
+import subprocess
+import logging
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class StreamingAudio:
+    """通过ffmpeg管道按窗口读取的音频"""
+
+    def __init__(self, source_path, duration=None, sample_rate=SAMPLE_RATE):
+        """
+        启动ffmpeg解码进程
+
+        Args:
+            source_path: 音频或视频文件路径
+            duration: 音频时长（秒），仅用于进度计算，未提供时使用ffprobe探测
+            sample_rate: 采样率
+        """
+        self.source_path = str(source_path)
+        self.sample_rate = sample_rate
+        self.duration = duration or probe_duration(self.source_path)
+
+        # 缓冲区保存从 _buffer_start 开始的PCM数据（int16字节）
+        self._buffer = bytearray()
+        self._buffer_start = 0
+        self._eof = False
+        self.peak_buffer_bytes = 0
+
+        cmd = [
+            'ffmpeg', '-nostdin', '-threads', '0',
+            '-i', self.source_path,
+            '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(sample_rate),
+            '-'
+        ]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        """已知的音频采样数；解码完成前为按时长估算的值"""
+        buffered_end = self._buffer_start + len(self._buffer) // BYTES_PER_SAMPLE
+        if self._eof:
+            return buffered_end
+        return max(buffered_end, int((self.duration or 0) * self.sample_rate))
+
+    def read(self, start, end):
+        """
+        读取 [start, end) 范围的采样，start 之前的数据随后被丢弃
+
+        Args:
+            start: 起始采样位置，不能早于上一次读取的起始位置
+            end: 结束采样位置
+
+        Returns:
+            numpy.ndarray: float32波形，到达音频末尾时可能短于请求长度
+        """
+        import numpy as np
+
+        if start < self._buffer_start:
+            raise ValueError(f'流式音频不能回退读取: {start} < {self._buffer_start}')
+
+        # 多读一个采样，用于判断 end 之后是否还有数据
+        self._fill(end + 1)
+        self._discard(start)
+
+        data = bytes(self._buffer[:(end - start) * BYTES_PER_SAMPLE])
+        return np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+
+    def has_data_after(self, position):
+        """position 之后是否还有采样"""
+        self._fill(position + 1)
+        return self._buffer_start + len(self._buffer) // BYTES_PER_SAMPLE > position
+
+    def close(self):
+        """终止ffmpeg并释放缓冲区"""
+        self._buffer = bytearray()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        if self.process.stdout:
+            self.process.stdout.close()
+
+    def _fill(self, end):
+        """从ffmpeg读取数据直到缓冲区覆盖到 end 或到达末尾"""
+        needed = (end - self._buffer_start) * BYTES_PER_SAMPLE
+        while not self._eof and len(self._buffer) < needed:
+            block = self.process.stdout.read(min(READ_BLOCK_SIZE, needed - len(self._buffer)))
+            if not block:
+                self._eof = True
+                if self.process.wait() != 0:
+                    raise Exception(f"音频解码失败: ffmpeg 退出码 {self.process.returncode}")
+                break
+            self._buffer.extend(block)
+        self.peak_buffer_bytes = max(self.peak_buffer_bytes, len(self._buffer))
+
+    def _discard(self, start):
+        """丢弃 start 之前的数据"""
+        drop = (start - self._buffer_start) * BYTES_PER_SAMPLE
+        if drop > 0:
+            del self._buffer[:drop]
+            self._buffer_start = start
+
+
+def probe_duration(source_path):
+    """使用ffprobe获取音频时长（秒），失败时返回 None"""
+    cmd = [
+        'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1', str(source_path)
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        return float(result.stdout.strip())
+    except (OSError, subprocess.SubprocessError, ValueError):
+        logger.warning(f"无法获取音频时长: {source_path}")
+        return None
@@ -0,0 +1,113 @@
+"""
+分窗转录
+将长音频按固定时长的窗口依次转录，每个窗口完成后即可获得片段和进度，
+窗口末尾可能被截断的片段会在下一个窗口中重新转录。
+音频可以是完整的波形，也可以是流式解码的 StreamingAudio（只按顺序向前读取）
+"""
+
+import logging
+
+from src.transcriber.streaming import StreamingAudio
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+# 下一窗口 initial_prompt 的最大长度（字符）：调用方的提示词加上前文末尾
+PROMPT_CONTEXT_CHARS = 200
+
+
+def transcribe_windowed(pooled_model, audio, window_seconds=180, on_segments=None,
+                        before_window=None, **options):
+    """
+    分窗转录
+
+    Args:
+        pooled_model: 模型池中的模型（PooledModel）
+        audio: 16kHz单声道波形（numpy数组），或按窗口读取的 StreamingAudio
+        window_seconds: 窗口时长（秒）
+        on_segments: 每个窗口完成后的回调 on_segments(segments, decoded_seconds, total_seconds)，
+                     segments 为本窗口新确定的片段，时间已换算为整段音频上的时间
+        before_window: 传给 PooledModel.transcribe 的检查点回调
+        **options: Whisper转录参数
+
+    Returns:
+        dict: 与 whisper.transcribe 相同结构的结果（text、segments、language）
+    """
+    if isinstance(audio, StreamingAudio):
+        read, has_data_after = audio.read, audio.has_data_after
+    else:
+        read = lambda start, end: audio[start:end]
+        has_data_after = lambda position: len(audio) > position
+
+    # 调用方的提示词（如简体中文标点提示）在每个窗口都保留，前文接在其后
+    base_prompt = options.pop('initial_prompt', None) or ''
+    prompt = base_prompt or None
+    language = options.pop('language', None)
+    segments = []
+    offset = 0.0
+
+    while True:
+        window_start = int(offset * SAMPLE_RATE)
+        window_end = window_start + int(window_seconds * SAMPLE_RATE)
+        chunk = read(window_start, window_end)
+        if len(chunk) == 0:
+            break
+        end = offset + len(chunk) / SAMPLE_RATE
+        is_last = not has_data_after(window_end)
+
+        result = pooled_model.transcribe(
+            chunk, before_window=before_window, initial_prompt=prompt, language=language, **options
+        )
+        # 第一个窗口检测出的语言用于后续窗口，避免每个窗口重新检测
+        language = language or result.get('language')
+
+        window_segments = [_shift_segment(segment, offset) for segment in result.get('segments', [])]
+        next_offset = end
+        if not is_last and len(window_segments) > 1:
+            # 最后一个片段可能被窗口边界截断，丢弃后从它的起点开始下一个窗口
+            next_offset = window_segments.pop()['start']
+        if next_offset <= offset:
+            next_offset = end
+
+        for segment in window_segments:
+            segment['id'] = len(segments)
+            segments.append(segment)
+
+        if window_segments:
+            prompt = _window_prompt(base_prompt, ''.join(segment['text'] for segment in segments))
+        if on_segments:
+            # 流式音频的总时长在解码完成前为估算值
+            on_segments(window_segments, next_offset, max(len(audio) / SAMPLE_RATE, next_offset))
+
+        if is_last:
+            break
+        offset = next_offset
+
+    return {
+        'text': ''.join(segment['text'] for segment in segments),
+        'segments': segments,
+        'language': language
+    }
+
+
+def _window_prompt(base_prompt, text):
+    """调用方的提示词加上已转录文本的末尾，总长度不超过 PROMPT_CONTEXT_CHARS"""
+    budget = PROMPT_CONTEXT_CHARS - len(base_prompt)
+    context = text[-budget:] if budget > 0 else ''
+    return (base_prompt + context) or None
+
+
+def _shift_segment(segment, offset):
+    """将窗口内的片段时间换算为整段音频上的时间"""
+    segment = dict(segment)
+    segment['start'] = round(segment['start'] + offset, 3)
+    segment['end'] = round(segment['end'] + offset, 3)
+    if 'seek' in segment:
+        segment['seek'] += int(offset * 100)
+    if segment.get('words'):
+        segment['words'] = [
+            dict(word, start=round(word['start'] + offset, 3), end=round(word['end'] + offset, 3))
+            for word in segment['words']
+        ]
+    return segment
@@ -2,20 +2,26 @@
 API路由定义
 """
 
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, Response, request, jsonify, send_file, current_app, stream_with_context
 from datetime import datetime, timedelta
+from urllib.parse import quote
+import unicodedata
 import os
 import re
 
 from webapp.core.database import (
-    db, Task, SystemStatus, TaskStatistics,
+    db, Task, SystemStatus,
     get_task_by_id, get_tasks_by_status, get_recent_tasks,
-    get_task_statistics, update_task_statistics
+    record_task_created, get_rollup_statistics, get_stage_timing_summary,
+    get_transcript_segments, delete_transcript_segments, get_tasks_after, count_tasks
 )
+from webapp.core.transcript import TRANSCRIPT_FORMATS, render_transcript
+from webapp.core.task_cache import task_cache
+from webapp.core.search_index import is_search_available, search
 from webapp.core.error_handler import (
     BusinessException, ValidationException, NotFoundException, SystemOverloadException,
     ErrorCode, handle_database_error, handle_file_operation_error,
-    validate_request_data, rate_limit_error_handler
+    validate_request_data, rate_limit_error_handler, require_admin, require_worker
 )
 
 api_bp = Blueprint('api', __name__)
@@ -77,19 +83,41 @@ def create_task():
             }
         )
     
-    # 检查系统负载
-    active_tasks = Task.query.filter(
-        Task.status.in_(['pending', 'downloading', 'transcribing'])
-    ).count()
-    
-    if active_tasks >= current_app.config['MAX_CONCURRENT_TASKS']:
+    # 检查排队积压（内存计数）：超过并发数的任务进入调度队列排队，队列满时才拒绝
+    backlog = current_app.task_manager.get_backlog_size()
+    max_backlog = current_app.config['MAX_TASK_BACKLOG']
+    if backlog >= max_backlog:
         raise SystemOverloadException(
-            f'当前有{active_tasks}个任务正在处理，已达到最大并发数{current_app.config["MAX_CONCURRENT_TASKS"]}'
+            f'当前有{backlog}个任务正在排队，已达到排队上限{max_backlog}',
+            {'backlog': backlog, 'max_backlog': max_backlog}
         )
     
-    # 创建任务
+    # 验证调度优先级
     options = data.get('options', {})
-    task = Task(url=url, model_name=model_name)
+    if 'priority' in options:
+        if not isinstance(options['priority'], int) or isinstance(options['priority'], bool):
+            raise ValidationException('任务优先级必须为整数', field='priority')
+    
+    # 验证阶段超时覆盖
+    if 'timeouts' in options:
+        timeouts = options['timeouts']
+        valid_stages = ['download', 'decode', 'transcribe', 'write', 'total']
+        if not isinstance(timeouts, dict):
+            raise ValidationException('阶段超时必须为对象', field='timeouts')
+        for stage, seconds in timeouts.items():
+            if stage not in valid_stages:
+                raise ValidationException(f'无效的任务阶段: {stage}', details={
+                    'field': 'timeouts',
+                    'valid_stages': valid_stages
+                })
+            if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or seconds <= 0:
+                raise ValidationException(f'阶段超时必须为正数: {stage}', field='timeouts')
+    
+    # 提交方地址用于调度器的公平份额计算，不接受客户端自报的 X-Forwarded-For（经可信代理时由 ProxyFix 解析）
+    options.pop('client_id', None)
+    
+    # 创建任务
+    task = Task(url=url, model_name=model_name, client_id=request.remote_addr)
     task.set_options(options)
     
     db.session.add(task)
@@ -99,9 +127,7 @@ def create_task():
     current_app.task_manager.submit_task(task)
     
     # 更新统计
-    stats = get_task_statistics()
-    stats.tasks_created += 1
-    db.session.commit()
+    record_task_created(task)
     
     current_app.logger.info(f'任务创建成功: {task.task_id}', extra={
         'task_id': task.task_id,
@@ -109,12 +135,19 @@ def create_task():
         'model': model_name
     })
     
-    return success_response(task.to_dict(), '任务创建成功')
+    data = task.to_dict()
+    data.update(current_app.task_manager.get_queue_estimate(task.task_id) or {})
+    return success_response(data, '任务创建成功')
 
 @api_bp.route('/tasks/', methods=['GET'])
 @handle_database_error
 def get_tasks():
-    """获取任务列表"""
+    """
+    获取任务列表
+
+    带 cursor 参数（第一页为空值）时按 (created_at, id) 游标分页，total=approx|exact 时附带总数；
+    否则为兼容的页码分页（精确计数 + 偏移）。
+    """
     # 获取和验证查询参数
     try:
         page = max(1, int(request.args.get('page', 1)))
@@ -122,6 +155,13 @@ def get_tasks():
     except ValueError:
         raise ValidationException('页码和限制数必须为正整数')
     
+    total_mode = request.args.get('total', '')
+    if total_mode not in ('', 'approx', 'exact'):
+        raise ValidationException(f'无效的总数模式: {total_mode}', details={
+            'field': 'total',
+            'valid_modes': ['approx', 'exact']
+        })
+    
     status = request.args.get('status', '')
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
@@ -166,8 +206,25 @@ def get_tasks():
             )
         )
     
+    # 游标分页：沿 (created_at, id) 索引定位，不扫描前面的页，默认不计数
+    if 'cursor' in request.args:
+        try:
+            tasks, next_cursor = get_tasks_after(query, request.args['cursor'], limit)
+        except ValueError as e:
+            raise ValidationException(str(e), field='cursor')
+        
+        data = {
+            'tasks': [task.to_dict() for task in tasks],
+            'limit': limit,
+            'next_cursor': next_cursor
+        }
+        if total_mode:
+            cap = current_app.config['TASK_LIST_APPROX_COUNT_CAP'] if total_mode == 'approx' else None
+            data['total'], data['total_exact'] = count_tasks(query, cap)
+        return success_response(data)
+    
     # 排序和分页
-    query = query.order_by(Task.created_at.desc())
+    query = query.order_by(Task.created_at.desc(), Task.id.desc())
     total = query.count()
     tasks = query.offset((page - 1) * limit).limit(limit).all()
     
@@ -182,12 +239,72 @@ def get_tasks():
 @api_bp.route('/tasks/<task_id>', methods=['GET'])
 @handle_database_error
 def get_task(task_id):
-    """获取任务详情"""
+    """获取任务详情（优先读取任务状态缓存）"""
+    data = task_cache.load(task_id)
+    if not data:
+        raise NotFoundException('任务', task_id)
+    
+    if data['status'] == 'pending':
+        data.update(current_app.task_manager.get_queue_estimate(task_id) or {})
+    return success_response(data)
+
+@api_bp.route('/tasks/<task_id>/segments', methods=['GET'])
+@handle_database_error
+def get_task_segments(task_id):
+    """按时间范围获取转录片段，只返回请求的窗口"""
     task = get_task_by_id(task_id)
     if not task:
         raise NotFoundException('任务', task_id)
     
-    return success_response(task.to_dict())
+    try:
+        start = float(request.args['from']) if request.args.get('from') else None
+        end = float(request.args['to']) if request.args.get('to') else None
+        limit = min(max(1, int(request.args.get('limit', 200))), 1000)
+    except ValueError:
+        raise ValidationException('from 和 to 必须为秒数，limit 必须为正整数')
+    if start is not None and end is not None and end <= start:
+        raise ValidationException('结束时间必须晚于开始时间', field='to')
+    
+    if task.segment_count is None:
+        raise BusinessException(
+            ErrorCode.FILE_NOT_FOUND,
+            '转录片段尚未生成',
+            {'task_status': task.status}
+        )
+    
+    segments = get_transcript_segments(task_id, start=start, end=end, limit=limit)
+    return success_response({
+        'task_id': task_id,
+        'segment_count': task.segment_count,
+        'segments': [segment.to_dict() for segment in segments],
+        # 达到数量上限时，从最后一个片段的结束时间继续请求下一页
+        'next_from': segments[-1].end if len(segments) == limit else None
+    })
+
+@api_bp.route('/search', methods=['GET'])
+@handle_database_error
+def search_transcripts():
+    """全文检索已完成任务的标题、UP主和转录内容，返回按相关度排序的任务及命中片段"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        raise ValidationException('检索词不能为空', field='q')
+    
+    try:
+        limit = min(max(1, int(request.args.get('limit', 20))), 100)
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        raise ValidationException('limit 和 offset 必须为整数')
+    
+    if not is_search_available():
+        raise BusinessException(
+            ErrorCode.SERVICE_UNAVAILABLE,
+            '全文检索不可用，需要支持FTS5的SQLite数据库',
+            status_code=503
+        )
+    
+    result = search(query, limit=limit, offset=offset)
+    result.update({'query': query, 'limit': limit, 'offset': offset})
+    return success_response(result)
 
 @api_bp.route('/tasks/<task_id>/cancel', methods=['POST'])
 @handle_database_error
@@ -233,6 +350,7 @@ def delete_task(task_id):
     deleted_files = current_app.file_manager.delete_task_files(task_id)
     
     # 删除数据库记录
+    delete_transcript_segments(task_id)
     db.session.delete(task)
     db.session.commit()
     
@@ -244,28 +362,64 @@ def delete_task(task_id):
         'deleted_files': deleted_files
     }, '任务删除成功')
 
+def _set_attachment(response, download_name):
+    """设置下载文件名，非ASCII文件名按 RFC 5987 编码（与 send_file 一致）"""
+    try:
+        download_name.encode('ascii')
+        names = {'filename': download_name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+^`|~')}"}
+    response.headers.set('Content-Disposition', 'attachment', **names)
+
 # 文件操作API
 @api_bp.route('/files/<task_id>/result', methods=['GET'])
 @handle_file_operation_error
 def download_result(task_id):
-    """下载转录结果"""
-    task = get_task_by_id(task_id)
+    """下载转录结果，format 参数指定输出格式（默认为任务选项中的格式），结果从转录片段按需渲染"""
+    task = task_cache.load(task_id)
     if not task:
         raise NotFoundException('任务', task_id)
     
-    if not task.result_file_path:
+    output_format = request.args.get('format') or task['options'].get('output_format', 'txt')
+    if output_format not in TRANSCRIPT_FORMATS:
+        raise ValidationException(f'不支持的输出格式: {output_format}', details={
+            'field': 'format',
+            'supported_formats': list(TRANSCRIPT_FORMATS)
+        })
+    
+    if task['segment_count'] is not None:
+        response = Response(
+            stream_with_context(render_transcript(task, output_format)),
+            content_type=f'{TRANSCRIPT_FORMATS[output_format]}; charset=utf-8'
+        )
+        _set_attachment(response, f"{task['title'] or task['task_id']}_transcript.{output_format}")
+        return response
+    
+    # 旧版任务的结果保存在结果文件中
+    if not task['result_file_path']:
+        # 转录进行中时返回已完成片段组成的部分结果
+        partial_path = current_app.task_manager.get_partial_result_path(task_id)
+        if partial_path:
+            return send_file(
+                partial_path,
+                as_attachment=True,
+                download_name=f"{task['title'] or task['task_id']}_transcript_partial.txt",
+                mimetype='text/plain'
+            )
+        
         raise BusinessException(
             ErrorCode.FILE_NOT_FOUND,
             '转录结果尚未生成',
-            {'task_status': task.status}
+            {'task_status': task['status']}
         )
     
-    if not os.path.exists(task.result_file_path):
+    if not os.path.exists(task['result_file_path']):
         raise NotFoundException('结果文件')
     
-    filename = f"{task.title or task.task_id}_transcript.txt"
+    filename = f"{task['title'] or task['task_id']}_transcript.txt"
     return send_file(
-        task.result_file_path,
+        task['result_file_path'],
         as_attachment=True,
         download_name=filename,
         mimetype='text/plain'
@@ -308,7 +462,9 @@ def delete_files(task_id):
     
     deleted_files = current_app.file_manager.delete_task_files(task_id)
     
-    # 更新数据库记录
+    # 更新数据库记录（转录片段即转录结果，一并删除）
+    delete_transcript_segments(task_id)
+    task.segment_count = None
     task.result_file_path = None
     task.audio_file_path = None
     db.session.commit()
@@ -333,6 +489,125 @@ def get_system_status():
             500
         )
 
+@api_bp.route('/system/history', methods=['GET'])
+@handle_database_error
+def get_system_history():
+    """获取系统性能历史，按时间范围返回原始采样、分钟汇总或小时汇总"""
+    try:
+        hours = float(request.args.get('hours', 1))
+    except ValueError:
+        raise ValidationException('hours 必须为数字', field='hours')
+    if hours <= 0:
+        raise ValidationException('hours 必须大于0', field='hours')
+    hours = min(hours, current_app.config['SYSTEM_METRICS_HOUR_RETENTION_DAYS'] * 24)
+    
+    return success_response(current_app.system_monitor.get_performance_history(hours))
+
+@api_bp.route('/system/concurrency', methods=['GET'])
+def get_concurrency():
+    """获取并发度配置"""
+    return success_response(current_app.task_manager.get_concurrency_status())
+
+@api_bp.route('/system/concurrency', methods=['PUT'])
+@require_admin
+@validate_request_data(optional_fields={'max_concurrent_tasks': int, 'stage_workers': dict})
+def update_concurrency():
+    """运行时调整并发度（管理接口）"""
+    data = request.get_json()
+    
+    max_concurrent_tasks = data.get('max_concurrent_tasks')
+    if max_concurrent_tasks is not None and (isinstance(max_concurrent_tasks, bool) or max_concurrent_tasks < 1):
+        raise ValidationException('最大并发任务数必须为正整数', field='max_concurrent_tasks')
+    
+    stage_workers = data.get('stage_workers') or {}
+    valid_stages = [stage.name for stage in current_app.task_manager.pipeline.stages]
+    for stage, workers in stage_workers.items():
+        if stage not in valid_stages:
+            raise ValidationException(f'无效的任务阶段: {stage}', details={
+                'field': 'stage_workers',
+                'valid_stages': valid_stages
+            })
+        if isinstance(workers, bool) or not isinstance(workers, int) or workers < 1:
+            raise ValidationException(f'工作线程数必须为正整数: {stage}', field='stage_workers')
+    
+    status = current_app.task_manager.set_concurrency(max_concurrent_tasks, stage_workers)
+    if max_concurrent_tasks is not None:
+        current_app.config['MAX_CONCURRENT_TASKS'] = max_concurrent_tasks
+    
+    return success_response(status, '并发度已更新')
+
+# ---- 远程工作节点接口 ----
+
+@api_bp.route('/workers/lease', methods=['POST'])
+@require_worker
+@validate_request_data(required_fields=['worker_id'], optional_fields={'models': list, 'info': dict})
+def lease_worker_task():
+    """工作节点领取任务，没有可领取的任务时 data.task 为 null"""
+    data = request.get_json()
+    task = current_app.task_manager.lease_remote_task(data['worker_id'], data.get('models'), data.get('info'))
+    return success_response({'task': task}, '已分配任务' if task else '暂无任务')
+
+@api_bp.route('/workers/tasks/<task_id>/progress', methods=['POST'])
+@require_worker
+@validate_request_data(required_fields=['worker_id'], optional_fields={'segments': list, 'stage': str})
+def report_worker_progress(task_id):
+    """工作节点上报进度并续约，data.cancelled 为 true 时工作节点应停止处理"""
+    data = request.get_json()
+    
+    status = data.get('status')
+    if status is not None and status not in ('downloading', 'transcribing'):
+        raise ValidationException(f'无效的任务状态: {status}', field='status')
+    for field in ('progress', 'decoded_seconds', 'total_seconds'):
+        value = data.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ValidationException(f'字段 {field} 必须为数字', field=field)
+    
+    result = current_app.task_manager.report_remote_progress(
+        data['worker_id'], task_id,
+        status=status,
+        progress=data.get('progress'),
+        stage=data.get('stage'),
+        segments=data.get('segments'),
+        decoded_seconds=data.get('decoded_seconds'),
+        total_seconds=data.get('total_seconds')
+    )
+    return success_response(result)
+
+@api_bp.route('/workers/tasks/<task_id>/complete', methods=['POST'])
+@require_worker
+@validate_request_data(required_fields=['worker_id', 'result'],
+                       optional_fields={'result': dict, 'video_info': dict, 'audio_sha256': str,
+                                        'timings': dict})
+def complete_worker_task(task_id):
+    """工作节点上传转录结果"""
+    data = request.get_json()
+    result = data['result']
+    if not isinstance(result.get('text'), str) or not isinstance(result.get('segments', []), list):
+        raise ValidationException('转录结果必须包含 text 和 segments', field='result')
+    
+    current_app.task_manager.complete_remote_task(
+        data['worker_id'], task_id, result,
+        video_info=data.get('video_info'),
+        audio_sha256=data.get('audio_sha256'),
+        timings=data.get('timings')
+    )
+    return success_response(message='结果已接收')
+
+@api_bp.route('/workers/tasks/<task_id>/fail', methods=['POST'])
+@require_worker
+@validate_request_data(required_fields=['worker_id'], optional_fields={'error': str})
+def fail_worker_task(task_id):
+    """工作节点上报任务失败"""
+    data = request.get_json()
+    current_app.task_manager.fail_remote_task(data['worker_id'], task_id, data.get('error') or '未知错误')
+    return success_response(message='已记录失败')
+
+@api_bp.route('/workers', methods=['GET'])
+@require_admin
+def get_workers():
+    """获取远程工作节点和租约状态（管理接口）"""
+    return success_response(current_app.task_manager.get_worker_status())
+
 @api_bp.route('/system/models', methods=['GET'])
 def get_models():
     """获取可用模型"""
@@ -345,59 +620,40 @@ def get_models():
 @api_bp.route('/system/stats', methods=['GET'])
 @handle_database_error
 def get_stats():
-    """获取统计信息"""
+    """获取统计信息，各周期的统计从按小时、天、月累加的汇总表读取"""
     period = request.args.get('period', 'day')
     
-    if period not in ['day', 'week', 'month']:
+    valid_periods = ['hour', 'day', 'week', 'month']
+    if period not in valid_periods:
         raise ValidationException('无效的统计周期', details={
             'provided_period': period,
-            'valid_periods': ['day', 'week', 'month']
+            'valid_periods': valid_periods
         })
     
-    if period == 'day':
-        stats = get_task_statistics()
-        return success_response({
-            'period': period,
-            'date': stats.date.isoformat(),
-            'stats': stats.to_dict()
-        })
+    now = datetime.utcnow()
+    today = datetime.combine(now.date(), datetime.min.time())
+    if period == 'hour':
+        granularity, start = 'hour', now.replace(minute=0, second=0, microsecond=0)
+        end = start + timedelta(hours=1)
+        period_info = {'hour': start.isoformat()}
+    elif period == 'day':
+        granularity, start, end = 'day', today, today + timedelta(days=1)
+        period_info = {'date': today.date().isoformat()}
     elif period == 'week':
-        # 获取本周统计
-        today = datetime.utcnow().date()
-        week_start = today - timedelta(days=today.weekday())
-        
-        week_stats = TaskStatistics.query.filter(
-            TaskStatistics.date >= week_start,
-            TaskStatistics.date <= today
-        ).all()
-        
-        # 汇总统计
-        total_stats = {
-            'tasks_created': sum(s.tasks_created for s in week_stats),
-            'tasks_completed': sum(s.tasks_completed for s in week_stats),
-            'tasks_failed': sum(s.tasks_failed for s in week_stats),
-            'total_processing_time': sum(s.total_processing_time for s in week_stats),
-            'total_audio_duration': sum(s.total_audio_duration for s in week_stats),
-            'total_file_size': sum(s.total_file_size for s in week_stats),
-            'model_usage': {}
-        }
-        
-        # 合并模型使用统计
-        for stats in week_stats:
-            model_usage = stats.get_model_usage()
-            for model, count in model_usage.items():
-                total_stats['model_usage'][model] = total_stats['model_usage'].get(model, 0) + count
-        
-        total_stats['average_processing_speed'] = (
-            total_stats['total_audio_duration'] / total_stats['total_processing_time']
-            if total_stats['total_processing_time'] > 0 else 0
-        )
-        
-        return success_response({
-            'period': period,
-            'date_range': f"{week_start.isoformat()} - {today.isoformat()}",
-            'stats': total_stats
-        })
+        # 本周的天汇总（最多7行）
+        granularity, start, end = 'day', today - timedelta(days=today.weekday()), today + timedelta(days=1)
+        period_info = {'date_range': f"{start.date().isoformat()} - {today.date().isoformat()}"}
+    else:
+        granularity, start = 'month', today.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+        period_info = {'month': start.strftime('%Y-%m')}
+    
+    return success_response({
+        'period': period,
+        **period_info,
+        'stats': get_rollup_statistics(granularity, start, end),
+        'stage_timings': get_stage_timing_summary(granularity, start, end)
+    })
 
 # 错误日志API
 @api_bp.route('/logs/error', methods=['POST'])
@@ -87,15 +87,15 @@ def register_websocket_handlers(socketio):
         """获取任务状态"""
         task_id = data.get('task_id')
         if task_id:
-            from webapp.core.database import get_task_by_id
-            task = get_task_by_id(task_id)
+            from webapp.core.task_cache import task_cache
+            task = task_cache.load(task_id)
             if task:
                 emit('task_status', {
                     'type': 'task_status',
                     'task_id': task_id,
-                    'status': task.status,
-                    'progress': task.progress,
-                    'current_stage': task.current_stage,
+                    'status': task['status'],
+                    'progress': task['progress'],
+                    'current_stage': task['current_stage'],
                     'timestamp': datetime.utcnow().isoformat()
                 })
             else:
@@ -137,6 +137,24 @@ def broadcast_task_update(socketio, task_id, status, progress=None, stage=None,
     logger.info(f'广播任务更新: {task_id} - {status}')
     socketio.emit('task_update', data, room=room)
 
+def broadcast_task_segments(socketio, task_id, segments, progress=None):
+    """推送新转录完成的片段"""
+    room = f'task_{task_id}'
+    data = {
+        'type': 'task_segments',
+        'task_id': task_id,
+        'segments': [
+            {'id': s.get('id'), 'start': s['start'], 'end': s['end'], 'text': s['text']}
+            for s in segments
+        ],
+        'timestamp': datetime.utcnow().isoformat()
+    }
+    
+    if progress is not None:
+        data['progress'] = progress
+    
+    socketio.emit('task_segments', data, room=room)
+
 def broadcast_system_update(socketio, system_data):
     """广播系统状态更新"""
     room = 'system_monitor'
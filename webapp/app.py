@@ -8,6 +8,7 @@ import sys
 from flask import Flask, render_template, request, jsonify, send_file
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
 from datetime import datetime
 import json
@@ -17,6 +18,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from webapp.core.config import Config
 from webapp.core.database import db, init_db
+from webapp.core.search_index import init_search_index
 from webapp.core.task_manager import TaskManager
 from webapp.core.file_manager import FileManager
 from webapp.core.system_monitor import SystemMonitor
@@ -33,6 +35,10 @@ def create_app(config_class=Config):
     # 加载配置
     app.config.from_object(config_class)
     
+    # 只信任配置层数的反向代理转发的客户端地址
+    if app.config['TRUSTED_PROXY_COUNT'] > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_COUNT'])
+    
     # 初始化扩展
     db.init_app(app)
     CORS(app)
@@ -53,11 +59,17 @@ def create_app(config_class=Config):
     # 初始化数据库
     with app.app_context():
         init_db()
+        init_search_index()
     
     # 初始化核心组件
-    app.task_manager = TaskManager()
+    app.task_manager = TaskManager(app)
+    app.task_manager.model_pool.set_memory_budget(app.config['WHISPER_MODEL_POOL_BUDGET_GB'])
     app.file_manager = FileManager()
-    app.system_monitor = SystemMonitor()
+    app.system_monitor = SystemMonitor(
+        history_limit=app.config['PERFORMANCE_HISTORY_LIMIT'],
+        minute_retention_hours=app.config['SYSTEM_METRICS_MINUTE_RETENTION_HOURS'],
+        hour_retention_days=app.config['SYSTEM_METRICS_HOUR_RETENTION_DAYS']
+    )
     
     # 配置日志
     setup_logging(app)
@@ -68,6 +80,12 @@ def create_app(config_class=Config):
     # 存储socketio实例供其他模块使用
     app.socketio = socketio
     
+    # 路由注册完成后再启动进程内替身工作节点
+    app.task_manager.start_local_workers()
+    
+    # 启动系统监控（采样写入性能历史并广播）
+    app.system_monitor.start_monitoring(app.config['SYSTEM_MONITOR_INTERVAL'], app=app)
+    
     return app
 
 def setup_logging(app):
@@ -160,13 +178,32 @@ def register_routes(app):
             }
         }), 500
 
-# 创建应用实例
-app = create_app()
-socketio = app.socketio
+_app = None
+
+def get_app():
+    """
+    获取进程内唯一的应用实例，首次调用时创建
+
+    create_app 会启动任务流水线、租约和监控线程，同一进程创建多个实例会互相争抢任务，
+    因此导入本模块时不创建应用，run.py 和 WSGI 服务器（webapp.app:app）都使用这个实例。
+    """
+    global _app
+    if _app is None:
+        _app = create_app()
+    return _app
+
+def __getattr__(name):
+    """按需创建模块级的 app 和 socketio"""
+    if name == 'app':
+        return get_app()
+    if name == 'socketio':
+        return get_app().socketio
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
     # 开发模式运行
-    socketio.run(app, 
+    app = get_app()
+    app.socketio.run(app, 
                 host='0.0.0.0', 
                 port=8000, 
                 debug=True,
@@ -0,0 +1,103 @@
+"""
+任务取消
+协作式取消令牌：处理流程在安全点检查令牌，登记的子进程在取消时立即终止
+"""
+
+import subprocess
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class TaskCancelledException(Exception):
+    """任务已被取消"""
+
+    def __init__(self, reason=None):
+        self.reason = reason or 'cancelled'
+        super().__init__(f'任务已取消: {self.reason}')
+
+
+class CancellationToken:
+    """取消令牌"""
+
+    def __init__(self):
+        self.reason = None
+        self._event = threading.Event()
+        self._processes = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason='cancelled'):
+        """取消并终止所有登记的子进程，重复调用只保留第一次的原因"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            processes = list(self._processes)
+
+        for process in processes:
+            _kill(process)
+
+    def raise_if_cancelled(self):
+        """已取消时抛出 TaskCancelledException"""
+        if self._event.is_set():
+            raise TaskCancelledException(self.reason)
+
+    def wait(self, timeout):
+        """等待至多 timeout 秒，期间被取消时返回 True"""
+        return self._event.wait(timeout)
+
+    @contextmanager
+    def track(self, process):
+        """在上下文期间登记已启动的子进程，取消时终止"""
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self._event.is_set()
+        if cancelled:
+            _kill(process)
+        try:
+            yield process
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+
+    def run_process(self, cmd, timeout=None, text=True):
+        """
+        运行子进程，取消时立即终止
+
+        Args:
+            cmd: 命令参数列表
+            timeout: 超时时间（秒），超时后终止进程并抛出 subprocess.TimeoutExpired
+            text: 是否以文本方式读取输出
+
+        Returns:
+            subprocess.CompletedProcess
+        """
+        self.raise_if_cancelled()
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=text)
+        with self.track(process):
+            try:
+                stdout, stderr = process.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                _kill(process)
+                process.communicate()
+                raise
+
+        self.raise_if_cancelled()
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+def _kill(process):
+    """终止子进程"""
+    if process.poll() is not None:
+        return
+    try:
+        process.kill()
+    except OSError as e:
+        logger.warning(f"终止子进程失败 {process.pid}: {e}")
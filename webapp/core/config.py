@@ -11,6 +11,18 @@ class Config:
     # Flask基础配置
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'bili2text-web-secret-key-2024'
     
+    # 管理接口令牌，未配置时管理接口禁用；ALLOW_LOCAL_ADMIN 开启时允许本机无令牌访问
+    # （反向代理部署在同一主机时所有请求都来自本机，不要开启）
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+    ALLOW_LOCAL_ADMIN = os.environ.get('ALLOW_LOCAL_ADMIN', 'false').lower() == 'true'
+    
+    # 远程工作节点令牌，未配置时只接受进程内替身工作节点；ALLOW_LOCAL_WORKERS 开启时允许本机工作节点无令牌接入
+    WORKER_TOKEN = os.environ.get('WORKER_TOKEN')
+    ALLOW_LOCAL_WORKERS = os.environ.get('ALLOW_LOCAL_WORKERS', 'false').lower() == 'true'
+    
+    # 部署在反向代理之后时可信的代理层数，按 X-Forwarded-For 解析客户端地址；0 表示直接使用连接地址
+    TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+    
     # 数据库配置
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'bili2text.db')
@@ -21,9 +33,10 @@ class Config:
     AUDIO_STORAGE_PATH = os.path.join(STORAGE_ROOT, 'audio')
     RESULT_STORAGE_PATH = os.path.join(STORAGE_ROOT, 'results')
     TEMP_STORAGE_PATH = os.path.join(STORAGE_ROOT, 'temp')
+    CACHE_STORAGE_PATH = os.path.join(STORAGE_ROOT, 'cache')
     
     # 确保存储目录存在
-    for path in [AUDIO_STORAGE_PATH, RESULT_STORAGE_PATH, TEMP_STORAGE_PATH]:
+    for path in [AUDIO_STORAGE_PATH, RESULT_STORAGE_PATH, TEMP_STORAGE_PATH, CACHE_STORAGE_PATH]:
         os.makedirs(path, exist_ok=True)
     
     # Whisper模型配置
@@ -63,17 +76,88 @@ class Config:
         }
     }
     
+    # 音频与转录结果缓存配置
+    MEDIA_CACHE_ENABLED = os.environ.get('MEDIA_CACHE_ENABLED', 'true').lower() == 'true'
+    AUDIO_CACHE_MAX_SIZE = int(os.environ.get('AUDIO_CACHE_MAX_SIZE', 10 * 1024 * 1024 * 1024))  # 10GB
+    TRANSCRIPT_CACHE_MAX_SIZE = int(os.environ.get('TRANSCRIPT_CACHE_MAX_SIZE', 1024 * 1024 * 1024))  # 1GB
+    
+    # 解码音频缓存配置（16kHz PCM，保存在音频文件旁）
+    DECODED_AUDIO_CACHE_ENABLED = os.environ.get('DECODED_AUDIO_CACHE_ENABLED', 'true').lower() == 'true'
+    DECODED_AUDIO_CACHE_MAX_SIZE = int(os.environ.get('DECODED_AUDIO_CACHE_MAX_SIZE', 5 * 1024 * 1024 * 1024))  # 5GB
+    
+    # 分窗转录配置：每个窗口完成后推送片段和进度，0 表示整段转录
+    TRANSCRIBE_WINDOW_SECONDS = int(os.environ.get('TRANSCRIBE_WINDOW_SECONDS', 180))
+    
+    # 流式解码配置：分窗转录时，时长不少于该值（秒）的音频通过ffmpeg管道按窗口解码，内存占用与时长无关
+    STREAMING_DECODE_ENABLED = os.environ.get('STREAMING_DECODE_ENABLED', 'true').lower() == 'true'
+    STREAMING_DECODE_MIN_DURATION = int(os.environ.get('STREAMING_DECODE_MIN_DURATION', 1800))
+    
+    # 模型池配置（启用转录进程池时为每个工作进程的预算）
+    WHISPER_MODEL_POOL_BUDGET_GB = float(os.environ.get('WHISPER_MODEL_POOL_BUDGET_GB', 12))
+    
+    # 转录进程池：Whisper推理在独立进程中运行，进程数默认与转录阶段工作线程数相同，
+    # 每个进程的PyTorch线程数为 0 时按CPU核数平均分配，每个进程各自使用完整的模型内存预算
+    TRANSCRIBE_PROCESS_POOL_ENABLED = os.environ.get('TRANSCRIBE_PROCESS_POOL_ENABLED', 'true').lower() == 'true'
+    TRANSCRIBE_PROCESSES = int(os.environ.get('TRANSCRIBE_PROCESSES', 0))
+    TRANSCRIBE_PROCESS_THREADS = int(os.environ.get('TRANSCRIBE_PROCESS_THREADS', 0))
+    
     # 任务配置
     MAX_CONCURRENT_TASKS = int(os.environ.get('MAX_CONCURRENT_TASKS', 3))
+    MAX_TASK_BACKLOG = int(os.environ.get('MAX_TASK_BACKLOG', 100))  # 排队任务上限，超出时拒绝新任务
     TASK_TIMEOUT = int(os.environ.get('TASK_TIMEOUT', 3600))  # 1小时
+    
+    # 任务阶段超时配置（秒），可通过任务选项 timeouts 按阶段覆盖
+    TASK_DOWNLOAD_TIMEOUT = int(os.environ.get('TASK_DOWNLOAD_TIMEOUT', 1800))
+    TASK_DECODE_TIMEOUT = int(os.environ.get('TASK_DECODE_TIMEOUT', 600))
+    TASK_TRANSCRIBE_TIMEOUT = int(os.environ.get('TASK_TRANSCRIBE_TIMEOUT', TASK_TIMEOUT))
+    TASK_WRITE_TIMEOUT = int(os.environ.get('TASK_WRITE_TIMEOUT', 300))
+    TASK_TIMEOUT_GRACE = int(os.environ.get('TASK_TIMEOUT_GRACE', 10))  # 超时后等待工作线程退出的宽限期
+    TASK_WATCHDOG_INTERVAL = float(os.environ.get('TASK_WATCHDOG_INTERVAL', 1.0))
+    
+    # 任务进度写缓冲：同一状态内的进度更新按该间隔（秒）批量提交，状态变化立即提交，0 表示不缓冲
+    TASK_STATUS_FLUSH_INTERVAL = float(os.environ.get('TASK_STATUS_FLUSH_INTERVAL', 1.0))
+    
+    # 任务状态计数：内存计数与数据库对账的间隔（秒），0 表示只在启动时加载
+    TASK_COUNTER_RECONCILE_INTERVAL = float(os.environ.get('TASK_COUNTER_RECONCILE_INTERVAL', 60))
+    
+    # 任务状态缓存：最多缓存的任务数（0 表示不缓存），已结束任务的缓存时长（秒）
+    TASK_STATE_CACHE_SIZE = int(os.environ.get('TASK_STATE_CACHE_SIZE', 1000))
+    TASK_STATE_CACHE_FINISHED_TTL = int(os.environ.get('TASK_STATE_CACHE_FINISHED_TTL', 300))
+    
+    # 持久化队列租约配置
+    TASK_LEASE_TTL = int(os.environ.get('TASK_LEASE_TTL', 60))  # 秒
+    TASK_HEARTBEAT_INTERVAL = int(os.environ.get('TASK_HEARTBEAT_INTERVAL', 15))  # 秒
+    TASK_MAX_RECOVERY_ATTEMPTS = int(os.environ.get('TASK_MAX_RECOVERY_ATTEMPTS', 3))
+    
+    # 远程工作节点：租约时长（秒），到期未上报进度的任务重新排队；进程内替身工作节点数量（单机测试用）
+    WORKER_LEASE_TTL = int(os.environ.get('WORKER_LEASE_TTL', 60))
+    LOCAL_WORKERS = int(os.environ.get('LOCAL_WORKERS', 0))
+    
+    # 任务调度策略: fair（公平份额）, sjf（最短作业优先）, priority（优先级）, fifo
+    TASK_SCHEDULER_POLICY = os.environ.get('TASK_SCHEDULER_POLICY', 'fair')
+    TASK_SCHEDULER_AGING_FACTOR = float(os.environ.get('TASK_SCHEDULER_AGING_FACTOR', 1.0))
+    
+    # 模型亲和：在排在最前的若干个任务中优先调度与上一个任务模型相同的任务（0 表示关闭），
+    # 排在最前的任务最多被推迟的时间（秒）
+    TASK_SCHEDULER_AFFINITY_WINDOW = int(os.environ.get('TASK_SCHEDULER_AFFINITY_WINDOW', 8))
+    TASK_SCHEDULER_AFFINITY_MAX_WAIT = int(os.environ.get('TASK_SCHEDULER_AFFINITY_MAX_WAIT', 300))
+    
+    # 任务流水线各阶段工作线程数
+    PIPELINE_DOWNLOAD_WORKERS = int(os.environ.get('PIPELINE_DOWNLOAD_WORKERS', 2))
+    PIPELINE_DECODE_WORKERS = int(os.environ.get('PIPELINE_DECODE_WORKERS', 1))
+    PIPELINE_TRANSCRIBE_WORKERS = int(os.environ.get('PIPELINE_TRANSCRIBE_WORKERS', 2))
+    PIPELINE_WRITE_WORKERS = int(os.environ.get('PIPELINE_WRITE_WORKERS', 1))
     MAX_FILE_SIZE = int(os.environ.get('MAX_FILE_SIZE', 1024 * 1024 * 1024))  # 1GB
     
+    # 任务列表游标分页的近似总数最多计数到该值
+    TASK_LIST_APPROX_COUNT_CAP = int(os.environ.get('TASK_LIST_APPROX_COUNT_CAP', 10000))
+    
     # 代理配置
     USE_PROXY = os.environ.get('USE_PROXY', 'false').lower() == 'true'
     PROXY_URL = os.environ.get('PROXY_URL', '')
     
     # 支持的输出格式
-    SUPPORTED_OUTPUT_FORMATS = ['txt', 'md', 'json']
+    SUPPORTED_OUTPUT_FORMATS = ['txt', 'md', 'json', 'srt']
     
     # 支持的语言
     SUPPORTED_LANGUAGES = {
@@ -92,9 +176,12 @@ class Config:
     WEBSOCKET_HEARTBEAT_INTERVAL = 30  # 秒
     WEBSOCKET_TIMEOUT = 60  # 秒
     
-    # 系统监控配置
-    SYSTEM_MONITOR_INTERVAL = 5  # 秒
-    PERFORMANCE_HISTORY_LIMIT = 100  # 保留最近100个数据点
+    # 系统监控配置：原始采样只保存在内存中（默认约1小时），按分钟和小时汇总（最小/平均/最大值）写入数据库，
+    # 分钟汇总和小时汇总分别按保留期清理
+    SYSTEM_MONITOR_INTERVAL = int(os.environ.get('SYSTEM_MONITOR_INTERVAL', 5))  # 秒
+    PERFORMANCE_HISTORY_LIMIT = int(os.environ.get('PERFORMANCE_HISTORY_LIMIT', 720))  # 内存中保留的原始采样数
+    SYSTEM_METRICS_MINUTE_RETENTION_HOURS = int(os.environ.get('SYSTEM_METRICS_MINUTE_RETENTION_HOURS', 48))
+    SYSTEM_METRICS_HOUR_RETENTION_DAYS = int(os.environ.get('SYSTEM_METRICS_HOUR_RETENTION_DAYS', 90))
     
     # 日志配置
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
@@ -3,15 +3,28 @@
 """
 
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.orm.attributes import set_committed_value, flag_modified
+from datetime import datetime, timedelta
+import base64
 import json
 import uuid
 
+from webapp.core.status_buffer import status_buffer
+
 db = SQLAlchemy()
 
 class Task(db.Model):
     """任务模型"""
     __tablename__ = 'tasks'
+    __table_args__ = (
+        # 任务列表按 (created_at, id) 游标分页
+        db.Index('ix_tasks_created_at_id', 'created_at', 'id'),
+        db.Index('ix_tasks_status_created_at_id', 'status', 'created_at', 'id'),
+    )
     
     id = db.Column(db.String(50), primary_key=True, default=lambda: str(uuid.uuid4()))
     task_id = db.Column(db.String(100), unique=True, nullable=False, index=True)
@@ -41,16 +54,40 @@ class Task(db.Model):
     # 配置选项（JSON格式存储）
     options = db.Column(db.Text)
     
+    # 提交方地址（调度器公平份额的键，不对外返回）
+    client_id = db.Column(db.String(100))
+    
     # 视频信息（JSON格式存储）
     video_info = db.Column(db.Text)
     
+    # 持久化队列租约信息
+    lease_owner = db.Column(db.String(100), index=True)
+    lease_expires_at = db.Column(db.DateTime, index=True)
+    heartbeat_at = db.Column(db.DateTime)
+    completed_stage = db.Column(db.String(20))
+    attempts = db.Column(db.Integer, default=0)
+    
+    # 各阶段耗时（秒）、下载字节数和实时率（推理耗时 / 音频时长）
+    queue_wait = db.Column(db.Float)
+    download_time = db.Column(db.Float)
+    decode_time = db.Column(db.Float)
+    inference_time = db.Column(db.Float)
+    write_time = db.Column(db.Float)
+    bytes_downloaded = db.Column(db.BigInteger)
+    real_time_factor = db.Column(db.Float)
+    
+    # 转录结果概要（片段保存在 transcript_segments 表中，为空表示结果仍是旧版的结果文件）
+    language = db.Column(db.String(20))
+    segment_count = db.Column(db.Integer)
+    
     def __init__(self, **kwargs):
         super(Task, self).__init__(**kwargs)
         if not self.task_id:
             self.task_id = f"task_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}"
     
     def to_dict(self):
-        """转换为字典格式"""
+        """转换为字典格式（包含写缓冲中尚未写入数据库的进度）"""
+        pending = status_buffer.peek(self.task_id) if self.task_id else {}
         return {
             'id': self.id,
             'task_id': self.task_id,
@@ -58,8 +95,8 @@ class Task(db.Model):
             'title': self.title,
             'model_name': self.model_name,
             'status': self.status,
-            'progress': self.progress,
-            'current_stage': self.current_stage,
+            'progress': pending.get('progress', self.progress),
+            'current_stage': pending.get('current_stage', self.current_stage),
             'error_message': self.error_message,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'started_at': self.started_at.isoformat() if self.started_at else None,
@@ -68,10 +105,39 @@ class Task(db.Model):
             'duration': self.duration,
             'result_file_path': self.result_file_path,
             'audio_file_path': self.audio_file_path,
-            'options': json.loads(self.options) if self.options else {},
-            'video_info': json.loads(self.video_info) if self.video_info else {}
+            'options': self.get_public_options(),
+            'video_info': json.loads(self.video_info) if self.video_info else {},
+            'completed_stage': self.completed_stage,
+            'attempts': self.attempts,
+            'timings': {
+                'queue_wait': self.queue_wait,
+                'download': self.download_time,
+                'decode': self.decode_time,
+                'inference': self.inference_time,
+                'write': self.write_time,
+                'bytes_downloaded': self.bytes_downloaded,
+                'real_time_factor': self.real_time_factor
+            },
+            'language': self.language,
+            'segment_count': self.segment_count
         }
     
+    def set_timings(self, timings, bytes_downloaded=None):
+        """
+        记录各阶段耗时（随下一次状态更新提交）
+
+        Args:
+            timings: 阶段名称到耗时（秒）的字典，键为 queue、download、decode、transcribe、write
+            bytes_downloaded: 下载的字节数，命中缓存时为 0
+        """
+        for column, stage in TIMING_COLUMNS.items():
+            if stage in timings:
+                setattr(self, column, round(timings[stage], 3))
+        if bytes_downloaded is not None:
+            self.bytes_downloaded = bytes_downloaded
+        if self.inference_time and self.duration:
+            self.real_time_factor = round(self.inference_time / self.duration, 4)
+    
     def set_options(self, options_dict):
         """设置选项"""
         self.options = json.dumps(options_dict) if options_dict else None
@@ -80,6 +146,12 @@ class Task(db.Model):
         """获取选项"""
         return json.loads(self.options) if self.options else {}
     
+    def get_public_options(self):
+        """获取对外返回的选项（去掉旧版本写入选项中的提交方地址）"""
+        options = self.get_options()
+        options.pop('client_id', None)
+        return options
+    
     def set_video_info(self, video_info_dict):
         """设置视频信息"""
         self.video_info = json.dumps(video_info_dict) if video_info_dict else None
@@ -89,7 +161,28 @@ class Task(db.Model):
         return json.loads(self.video_info) if self.video_info else {}
     
     def update_status(self, status, progress=None, stage=None, error=None):
-        """更新任务状态"""
+        """
+        更新任务状态
+
+        状态不变时的进度和阶段更新写入写缓冲，由后台线程批量提交；
+        状态变化（包括终态）立即提交，同时写入该任务缓冲中尚未提交的进度。
+        """
+        if status_buffer.enabled and status == self.status and status in UNFINISHED_STATUSES and error is None:
+            values = {}
+            if progress is not None:
+                values['progress'] = float(progress)
+            if stage is not None:
+                values['current_stage'] = stage
+            # 只更新对象上的值，不标记为已修改，避免随其他提交或自动flush写入
+            for key, value in values.items():
+                set_committed_value(self, key, value)
+            status_buffer.put(self.task_id, status, values)
+            return
+        
+        for key, value in status_buffer.pop(self.task_id).items():
+            setattr(self, key, value)
+            flag_modified(self, key)
+        
         self.status = status
         if progress is not None:
             self.progress = progress
@@ -98,16 +191,61 @@ class Task(db.Model):
         if error is not None:
             self.error_message = error
         
-        # 更新时间戳
-        if status == 'transcribing' and not self.started_at:
+        # 更新时间戳：任务离开队列开始下载时即开始计时
+        if status in ('downloading', 'transcribing') and not self.started_at:
             self.started_at = datetime.utcnow()
         elif status in ['completed', 'failed', 'cancelled'] and not self.completed_at:
             self.completed_at = datetime.utcnow()
         
+        # 终态任务释放租约
+        if status in ['completed', 'failed', 'cancelled']:
+            self.lease_owner = None
+            self.lease_expires_at = None
+        
         db.session.commit()
 
+class TranscriptSegment(db.Model):
+    """转录片段模型，转录结果的唯一来源，下载时按需渲染为各种输出格式"""
+    __tablename__ = 'transcript_segments'
+    __table_args__ = (
+        db.Index('ix_transcript_segments_task_seq', 'task_id', 'seq', unique=True),
+        db.Index('ix_transcript_segments_task_start', 'task_id', 'start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.String(100), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    start = db.Column(db.Float, nullable=False)
+    end = db.Column(db.Float, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    
+    def to_dict(self):
+        """转换为字典格式"""
+        return {
+            'index': self.seq,
+            'start': self.start,
+            'end': self.end,
+            'text': self.text
+        }
+
+class SystemMetricRollup(db.Model):
+    """系统指标汇总：每个指标每分钟、每小时一行，记录最小值、平均值和最大值"""
+    __tablename__ = 'system_metric_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('resolution', 'metric', 'bucket_start', name='uq_system_metric_rollups_bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.String(10), nullable=False)  # minute, hour
+    metric = db.Column(db.String(30), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)  # UTC
+    min_value = db.Column(db.Float, nullable=False)
+    avg_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    samples = db.Column(db.Integer, nullable=False)
+
 class SystemStatus(db.Model):
-    """系统状态模型"""
+    """系统状态模型（旧版每次采样一行，已由 SystemMetricRollup 取代，只保留历史数据）"""
     __tablename__ = 'system_status'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -149,7 +287,7 @@ class SystemStatus(db.Model):
         }
 
 class TaskStatistics(db.Model):
-    """任务统计模型"""
+    """任务统计模型（旧版按天统计，已由 TaskRollup 取代，只保留历史数据）"""
     __tablename__ = 'task_statistics'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -194,9 +332,65 @@ class TaskStatistics(db.Model):
         """获取模型使用统计"""
         return json.loads(self.model_usage) if self.model_usage else {}
 
+class TaskRollup(db.Model):
+    """任务统计汇总：任务状态变化时按小时、天、月原子累加，任意周期的统计都是一次索引查询"""
+    __tablename__ = 'task_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'period_start', name='uq_task_rollups_period'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour, day, month
+    period_start = db.Column(db.DateTime, nullable=False)  # UTC
+    
+    tasks_created = db.Column(db.Integer, nullable=False, default=0)
+    tasks_completed = db.Column(db.Integer, nullable=False, default=0)
+    tasks_failed = db.Column(db.Integer, nullable=False, default=0)
+    total_processing_time = db.Column(db.Float, nullable=False, default=0)  # 秒
+    total_audio_duration = db.Column(db.Float, nullable=False, default=0)  # 秒
+    total_file_size = db.Column(db.BigInteger, nullable=False, default=0)  # 字节
+    
+    # 完成任务的阶段耗时之和（秒）与记录了该阶段耗时的任务数，见 TIMING_COLUMNS
+    total_queue_wait = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    queue_wait_tasks = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_download_time = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    download_time_tasks = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_decode_time = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    decode_time_tasks = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_inference_time = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    inference_time_tasks = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_write_time = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    write_time_tasks = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_bytes_downloaded = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    # 记录了推理耗时的任务的音频时长之和，用于计算实时率
+    inference_audio_duration = db.Column(db.Float, nullable=False, default=0, server_default='0')
+
+class ModelUsageRollup(db.Model):
+    """模型使用汇总：每个周期每个模型一行，完成任务时原子累加"""
+    __tablename__ = 'model_usage_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'period_start', 'model_name', name='uq_model_usage_rollups_period'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)
+    period_start = db.Column(db.DateTime, nullable=False)
+    model_name = db.Column(db.String(50), nullable=False)
+    tasks = db.Column(db.Integer, nullable=False, default=0)
+
 def init_db():
     """初始化数据库"""
+    inspector = inspect(db.engine)
+    rollups_exist = inspector.has_table(TaskRollup.__tablename__)
+    timings_exist = rollups_exist and 'total_queue_wait' in {
+        column['name'] for column in inspector.get_columns(TaskRollup.__tablename__)
+    }
     db.create_all()
+    upgrade_schema()
+    if not rollups_exist:
+        backfill_rollups()
+    if not timings_exist:
+        backfill_stage_timings()
     
     # 创建默认的系统状态记录
     if not SystemStatus.query.first():
@@ -209,6 +403,25 @@ def init_db():
         db.session.add(status)
         db.session.commit()
 
+def upgrade_schema():
+    """为已有的表补充新增的列和索引（db.create_all 不会修改已存在的表）"""
+    inspector = inspect(db.engine)
+    
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                # 带上 NOT NULL 和 server_default，已有的行取默认值
+                column_ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column_ddl}'))
+        db.session.commit()
+        
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
 def get_task_by_id(task_id):
     """根据任务ID获取任务"""
     return Task.query.filter_by(task_id=task_id).first()
@@ -224,45 +437,377 @@ def get_recent_tasks(limit=10):
     """获取最近的任务"""
     return Task.query.order_by(Task.created_at.desc()).limit(limit).all()
 
-def get_task_statistics(date=None):
-    """获取任务统计"""
-    if date is None:
-        date = datetime.utcnow().date()
-    
-    stats = TaskStatistics.query.filter_by(date=date).first()
-    if not stats:
-        stats = TaskStatistics(date=date)
-        db.session.add(stats)
-        db.session.commit()
-    
-    return stats
+def encode_task_cursor(task):
+    """把任务的 (created_at, id) 编码为不透明的分页游标"""
+    payload = json.dumps([task.created_at.isoformat(), task.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_task_cursor(cursor):
+    """
+    解析分页游标
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, task_id = json.loads(payload)
+        return datetime.fromisoformat(created_at), str(task_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'无效的分页游标: {cursor}') from e
+
+def get_tasks_after(query, cursor=None, limit=20):
+    """
+    游标分页：按 (created_at, id) 倒序取游标之后的一页任务
+
+    Args:
+        query: 已应用筛选条件的任务查询
+        cursor: 上一页返回的游标，为空表示第一页
+        limit: 每页数量
+
+    Returns:
+        tuple: (任务列表, 下一页游标)，没有更多任务时游标为 None
+    """
+    if cursor:
+        created_at, task_id = decode_task_cursor(cursor)
+        query = query.filter(db.tuple_(Task.created_at, Task.id) < (created_at, task_id))
+    tasks = query.order_by(Task.created_at.desc(), Task.id.desc()).limit(limit + 1).all()
+    
+    next_cursor = encode_task_cursor(tasks[limit - 1]) if len(tasks) > limit else None
+    return tasks[:limit], next_cursor
+
+def count_tasks(query, cap=None):
+    """
+    统计查询命中的任务数
+
+    Args:
+        cap: 最多计数到该值（只扫描 cap 行索引），为空时精确计数
+
+    Returns:
+        tuple: (数量, 是否为精确值)
+    """
+    if cap is None:
+        return query.order_by(None).count(), True
+    
+    capped = query.order_by(None).with_entities(Task.id).limit(cap + 1).subquery()
+    count = db.session.query(db.func.count()).select_from(capped).scalar()
+    return min(count, cap), count <= cap
+
+ROLLUP_COUNTERS = [
+    'tasks_created', 'tasks_completed', 'tasks_failed',
+    'total_processing_time', 'total_audio_duration', 'total_file_size'
+]
+
+# 阶段耗时汇总列，由 get_stage_timing_summary 读取
+STAGE_TIMING_COUNTERS = [
+    'total_queue_wait', 'queue_wait_tasks', 'total_download_time', 'download_time_tasks',
+    'total_decode_time', 'decode_time_tasks', 'total_inference_time', 'inference_time_tasks',
+    'total_write_time', 'write_time_tasks', 'total_bytes_downloaded', 'inference_audio_duration'
+]
+
+def rollup_periods(timestamp):
+    """时间点（UTC）所在的小时、天、月汇总周期"""
+    hour = timestamp.replace(minute=0, second=0, microsecond=0)
+    return [
+        ('hour', hour),
+        ('day', hour.replace(hour=0)),
+        ('month', hour.replace(day=1, hour=0))
+    ]
+
+def _increment(model, keys, increments):
+    """
+    原子地累加一行计数，行不存在时插入
+
+    SQLite 和 PostgreSQL 使用 INSERT ... ON CONFLICT DO UPDATE SET col = col + excluded.col，
+    其他数据库先 UPDATE，没有命中时再 INSERT（并发插入冲突时重试 UPDATE）。
+    """
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(model).values(**keys, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: getattr(model, column) + stmt.excluded[column] for column in increments}
+        )
+        db.session.execute(stmt)
+        return
+    
+    conditions = [getattr(model, key) == value for key, value in keys.items()]
+    values = {getattr(model, column): getattr(model, column) + value for column, value in increments.items()}
+    if db.session.query(model).filter(*conditions).update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(db.insert(model).values(**keys, **increments))
+    except IntegrityError:
+        db.session.query(model).filter(*conditions).update(values, synchronize_session=False)
+
+def record_task_rollup(timestamp, increments, model_name=None):
+    """
+    把计数累加到时间点所在的小时、天、月汇总（随下一次提交生效）
+
+    Args:
+        timestamp: 事件时间（UTC）
+        increments: 汇总列到增量的字典，列名见 ROLLUP_COUNTERS
+        model_name: 完成任务使用的模型，为空时不累加模型使用汇总
+    """
+    for granularity, period_start in rollup_periods(timestamp):
+        keys = {'granularity': granularity, 'period_start': period_start}
+        _increment(TaskRollup, keys, increments)
+        if model_name:
+            _increment(ModelUsageRollup, dict(keys, model_name=model_name), {'tasks': 1})
+
+def record_task_created(task):
+    """新建任务计入统计汇总"""
+    record_task_rollup(task.created_at or datetime.utcnow(), {'tasks_created': 1})
+    db.session.commit()
+
+def stage_timing_increments(task):
+    """完成任务的阶段耗时汇总增量"""
+    increments = {}
+    for column in TIMING_COLUMNS:
+        value = getattr(task, column)
+        if value is not None:
+            increments[f'total_{column}'] = value
+            increments[f'{column}_tasks'] = 1
+    if task.bytes_downloaded:
+        increments['total_bytes_downloaded'] = task.bytes_downloaded
+    if task.inference_time is not None and task.duration:
+        increments['inference_audio_duration'] = task.duration
+    return increments
 
 def update_task_statistics(task):
-    """更新任务统计"""
-    stats = get_task_statistics()
-    
+    """任务完成或失败时按完成时间累加统计汇总"""
     if task.status == 'completed':
-        stats.tasks_completed += 1
-        if task.duration:
-            stats.total_audio_duration += int(task.duration)
-        if task.file_size:
-            stats.total_file_size += task.file_size
-        
-        # 更新处理时间
+        increments = {
+            'tasks_completed': 1,
+            'total_audio_duration': task.duration or 0,
+            'total_file_size': task.file_size or 0
+        }
         if task.started_at and task.completed_at:
-            processing_time = (task.completed_at - task.started_at).total_seconds()
-            stats.total_processing_time += int(processing_time)
-        
-        # 更新模型使用统计
-        model_usage = stats.get_model_usage()
-        model_usage[task.model_name] = model_usage.get(task.model_name, 0) + 1
-        stats.set_model_usage(model_usage)
-    
+            increments['total_processing_time'] = (task.completed_at - task.started_at).total_seconds()
+        increments.update(stage_timing_increments(task))
+        record_task_rollup(task.completed_at or datetime.utcnow(), increments, model_name=task.model_name)
     elif task.status == 'failed':
-        stats.tasks_failed += 1
+        record_task_rollup(task.completed_at or datetime.utcnow(), {'tasks_failed': 1})
+    else:
+        return
     
     db.session.commit()
 
+def get_rollup_statistics(granularity, start, end):
+    """
+    汇总 [start, end) 内指定粒度的统计
+
+    Returns:
+        dict: 任务数、处理时间、音频时长、文件大小、模型使用和平均处理速度（音频时长 / 处理时间）
+    """
+    period_filter = (
+        TaskRollup.granularity == granularity,
+        TaskRollup.period_start >= start,
+        TaskRollup.period_start < end
+    )
+    row = db.session.query(
+        *[db.func.coalesce(db.func.sum(getattr(TaskRollup, column)), 0) for column in ROLLUP_COUNTERS]
+    ).filter(*period_filter).one()
+    stats = dict(zip(ROLLUP_COUNTERS, row))
+    for column in ('total_processing_time', 'total_audio_duration'):
+        stats[column] = round(float(stats[column]), 3)
+    
+    usage = db.session.query(ModelUsageRollup.model_name, db.func.sum(ModelUsageRollup.tasks)).filter(
+        ModelUsageRollup.granularity == granularity,
+        ModelUsageRollup.period_start >= start,
+        ModelUsageRollup.period_start < end
+    ).group_by(ModelUsageRollup.model_name).all()
+    stats['model_usage'] = {model_name: int(count) for model_name, count in usage}
+    
+    stats['average_processing_speed'] = (
+        stats['total_audio_duration'] / stats['total_processing_time']
+        if stats['total_processing_time'] > 0 else 0
+    )
+    return stats
+
+def backfill_rollups():
+    """从旧的按天统计表补建天和月汇总（新建汇总表时执行一次，旧数据没有小时粒度）"""
+    legacy = TaskStatistics.query.all()
+    for stats in legacy:
+        if not stats.date:
+            continue
+        day = datetime.combine(stats.date, datetime.min.time())
+        increments = {
+            'tasks_created': stats.tasks_created or 0,
+            'tasks_completed': stats.tasks_completed or 0,
+            'tasks_failed': stats.tasks_failed or 0,
+            'total_processing_time': stats.total_processing_time or 0,
+            'total_audio_duration': stats.total_audio_duration or 0,
+            'total_file_size': stats.total_file_size or 0
+        }
+        for granularity, period_start in rollup_periods(day)[1:]:
+            keys = {'granularity': granularity, 'period_start': period_start}
+            _increment(TaskRollup, keys, increments)
+            for model_name, count in stats.get_model_usage().items():
+                _increment(ModelUsageRollup, dict(keys, model_name=model_name), {'tasks': count})
+    db.session.commit()
+
+def backfill_stage_timings(batch_size=500):
+    """从已完成任务补建阶段耗时汇总（汇总表新增阶段耗时列时执行一次）"""
+    query = Task.query.filter(
+        Task.status == 'completed',
+        Task.completed_at.isnot(None),
+        db.or_(*[getattr(Task, column).isnot(None) for column in TIMING_COLUMNS])
+    ).order_by(Task.completed_at)
+    for task in query.yield_per(batch_size):
+        record_task_rollup(task.completed_at, stage_timing_increments(task))
+    db.session.commit()
+
+UNFINISHED_STATUSES = ['pending', 'downloading', 'transcribing']
+
+# Task 耗时列与流水线阶段的对应关系
+TIMING_COLUMNS = {
+    'queue_wait': 'queue',
+    'download_time': 'download',
+    'decode_time': 'decode',
+    'inference_time': 'transcribe',
+    'write_time': 'write'
+}
+
+def get_stage_timing_summary(granularity, start, end):
+    """
+    汇总 [start, end) 内完成的任务的阶段耗时（从指定粒度的汇总表读取）
+
+    Returns:
+        dict: 各阶段平均耗时、下载总字节数以及整体实时率
+    """
+    columns = ['tasks_completed'] + STAGE_TIMING_COUNTERS
+    row = db.session.query(
+        *[db.func.coalesce(db.func.sum(getattr(TaskRollup, column)), 0) for column in columns]
+    ).filter(
+        TaskRollup.granularity == granularity,
+        TaskRollup.period_start >= start,
+        TaskRollup.period_start < end
+    ).one()
+    totals = dict(zip(columns, row))
+    
+    average = {}
+    for column, stage in zip(TIMING_COLUMNS, ['queue_wait', 'download', 'decode', 'inference', 'write']):
+        count = totals[f'{column}_tasks']
+        average[stage] = round(totals[f'total_{column}'] / count, 3) if count else None
+    inference_time, audio_duration = totals['total_inference_time'], totals['inference_audio_duration']
+    return {
+        'tasks': int(totals['tasks_completed']),
+        'average': average,
+        'total_bytes_downloaded': int(totals['total_bytes_downloaded']),
+        'total_inference_time': round(float(inference_time), 3),
+        'real_time_factor': round(inference_time / audio_duration, 4) if inference_time and audio_duration else None
+    }
+
+def claim_task_lease(task_id, owner, ttl):
+    """原子地获取任务租约，租约空闲、已过期或已属于自己时成功"""
+    now = datetime.utcnow()
+    claimed = Task.query.filter(
+        Task.task_id == task_id,
+        Task.status.in_(UNFINISHED_STATUSES),
+        db.or_(
+            Task.lease_owner.is_(None),
+            Task.lease_expires_at < now,
+            Task.lease_owner == owner
+        )
+    ).update({
+        Task.lease_owner: owner,
+        Task.lease_expires_at: now + timedelta(seconds=ttl),
+        Task.heartbeat_at: now
+    }, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+def renew_task_leases(task_ids, owner, ttl):
+    """为持有的任务续约（心跳）"""
+    if not task_ids:
+        return 0
+    now = datetime.utcnow()
+    renewed = Task.query.filter(
+        Task.task_id.in_(task_ids),
+        Task.lease_owner == owner
+    ).update({
+        Task.lease_expires_at: now + timedelta(seconds=ttl),
+        Task.heartbeat_at: now
+    }, synchronize_session=False)
+    db.session.commit()
+    return renewed
+
+def save_transcript_segments(task_id, segments):
+    """
+    保存任务的转录片段（替换已有片段，随下一次提交写入）
+
+    Returns:
+        int: 保存的片段数
+    """
+    TranscriptSegment.query.filter_by(task_id=task_id).delete(synchronize_session=False)
+    rows = [
+        {
+            'task_id': task_id,
+            'seq': seq,
+            'start': float(segment['start']),
+            'end': float(segment['end']),
+            'text': segment['text']
+        }
+        for seq, segment in enumerate(segments)
+    ]
+    if rows:
+        db.session.execute(db.insert(TranscriptSegment), rows)
+    return len(rows)
+
+def get_transcript_segments(task_id, start=None, end=None, limit=None):
+    """
+    按时间范围查询转录片段
+
+    Args:
+        task_id: 任务ID
+        start: 起始时间（秒），返回结束时间晚于该值的片段
+        end: 结束时间（秒），返回开始时间早于该值的片段
+        limit: 最多返回的片段数
+
+    Returns:
+        list: 按时间顺序排列的片段
+    """
+    query = TranscriptSegment.query.filter(TranscriptSegment.task_id == task_id)
+    if start is not None:
+        query = query.filter(TranscriptSegment.end > start)
+    if end is not None:
+        query = query.filter(TranscriptSegment.start < end)
+    query = query.order_by(TranscriptSegment.start, TranscriptSegment.seq)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+def iter_transcript_segments(task_id, batch_size=500):
+    """按顺序分批读取任务的全部转录片段，内存占用与片段总数无关"""
+    last_seq = -1
+    while True:
+        batch = TranscriptSegment.query.filter(
+            TranscriptSegment.task_id == task_id,
+            TranscriptSegment.seq > last_seq
+        ).order_by(TranscriptSegment.seq).limit(batch_size).all()
+        if not batch:
+            return
+        yield from batch
+        last_seq = batch[-1].seq
+
+def delete_transcript_segments(task_id):
+    """删除任务的转录片段（随下一次提交生效）"""
+    return TranscriptSegment.query.filter_by(task_id=task_id).delete(synchronize_session=False)
+
+def get_orphaned_tasks(exclude=None, limit=50):
+    """获取未完成且没有有效租约的任务"""
+    now = datetime.utcnow()
+    query = Task.query.filter(
+        Task.status.in_(UNFINISHED_STATUSES),
+        db.or_(Task.lease_owner.is_(None), Task.lease_expires_at < now)
+    )
+    if exclude:
+        query = query.filter(~Task.task_id.in_(exclude))
+    return query.order_by(Task.created_at.asc()).limit(limit).all()
+
 def cleanup_old_records(days=30):
     """清理旧记录"""
     cutoff_date = datetime.utcnow() - timedelta(days=days)
@@ -273,4 +818,10 @@ def cleanup_old_records(days=30):
     # 清理旧的任务统计记录
     TaskStatistics.query.filter(TaskStatistics.date < cutoff_date.date()).delete()
     
+    # 小时汇总只保留最近的记录，天和月汇总长期保留
+    TaskRollup.query.filter(TaskRollup.granularity == 'hour', TaskRollup.period_start < cutoff_date).delete()
+    ModelUsageRollup.query.filter(
+        ModelUsageRollup.granularity == 'hour', ModelUsageRollup.period_start < cutoff_date
+    ).delete()
+    
     db.session.commit() 
\ No newline at end of file
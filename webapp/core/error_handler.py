@@ -3,6 +3,7 @@
 统一处理异常和错误响应
 """
 
+import hmac
 import logging
 import traceback
 import uuid
@@ -31,6 +32,7 @@ class ErrorCode:
     TASK_NOT_FOUND = "TASK_NOT_FOUND"
     FILE_NOT_FOUND = "FILE_NOT_FOUND"
     SYSTEM_OVERLOAD = "SYSTEM_OVERLOAD"
+    LEASE_LOST = "LEASE_LOST"
     
     # 文件错误
     FILE_TOO_LARGE = "FILE_TOO_LARGE"
@@ -85,11 +87,11 @@ class NotFoundException(BusinessException):
 class SystemOverloadException(BusinessException):
     """系统过载异常"""
     
-    def __init__(self, message="系统负载过高，请稍后重试"):
+    def __init__(self, message="系统负载过高，请稍后重试", details=None):
         super().__init__(
             ErrorCode.SYSTEM_OVERLOAD,
             message,
-            None,
+            details,
             503
         )
 
@@ -321,6 +323,49 @@ def validate_request_data(required_fields=None, optional_fields=None):
         return wrapper
     return decorator
 
+# 进程内替身工作节点的请求标记（WSGI environ 中的键，外部请求无法设置）
+LOCAL_WORKER_ENVIRON_KEY = 'bili2text.local_worker'
+
+def _token_matches(expected, provided):
+    """常量时间比较令牌"""
+    return hmac.compare_digest((provided or '').encode('utf-8'), expected.encode('utf-8'))
+
+def _is_loopback():
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+def require_admin(func):
+    """
+    管理接口鉴权装饰器：配置了 ADMIN_TOKEN 时校验 X-Admin-Token 请求头；
+    未配置时拒绝访问，除非显式开启 ALLOW_LOCAL_ADMIN 允许本机访问
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        admin_token = current_app.config.get('ADMIN_TOKEN')
+        if admin_token:
+            if not _token_matches(admin_token, request.headers.get('X-Admin-Token')):
+                raise BusinessException(ErrorCode.UNAUTHORIZED, "管理令牌无效", status_code=401)
+        elif not (current_app.config.get('ALLOW_LOCAL_ADMIN') and _is_loopback()):
+            raise BusinessException(ErrorCode.FORBIDDEN, "未配置ADMIN_TOKEN，管理接口已禁用", status_code=403)
+        return func(*args, **kwargs)
+    return wrapper
+
+def require_worker(func):
+    """
+    工作节点接口鉴权装饰器：配置了 WORKER_TOKEN 时校验 X-Worker-Token 请求头；
+    未配置时只接受进程内替身工作节点，除非显式开启 ALLOW_LOCAL_WORKERS 允许本机工作节点接入
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        worker_token = current_app.config.get('WORKER_TOKEN')
+        if worker_token:
+            if not _token_matches(worker_token, request.headers.get('X-Worker-Token')):
+                raise BusinessException(ErrorCode.UNAUTHORIZED, "工作节点令牌无效", status_code=401)
+        elif not (request.environ.get(LOCAL_WORKER_ENVIRON_KEY)
+                  or (current_app.config.get('ALLOW_LOCAL_WORKERS') and _is_loopback())):
+            raise BusinessException(ErrorCode.FORBIDDEN, "未配置WORKER_TOKEN，工作节点接口已禁用", status_code=403)
+        return func(*args, **kwargs)
+    return wrapper
+
 def rate_limit_error_handler(func):
     """速率限制错误处理装饰器"""
     @wraps(func)
@@ -0,0 +1,331 @@
+"""
+媒体缓存
+按视频BV号缓存下载的音频，按 (音频哈希, 模型, 转录参数) 缓存转录结果，
+重复提交的视频无需重新下载和转录
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import urllib.request
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+from src.transcriber.audio_cache import CACHE_SUFFIX as DECODED_SUFFIX, META_SUFFIX as DECODED_META_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+BV_PATTERN = re.compile(r'(BV[0-9A-Za-z]{10})')
+SHORT_URL_PATTERN = re.compile(r'^https?://b23\.tv/')
+
+# 短链接解析结果按最近使用保留的条数
+SHORT_URL_CACHE_SIZE = 1024
+
+_short_url_cache = OrderedDict()
+_short_url_lock = threading.Lock()
+
+
+def transcribe_options(options):
+    """
+    任务选项中实际传给 Whisper 的转录参数
+
+    转录缓存键和合并键只由这些参数构成，输出格式等其他选项不影响转录结果。
+    """
+    language = options.get('language')
+    return {'language': language} if language and language != 'auto' else {}
+
+
+def resolve_short_url(url, timeout=10):
+    """解析b23.tv短链接，返回跳转后的地址"""
+    with _short_url_lock:
+        if url in _short_url_cache:
+            _short_url_cache.move_to_end(url)
+            return _short_url_cache[url]
+
+    try:
+        request = urllib.request.Request(url, method='HEAD', headers={'User-Agent': 'Mozilla/5.0'})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            resolved = response.geturl()
+    except Exception as e:
+        logger.warning(f"解析短链接失败 {url}: {e}")
+        return None
+
+    with _short_url_lock:
+        _short_url_cache[url] = resolved
+        _short_url_cache.move_to_end(url)
+        while len(_short_url_cache) > SHORT_URL_CACHE_SIZE:
+            _short_url_cache.popitem(last=False)
+    return resolved
+
+
+def normalize_video_url(url, resolve=True):
+    """
+    将视频地址规范化为缓存键
+
+    支持 https://www.bilibili.com/video/BV...、b23.tv 短链接和裸 BV 号，
+    分P视频的第2P起在键后追加 _p<N>
+
+    Args:
+        url: 视频地址
+        resolve: 是否通过网络解析短链接
+
+    Returns:
+        str: 规范化的键，如 BV1xx411c7mD 或 BV1xx411c7mD_p2；无法识别时返回 None
+    """
+    url = url.strip()
+    if SHORT_URL_PATTERN.match(url):
+        if not resolve:
+            return None
+        url = resolve_short_url(url)
+        if not url:
+            return None
+
+    match = BV_PATTERN.search(url)
+    if not match:
+        return None
+
+    key = match.group(1)
+    page = parse_qs(urlparse(url).query).get('p', ['1'])[0]
+    if page.isdigit() and int(page) > 1:
+        key += f'_p{page}'
+    return key
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """计算文件SHA256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def transcript_cache_key(audio_sha256, model_name, options):
+    """生成转录结果缓存键"""
+    material = json.dumps({
+        'audio': audio_sha256,
+        'model': model_name,
+        'options': transcribe_options(options)
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class ContentCache:
+    """
+    基于目录的内容缓存，每个条目由数据文件和元数据文件组成，超出容量时按最近使用时间淘汰
+
+    条目的大小和最近使用时间在内存中索引（启动时扫描一次目录），统计和淘汰不再每次遍历目录。
+    """
+
+    def __init__(self, root, max_size, name):
+        self.root = root
+        self.max_size = max_size
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        # key -> {'size': 字节数, 'last_used': 最近使用时间, 'paths': 条目的文件}
+        self._entries = self._scan()
+
+    def data_path(self, key, suffix):
+        return os.path.join(self.root, f'{key}{suffix}')
+
+    def meta_path(self, key):
+        return os.path.join(self.root, f'{key}.meta.json')
+
+    def contains(self, key, suffix):
+        """条目是否存在（不计入命中统计）"""
+        return os.path.exists(self.data_path(key, suffix)) and os.path.exists(self.meta_path(key))
+
+    def lookup(self, key, suffix):
+        """查找条目，命中时返回 (数据路径, 元数据)"""
+        data_path = self.data_path(key, suffix)
+        meta_path = self.meta_path(key)
+
+        if os.path.exists(data_path) and os.path.exists(meta_path):
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                # 只更新元数据文件的时间，数据文件的修改时间用于判断解码音频缓存是否失效
+                os.utime(meta_path)
+                with self._lock:
+                    self.hits += 1
+                    entry = self._entries.get(key)
+                    if entry is None:
+                        self._index(key, data_path, meta_path)
+                    else:
+                        entry['last_used'] = time.time()
+                return data_path, meta
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取缓存元数据失败 {meta_path}: {e}")
+
+        with self._lock:
+            self.misses += 1
+            # 文件已在进程外被删除时移出索引
+            if not os.path.exists(data_path):
+                self._entries.pop(key, None)
+        return None, None
+
+    def store_file(self, key, suffix, source_path, meta):
+        """将文件存入缓存（优先使用硬链接，不占用额外空间）"""
+        data_path = self.data_path(key, suffix)
+        with self._lock:
+            link_or_copy(source_path, data_path)
+            self._write_meta(key, meta)
+            self._index(key, data_path, self.meta_path(key))
+            self._evict()
+        return data_path
+
+    def store_json(self, key, suffix, data, meta=None):
+        """将JSON数据存入缓存"""
+        data_path = self.data_path(key, suffix)
+        with self._lock:
+            temp_path = f'{data_path}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, default=float)
+            os.replace(temp_path, data_path)
+            self._write_meta(key, meta or {})
+            self._index(key, data_path, self.meta_path(key))
+            self._evict()
+        return data_path
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size_bytes': sum(entry['size'] for entry in self._entries.values()),
+                'max_size_bytes': self.max_size
+            }
+
+    def _write_meta(self, key, meta):
+        temp_path = f'{self.meta_path(key)}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temp_path, self.meta_path(key))
+
+    def _index(self, key, *paths):
+        """登记条目的文件大小，最近使用时间记为当前时间（调用方持有 self._lock）"""
+        size = 0
+        for path in paths:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        self._entries[key] = {'size': size, 'last_used': time.time(), 'paths': list(paths)}
+
+    def _scan(self):
+        """按键汇总目录中已有缓存条目的大小和最近使用时间（启动时执行一次）"""
+        entries = {}
+        for filename in os.listdir(self.root):
+            # 解码音频缓存由 DecodedAudioCache 按自己的预算管理
+            if filename.endswith(('.tmp', DECODED_SUFFIX, DECODED_META_SUFFIX)):
+                continue
+            path = os.path.join(self.root, filename)
+            key = filename.split('.', 1)[0]
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = entries.setdefault(key, {'size': 0, 'last_used': 0, 'paths': []})
+            entry['size'] += stat.st_size
+            entry['last_used'] = max(entry['last_used'], stat.st_mtime)
+            entry['paths'].append(path)
+        return entries
+
+    def _evict(self):
+        """淘汰最久未使用的条目，直到不超过容量（调用方持有 self._lock）"""
+        total = sum(entry['size'] for entry in self._entries.values())
+        for key, entry in sorted(self._entries.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_size:
+                break
+            for path in entry['paths']:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            del self._entries[key]
+            total -= entry['size']
+            self.evictions += 1
+            logger.info(f"{self.name}缓存淘汰: {key}")
+
+
+class MediaCache:
+    """音频与转录结果缓存"""
+
+    AUDIO_SUFFIX = '.m4a'
+    TRANSCRIPT_SUFFIX = '.json'
+
+    def __init__(self, root, audio_max_size, transcript_max_size):
+        self.audio = ContentCache(os.path.join(root, 'audio'), audio_max_size, '音频')
+        self.transcripts = ContentCache(os.path.join(root, 'transcripts'), transcript_max_size, '转录')
+
+    def link_audio(self, video_key, target_path):
+        """
+        命中音频缓存时将音频链接到任务目录
+
+        Returns:
+            dict: 缓存元数据（video_info、sha256），未命中时返回 None
+        """
+        cached_path, meta = self.audio.lookup(video_key, self.AUDIO_SUFFIX)
+        if not cached_path:
+            return None
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        link_or_copy(cached_path, target_path)
+        return meta
+
+    def store_audio(self, video_key, audio_path, video_info):
+        """缓存下载的音频，返回音频SHA256"""
+        sha256 = file_sha256(audio_path)
+        self.audio.store_file(video_key, self.AUDIO_SUFFIX, audio_path, {
+            'video_info': video_info,
+            'sha256': sha256,
+            'size': os.path.getsize(audio_path)
+        })
+        return sha256
+
+    def lookup_transcript(self, key):
+        """查找转录结果"""
+        cached_path, _ = self.transcripts.lookup(key, self.TRANSCRIPT_SUFFIX)
+        if not cached_path:
+            return None
+        with open(cached_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def audio_path(self, video_key):
+        """缓存中的音频文件路径"""
+        return self.audio.data_path(video_key, self.AUDIO_SUFFIX)
+
+    def store_transcript(self, key, result, meta=None):
+        """缓存转录结果"""
+        self.transcripts.store_json(key, self.TRANSCRIPT_SUFFIX, result, meta)
+
+    def get_stats(self):
+        return {
+            'audio': self.audio.get_stats(),
+            'transcripts': self.transcripts.get_stats()
+        }
+
+
+def link_or_copy(source_path, target_path):
+    """创建硬链接，跨文件系统时退回到复制"""
+    if os.path.abspath(source_path) == os.path.abspath(target_path):
+        return
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copy2(source_path, target_path)
@@ -0,0 +1,342 @@
+"""
+任务流水线
+将任务处理拆分为下载、解码、转录、写出等阶段，每个阶段拥有独立的队列和工作线程
+"""
+
+import queue
+import threading
+import time
+import logging
+
+from webapp.core.cancellation import CancellationToken
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineJob:
+    """流水线中流转的任务上下文"""
+
+    def __init__(self, task_id, model_name=None, priority=0, client_id=None, duration=None):
+        self.task_id = task_id
+        self.model_name = model_name
+        self.priority = priority
+        self.client_id = client_id
+        self.duration = duration
+        self.submitted_at = time.time()
+        self.cost = None
+        self.bypassed_at = None
+        self.stage = None
+        self.skip_to = None
+        # 从中间阶段开始的任务先在第一个阶段占用并发槽，再直接转交到该阶段
+        self.enter_at = None
+        self.audio_path = None
+        self.audio = None
+        self.stream_audio = False
+        self.video_info = {}
+        self.result = None
+        self.video_key = None
+        self.audio_sha256 = None
+        self.transcript_key = None
+        self.coalesce_key = None
+        self.followers = []
+        self.accepting_followers = True
+        self.cancel_token = CancellationToken()
+        self.started_at = None
+        # 各阶段耗时（秒）：queue、download、decode、transcribe、write
+        self.timings = {}
+        self.stage_started_at = None
+        self.bytes_downloaded = None
+        self.timeout_reason = None
+        self.abandoned = False
+        self.holds_slot = False
+        self.worker_id = None
+
+
+class ConcurrencyLimiter:
+    """可在运行时调整上限的并发槽，缩小上限时不影响已占用槽的任务"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """占用一个槽，超时返回 False"""
+        with self._condition:
+            if self.in_use >= self.limit:
+                self._condition.wait(timeout)
+                if self.in_use >= self.limit:
+                    return False
+            self.in_use += 1
+            return True
+
+    def release(self):
+        """释放一个槽"""
+        with self._condition:
+            self.in_use = max(0, self.in_use - 1)
+            self._condition.notify()
+
+    def resize(self, limit):
+        """调整上限"""
+        with self._condition:
+            self.limit = limit
+            self._condition.notify_all()
+
+    def get_status(self):
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'in_use': self.in_use
+            }
+
+
+class PipelineStage:
+    """流水线阶段"""
+
+    def __init__(self, name, handler, workers=1, input_queue=None, on_exit=None, limiter=None):
+        """
+        初始化流水线阶段
+
+        Args:
+            name: 阶段名称
+            handler: 处理函数 handler(job) -> bool，返回False表示任务不再进入下一阶段
+            workers: 工作线程数
+            input_queue: 输入队列，默认使用无界FIFO队列
+            on_exit: 任务离开流水线时的回调 on_exit(job)
+            limiter: 并发槽，设置后取出的任务需先占用一个槽（job.holds_slot）才开始处理，由调用方在任务离开流水线时释放
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = input_queue if input_queue is not None else queue.Queue()
+        self.on_exit = on_exit
+        self.limiter = limiter
+        self.next_stage = None
+        self.running = False
+        self.busy = 0
+        self.processed = 0
+        self._threads = []
+        self._running_jobs = {}
+        self._abandoned = set()
+        self._spawned = 0
+        self._retiring = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动工作线程"""
+        self.running = True
+        for _ in range(self.workers):
+            self._spawn_worker()
+
+    def _spawn_worker(self):
+        thread = threading.Thread(
+            target=self._worker_loop,
+            name=f'pipeline-{self.name}-{self._spawned}',
+            daemon=True
+        )
+        self._spawned += 1
+        with self._lock:
+            self._threads.append(thread)
+        thread.start()
+
+    def resize(self, workers):
+        """调整工作线程数，缩减时空闲线程立即退出，忙碌线程完成当前任务后退出"""
+        with self._lock:
+            delta = workers - self.workers
+            self.workers = workers
+            if delta < 0:
+                self._retiring -= delta
+                delta = 0
+            else:
+                reclaimed = min(self._retiring, delta)
+                self._retiring -= reclaimed
+                delta -= reclaimed
+
+        if self.running:
+            for _ in range(delta):
+                self._spawn_worker()
+        logger.info(f"流水线阶段 {self.name} 工作线程数调整为 {workers}")
+
+    def stop(self, wait=True):
+        """停止工作线程"""
+        self.running = False
+        if wait:
+            for thread in self._threads:
+                thread.join(timeout=5)
+        self._threads = []
+
+    def abandon(self, job):
+        """
+        放弃无响应的工作线程并启动替代线程，释放处理能力
+
+        被放弃的线程返回后直接退出，不再转交任务。
+
+        Returns:
+            bool: 任务仍在本阶段执行时返回 True
+        """
+        with self._lock:
+            thread = self._running_jobs.pop(job, None)
+            if thread is None:
+                return False
+            job.abandoned = True
+            self._abandoned.add(thread)
+            self._threads.remove(thread)
+            self.busy -= 1
+            self.processed += 1
+
+        logger.warning(f"流水线阶段 {self.name} 放弃无响应的工作线程 {thread.name}（任务 {job.task_id}）")
+        if self.running:
+            self._spawn_worker()
+        return True
+
+    def submit(self, job):
+        """提交任务到本阶段，队列已满时阻塞等待"""
+        while True:
+            try:
+                self.queue.put(job, timeout=1)
+                return
+            except queue.Full:
+                if not self.running:
+                    raise RuntimeError(f"流水线阶段已停止: {self.name}")
+
+    def get_status(self):
+        """获取阶段状态"""
+        return {
+            'queued': self.queue.qsize(),
+            'workers': self.workers,
+            'busy': self.busy,
+            'processed': self.processed,
+            'abandoned': len(self._abandoned)
+        }
+
+    def _worker_loop(self):
+        """工作线程主循环"""
+        current = threading.current_thread()
+        while self.running:
+            with self._lock:
+                if self._retiring > 0:
+                    self._retiring -= 1
+                    self._threads.remove(current)
+                    return
+
+            try:
+                job = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            if self.limiter:
+                while not self.limiter.acquire(timeout=1):
+                    if not self.running:
+                        # 任务已出队但不会再被处理，交给离开回调清理
+                        self._exit(job)
+                        return
+                job.holds_slot = True
+
+            if job.enter_at and job.enter_at != self.name:
+                self._forward(job)
+                continue
+
+            with self._lock:
+                self.busy += 1
+                self._running_jobs[job] = current
+            job.stage = self.name
+
+            try:
+                proceed = self.handler(job)
+            except Exception as e:
+                logger.error(f"流水线阶段 {self.name} 处理任务失败 {job.task_id}: {e}")
+                proceed = False
+
+            with self._lock:
+                if current in self._abandoned:
+                    self._abandoned.discard(current)
+                    return
+                self._running_jobs.pop(job, None)
+                self.busy -= 1
+                self.processed += 1
+
+            try:
+                target = self._next_stage_for(job) if proceed else None
+                if target:
+                    target.submit(job)
+                else:
+                    self._exit(job)
+            except Exception as e:
+                logger.error(f"流水线阶段 {self.name} 转交任务失败 {job.task_id}: {e}")
+
+    def _exit(self, job):
+        """任务离开流水线"""
+        if self.on_exit:
+            self.on_exit(job)
+
+    def _forward(self, job):
+        """已占用并发槽、从中间阶段开始的任务不在本阶段处理，直接转交到起始阶段"""
+        target = self.next_stage
+        while target and target.name != job.enter_at:
+            target = target.next_stage
+        job.enter_at = None
+        try:
+            if not target:
+                raise RuntimeError('起始阶段不存在')
+            target.submit(job)
+        except Exception as e:
+            logger.error(f"流水线阶段 {self.name} 转交任务失败 {job.task_id}: {e}")
+            self._exit(job)
+
+
+    def _next_stage_for(self, job):
+        """下一个阶段，job.skip_to 指定时跳过中间阶段（如命中转录缓存时直接写出）"""
+        target = self.next_stage
+        if job.skip_to:
+            while target and target.name != job.skip_to:
+                target = target.next_stage
+            job.skip_to = None
+        return target
+
+
+class Pipeline:
+    """由多个阶段串联而成的流水线"""
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        for current, following in zip(self.stages, self.stages[1:]):
+            current.next_stage = following
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self, wait=True):
+        for stage in self.stages:
+            stage.stop(wait)
+
+    def submit(self, job, stage=None, admit=True):
+        """
+        提交任务
+
+        Args:
+            job: 流水线任务
+            stage: 从哪个阶段开始（命中缓存或恢复中断的任务），为空时从第一个阶段开始
+            admit: 第一个阶段设置了并发槽时，是否需要先占用并发槽；从中间阶段开始的任务同样经第一个阶段排队占槽，
+                   不受本地并发限制的任务（如远程工作节点上传结果后的写出）传 False 直接进入该阶段
+        """
+        first = self.stages[0]
+        target = self.get_stage(stage) if stage else first
+        if target is not first and admit and first.limiter and not job.holds_slot:
+            job.enter_at = target.name
+            target = first
+        target.submit(job)
+
+    def get_stage(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+
+    def get_queue_size(self):
+        """所有阶段排队中的任务数"""
+        return sum(stage.queue.qsize() for stage in self.stages)
+
+    def get_status(self):
+        """各阶段状态"""
+        return {stage.name: stage.get_status() for stage in self.stages}
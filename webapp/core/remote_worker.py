@@ -0,0 +1,357 @@
+"""
+远程转录工作节点
+独立进程通过HTTP从Web应用领取任务，在本机下载和转录，过程中上报进度（同时续约），完成后上传转录结果。
+LocalTransport 通过Flask测试客户端调用同一套接口，可以在Web应用进程内运行替身工作节点。
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import socket
+import logging
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+try:
+    import whisper  # noqa: F401
+    WHISPER_AVAILABLE = True
+except ImportError:
+    WHISPER_AVAILABLE = False
+
+from src.transcriber import get_model_pool, transcribe_windowed, StreamingAudio
+from webapp.core.cancellation import CancellationToken, TaskCancelledException
+from webapp.core.media_cache import file_sha256, transcribe_options
+from webapp.core.error_handler import LOCAL_WORKER_ENVIRON_KEY
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = '/api/workers'
+
+
+class HttpTransport:
+    """通过HTTP访问Web应用的工作节点接口"""
+
+    def __init__(self, server_url, token=None, timeout=30):
+        self.server_url = server_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def post(self, path, payload):
+        """
+        发送请求
+
+        Returns:
+            tuple: (HTTP状态码, 响应JSON)
+        """
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['X-Worker-Token'] = self.token
+        request = urllib.request.Request(
+            self.server_url + path,
+            data=json.dumps(payload, ensure_ascii=False, default=float).encode('utf-8'),
+            headers=headers,
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read().decode('utf-8') or '{}')
+        except urllib.error.HTTPError as e:
+            try:
+                body = json.loads(e.read().decode('utf-8') or '{}')
+            except ValueError:
+                body = {}
+            return e.code, body
+
+
+class LocalTransport:
+    """进程内传输：通过Flask测试客户端调用工作节点接口，用于单机测试"""
+
+    def __init__(self, app, token=None):
+        self.client = app.test_client()
+        self.token = token
+
+    def post(self, path, payload):
+        headers = {'X-Worker-Token': self.token} if self.token else {}
+        response = self.client.post(path, json=payload, headers=headers,
+                                    environ_base={LOCAL_WORKER_ENVIRON_KEY: True})
+        return response.status_code, response.get_json(silent=True) or {}
+
+
+class RemoteWorker:
+    """拉取式转录工作节点"""
+
+    def __init__(self, transport, worker_id=None, models=None, work_dir=None, poll_interval=5,
+                 window_seconds=180, proxy_url=None, device=None):
+        """
+        初始化工作节点
+
+        Args:
+            transport: HttpTransport 或 LocalTransport
+            worker_id: 工作节点ID，默认由主机名和进程号生成
+            models: 支持的模型列表，为空表示不限
+            work_dir: 下载音频的工作目录
+            poll_interval: 没有任务时的轮询间隔（秒）
+            window_seconds: 转录窗口时长（秒），每个窗口完成后上报片段
+            proxy_url: 任务要求使用代理时传给yt-dlp的代理地址
+            device: Whisper运行设备，默认自动检测
+        """
+        self.transport = transport
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.models = list(models) if models else None
+        self.work_dir = work_dir or os.path.join(tempfile.gettempdir(), 'bili2text-worker', self.worker_id)
+        self.poll_interval = poll_interval
+        self.window_seconds = window_seconds
+        self.proxy_url = proxy_url
+        self.device = device
+        self.completed = 0
+        self.failed = 0
+        self._report_lock = threading.Lock()
+
+    def run(self, stop_event=None):
+        """持续领取并处理任务，直到 stop_event 被设置"""
+        stop_event = stop_event or threading.Event()
+        logger.info(f"工作节点已启动: {self.worker_id}")
+        while not stop_event.is_set():
+            try:
+                processed = self.run_once()
+            except Exception as e:
+                logger.error(f"工作节点 {self.worker_id} 请求失败: {e}")
+                processed = False
+            if not processed:
+                stop_event.wait(self.poll_interval)
+        logger.info(f"工作节点已停止: {self.worker_id}")
+
+    def run_once(self):
+        """领取并处理一个任务，没有任务时返回 False"""
+        status_code, body = self.transport.post(f'{API_PREFIX}/lease', {
+            'worker_id': self.worker_id,
+            'models': self.models,
+            'info': {
+                'hostname': socket.gethostname(),
+                'pid': os.getpid(),
+                'device': self.device or 'auto',
+                'whisper': WHISPER_AVAILABLE
+            }
+        })
+        if status_code != 200:
+            raise Exception(f"领取任务失败 ({status_code}): {body.get('error', body)}")
+
+        task = (body.get('data') or {}).get('task')
+        if not task:
+            return False
+
+        self._process(task)
+        return True
+
+    def _process(self, task):
+        """处理一个任务：下载、转录、上传结果，期间定期上报进度续约"""
+        task_id = task['task_id']
+        token = CancellationToken()
+        state = {'status': 'downloading', 'progress': 0, 'stage': f'工作节点 {self.worker_id} 正在下载...'}
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat_loop,
+            args=(task_id, token, state, task.get('heartbeat_interval', 15), heartbeat_stop),
+            name=f'worker-heartbeat-{task_id}',
+            daemon=True
+        )
+        heartbeat.start()
+
+        task_dir = os.path.join(self.work_dir, task_id)
+        try:
+            started = time.time()
+            audio_path, video_info = self._download(task, task_dir, token)
+            timings = {'download': time.time() - started}
+            if audio_path and os.path.exists(audio_path):
+                timings['bytes_downloaded'] = os.path.getsize(audio_path)
+            state.update(status='transcribing', progress=10, stage=f'工作节点 {self.worker_id} 正在转录...')
+            self._report(task_id, token, **state)
+
+            started = time.time()
+            result, audio_sha256 = self._transcribe(task, audio_path, video_info, token, state)
+            timings['transcribe'] = time.time() - started
+            token.raise_if_cancelled()
+            heartbeat_stop.set()
+
+            status_code, body = self.transport.post(f'{API_PREFIX}/tasks/{task_id}/complete', {
+                'worker_id': self.worker_id,
+                'result': result,
+                'video_info': video_info,
+                'audio_sha256': audio_sha256,
+                'timings': timings
+            })
+            if status_code != 200:
+                raise Exception(f"上传结果失败 ({status_code}): {body.get('error', body)}")
+            self.completed += 1
+            logger.info(f"工作节点 {self.worker_id} 完成任务: {task_id}")
+        except TaskCancelledException as e:
+            # 取消和租约丢失时服务端已处理任务状态
+            logger.info(f"工作节点 {self.worker_id} 停止处理任务 {task_id}: {e.reason}")
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"工作节点 {self.worker_id} 处理任务失败 {task_id}: {e}")
+            self.transport.post(f'{API_PREFIX}/tasks/{task_id}/fail', {
+                'worker_id': self.worker_id,
+                'error': str(e)
+            })
+        finally:
+            heartbeat_stop.set()
+            heartbeat.join(timeout=5)
+            shutil.rmtree(task_dir, ignore_errors=True)
+
+    def _heartbeat_loop(self, task_id, token, state, interval, stop_event):
+        """定期上报当前进度，保持租约"""
+        while not stop_event.wait(interval):
+            try:
+                self._report(task_id, token, **state)
+            except Exception as e:
+                logger.warning(f"工作节点心跳失败 {task_id}: {e}")
+
+    def _report(self, task_id, token, **payload):
+        """上报进度，任务已取消或租约丢失时取消本地处理"""
+        if token.cancelled:
+            return
+        with self._report_lock:
+            status_code, body = self.transport.post(
+                f'{API_PREFIX}/tasks/{task_id}/progress',
+                dict(payload, worker_id=self.worker_id)
+            )
+        if status_code == 409:
+            token.cancel('lease_lost')
+        elif status_code == 200 and (body.get('data') or {}).get('cancelled'):
+            token.cancel('cancelled')
+
+    def _download(self, task, task_dir, token):
+        """使用yt-dlp下载音频"""
+        os.makedirs(task_dir, exist_ok=True)
+        audio_path = os.path.join(task_dir, 'audio.m4a')
+        cmd = [
+            'yt-dlp',
+            '--extract-audio',
+            '--audio-format', 'm4a',
+            '--audio-quality', '0',
+            '--output', audio_path.replace('.m4a', '.%(ext)s'),
+            '--write-info-json',
+            '--no-playlist'
+        ]
+        if task.get('options', {}).get('use_proxy') and self.proxy_url:
+            cmd.extend(['--proxy', self.proxy_url])
+        cmd.append(task['url'])
+
+        try:
+            result = token.run_process(cmd, timeout=1800)
+        except subprocess.TimeoutExpired:
+            raise Exception("下载超时")
+        if result.returncode != 0 or not os.path.exists(audio_path):
+            raise Exception(f"下载失败: {result.stderr}")
+
+        video_info = {}
+        info_path = audio_path.replace('.m4a', '.info.json')
+        if os.path.exists(info_path):
+            try:
+                with open(info_path, 'r', encoding='utf-8') as f:
+                    info_data = json.load(f)
+                video_info = {
+                    'title': info_data.get('title', ''),
+                    'uploader': info_data.get('uploader', ''),
+                    'duration': info_data.get('duration', 0),
+                    'view_count': info_data.get('view_count', 0),
+                    'upload_date': info_data.get('upload_date', ''),
+                    'description': (info_data.get('description') or '')[:500]
+                }
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取视频信息失败: {e}")
+        return audio_path, video_info
+
+    def _transcribe(self, task, audio_path, video_info, token, state):
+        """
+        流式解码并按窗口转录，每个窗口完成后上报片段
+
+        Returns:
+            tuple: (转录结果, 音频SHA256)；模拟模式下哈希为 None，服务端不缓存模拟结果
+        """
+        task_id = task['task_id']
+
+        def on_segments(segments, decoded_seconds, total_seconds):
+            progress = 15 + int(75 * min(decoded_seconds, total_seconds) / total_seconds) if total_seconds else 90
+            state.update(progress=progress)
+            self._report(task_id, token, segments=segments,
+                         decoded_seconds=decoded_seconds, total_seconds=total_seconds)
+
+        if not WHISPER_AVAILABLE:
+            return self._simulate_transcribe(task, video_info, token, on_segments), None
+
+        whisper_options = transcribe_options(task.get('options', {}))
+
+        duration = video_info.get('duration') or task.get('duration')
+        with get_model_pool().lease(task['model_name'], device=self.device) as pooled_model:
+            with StreamingAudio(audio_path, duration=duration) as stream, token.track(stream.process):
+                try:
+                    result = transcribe_windowed(
+                        pooled_model, stream,
+                        window_seconds=self.window_seconds,
+                        on_segments=on_segments,
+                        before_window=token.raise_if_cancelled,
+                        **whisper_options
+                    )
+                except TaskCancelledException:
+                    raise
+                except Exception:
+                    # 取消时ffmpeg被终止导致的读取失败按取消处理
+                    token.raise_if_cancelled()
+                    raise
+
+        return result, file_sha256(audio_path)
+
+    def _simulate_transcribe(self, task, video_info, token, on_segments):
+        """模拟转录（未安装Whisper时用于测试工作节点协议）"""
+        segments = []
+        texts = ['大家好，欢迎观看这个视频。', '这是远程工作节点生成的模拟转录结果。']
+        for index, text in enumerate(texts):
+            token.raise_if_cancelled()
+            token.wait(0.5)
+            segment = {'id': index, 'start': index * 5.0, 'end': (index + 1) * 5.0, 'text': text}
+            segments.append(segment)
+            on_segments([segment], (index + 1) * 5.0, len(texts) * 5.0)
+        token.raise_if_cancelled()
+
+        return {
+            'text': ''.join(segment['text'] for segment in segments),
+            'segments': segments,
+            'language': 'zh',
+            'note': f'这是工作节点 {self.worker_id} 的模拟转录结果'
+        }
+
+
+def start_local_workers(app, count, poll_interval=1):
+    """
+    在Web应用进程内启动替身工作节点，通过测试客户端走完整的工作节点协议
+
+    Returns:
+        tuple: (停止事件, 线程列表)
+    """
+    stop_event = threading.Event()
+    threads = []
+    for index in range(count):
+        worker = RemoteWorker(
+            LocalTransport(app, app.config.get('WORKER_TOKEN')),
+            worker_id=f'local-{index}',
+            poll_interval=poll_interval,
+            window_seconds=app.config.get('TRANSCRIBE_WINDOW_SECONDS', 180) or 180,
+            proxy_url=app.config.get('PROXY_URL')
+        )
+        thread = threading.Thread(target=worker.run, args=(stop_event,), name=f'local-worker-{index}', daemon=True)
+        thread.start()
+        threads.append(thread)
+    if count:
+        logger.info(f"已启动 {count} 个进程内替身工作节点")
+    return stop_event, threads
@@ -0,0 +1,438 @@
+"""
+任务调度器
+按预估成本、显式优先级和客户端公平份额决定任务的出队顺序，替代FIFO队列
+"""
+
+import heapq
+import math
+import queue
+import threading
+import time
+import logging
+from collections import defaultdict, deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 各模型处理每秒音频所需的计算时间（秒），用于估算任务成本
+MODEL_COST_FACTORS = {
+    'tiny': 0.05,
+    'base': 0.08,
+    'small': 0.15,
+    'medium': 0.3,
+    'large': 0.6,
+    'large-v3': 0.6
+}
+
+# 未探测到时长时使用的默认视频时长（秒）
+DEFAULT_DURATION = 600
+
+# 下载、解码等与模型无关的固定开销（秒）
+FIXED_OVERHEAD = 10
+
+
+def estimate_cost(duration, model_name):
+    """估算任务处理耗时（秒）"""
+    duration = duration if duration else DEFAULT_DURATION
+    return FIXED_OVERHEAD + duration * MODEL_COST_FACTORS.get(model_name, 0.3)
+
+
+class SchedulingPolicy:
+    """调度策略基类，sort_key 越小越先调度"""
+
+    name = 'base'
+
+    def sort_key(self, job, now, scheduler):
+        raise NotImplementedError
+
+
+class FIFOPolicy(SchedulingPolicy):
+    """先进先出"""
+
+    name = 'fifo'
+
+    def sort_key(self, job, now, scheduler):
+        return (job.submitted_at,)
+
+
+class PriorityPolicy(SchedulingPolicy):
+    """按显式优先级调度，同优先级先进先出"""
+
+    name = 'priority'
+
+    def sort_key(self, job, now, scheduler):
+        return (-job.priority, job.submitted_at)
+
+
+class ShortestJobFirstPolicy(SchedulingPolicy):
+    """最短作业优先，等待时间越长有效成本越低以防止饥饿"""
+
+    name = 'sjf'
+
+    def __init__(self, aging_factor=1.0):
+        self.aging_factor = aging_factor
+
+    def sort_key(self, job, now, scheduler):
+        wait = now - job.submitted_at
+        return (-job.priority, job.cost - self.aging_factor * wait, job.submitted_at)
+
+
+class FairSharePolicy(SchedulingPolicy):
+    """按客户端公平份额调度：近期占用越多的客户端越靠后，同时叠加最短作业优先和老化"""
+
+    name = 'fair'
+
+    def __init__(self, aging_factor=1.0):
+        self.aging_factor = aging_factor
+
+    def sort_key(self, job, now, scheduler):
+        wait = now - job.submitted_at
+        usage = scheduler.get_client_usage(job.client_id, now)
+        return (-job.priority, usage + job.cost - self.aging_factor * wait, job.submitted_at)
+
+
+POLICIES = {
+    FIFOPolicy.name: FIFOPolicy,
+    PriorityPolicy.name: PriorityPolicy,
+    ShortestJobFirstPolicy.name: ShortestJobFirstPolicy,
+    FairSharePolicy.name: FairSharePolicy
+}
+
+
+def create_policy(name, **kwargs):
+    """根据名称创建调度策略"""
+    if name not in POLICIES:
+        raise ValueError(f"不支持的调度策略: {name}")
+    policy_class = POLICIES[name]
+    if policy_class in (FIFOPolicy, PriorityPolicy):
+        return policy_class()
+    return policy_class(**kwargs)
+
+
+class TaskScheduler:
+    """
+    任务调度队列
+
+    实现 put/get/qsize 接口，可直接作为流水线阶段的输入队列。
+    队列中的任务需要带有 task_id、model_name、priority、client_id、duration、submitted_at 属性。
+
+    模型亲和：在按调度策略排在最前的 affinity_window 个任务中，优先取出与上一个任务模型相同的任务，
+    使连续的任务复用已加载的模型；任务第一次因模型亲和被跳过后，最多再被跳过 affinity_max_wait 秒。
+    """
+
+    def __init__(self, policy=None, usage_half_life=600, affinity_window=0, affinity_max_wait=300):
+        """
+        初始化调度器
+
+        Args:
+            policy: 调度策略，默认公平份额策略
+            usage_half_life: 客户端占用量的衰减半衰期（秒）
+            affinity_window: 模型亲和的重排窗口（任务数），0 或 1 表示不重排
+            affinity_max_wait: 任务因模型亲和被推迟的最长时间（秒）
+        """
+        self.policy = policy or FairSharePolicy()
+        self.usage_half_life = usage_half_life
+        self.affinity_window = affinity_window
+        self.affinity_max_wait = affinity_max_wait
+        self._jobs = []
+        self._client_usage = defaultdict(lambda: (0.0, 0.0))
+        self._condition = threading.Condition()
+        self.dispatched = 0
+        self.affinity_picks = 0
+        self.model_swaps = 0
+        self._last_model = None
+        # 最近24小时内模型切换的时间，用于按小时统计
+        self._swap_times = deque()
+
+    def set_policy(self, policy):
+        """切换调度策略"""
+        with self._condition:
+            self.policy = policy
+        logger.info(f"调度策略已切换为: {policy.name}")
+
+    def set_affinity(self, window=None, max_wait=None):
+        """调整模型亲和的重排窗口和最长推迟时间"""
+        with self._condition:
+            if window is not None:
+                self.affinity_window = window
+            if max_wait is not None:
+                self.affinity_max_wait = max_wait
+
+    def put(self, job, block=True, timeout=None):
+        """加入任务"""
+        job.cost = estimate_cost(job.duration, job.model_name)
+        with self._condition:
+            self._jobs.append(job)
+            self._condition.notify()
+
+    def get(self, block=True, timeout=None):
+        """按调度策略取出下一个任务"""
+        with self._condition:
+            if not self._jobs:
+                if not block:
+                    raise queue.Empty
+                self._condition.wait(timeout)
+                if not self._jobs:
+                    raise queue.Empty
+
+            now = time.time()
+            job = self._select(now)
+            self._jobs.remove(job)
+            self._record_dispatch(job, now)
+            return job
+
+    def take(self, accept=None):
+        """
+        不阻塞地取出下一个满足条件的任务（远程工作节点领取任务）
+
+        Args:
+            accept: 过滤函数 accept(job) -> bool，例如只领取工作节点支持的模型
+
+        Returns:
+            任务，没有满足条件的任务时返回 None
+        """
+        with self._condition:
+            now = time.time()
+            candidates = [job for job in self._jobs if accept is None or accept(job)]
+            if not candidates:
+                return None
+
+            job = self._select(now, candidates)
+            self._jobs.remove(job)
+            self._record_dispatch(job, now)
+            return job
+
+    def qsize(self):
+        with self._condition:
+            return len(self._jobs)
+
+    def remove(self, task_id):
+        """移除排队中的任务，返回被移除的任务"""
+        with self._condition:
+            for job in self._jobs:
+                if job.task_id == task_id:
+                    self._jobs.remove(job)
+                    return job
+        return None
+
+    def get_position(self, task_id):
+        """
+        按当前调度顺序计算任务的排队位置
+
+        Returns:
+            tuple: (前面的任务数, 前面任务的预估成本之和)，任务不在队列中时返回 (None, 0)
+        """
+        with self._condition:
+            now = time.time()
+            ordered = sorted(self._jobs, key=lambda job: self.policy.sort_key(job, now, self))
+            cost_ahead = 0.0
+            for position, job in enumerate(ordered):
+                if job.task_id == task_id:
+                    return position, cost_ahead
+                cost_ahead += job.cost
+        return None, 0.0
+
+    def update_duration(self, task_id, duration):
+        """更新任务的探测时长并重新估算成本"""
+        with self._condition:
+            for job in self._jobs:
+                if job.task_id == task_id:
+                    job.duration = duration
+                    job.cost = estimate_cost(duration, job.model_name)
+                    return True
+        return False
+
+    def get_client_usage(self, client_id, now):
+        """获取客户端近期占用的处理成本（按半衰期指数衰减）"""
+        usage, updated_at = self._client_usage[client_id]
+        if not usage:
+            return 0.0
+        return usage * math.pow(0.5, (now - updated_at) / self.usage_half_life)
+
+    def get_status(self):
+        """获取调度器状态"""
+        with self._condition:
+            now = time.time()
+            self._prune_swaps(now)
+            hourly = defaultdict(int)
+            for swapped_at in self._swap_times:
+                hourly[int(swapped_at // 3600) * 3600] += 1
+
+            return {
+                'policy': self.policy.name,
+                'queued': len(self._jobs),
+                'dispatched': self.dispatched,
+                'queued_cost': round(sum(job.cost for job in self._jobs), 1),
+                'affinity': {
+                    'window': self.affinity_window,
+                    'max_wait': self.affinity_max_wait,
+                    'picks': self.affinity_picks,
+                    'last_model': self._last_model,
+                    'queued_models': dict(self._count_models()),
+                    'model_swaps': self.model_swaps,
+                    'model_swaps_last_hour': sum(1 for t in self._swap_times if t > now - 3600),
+                    'model_swaps_per_hour': [
+                        {'hour': datetime.utcfromtimestamp(hour).isoformat(), 'swaps': count}
+                        for hour, count in sorted(hourly.items())
+                    ]
+                }
+            }
+
+    def _select(self, now, jobs=None):
+        """按调度策略选出下一个任务，重排窗口内有与上一个任务模型相同的任务时优先取出"""
+        jobs = self._jobs if jobs is None else jobs
+        sort_key = lambda job: self.policy.sort_key(job, now, self)
+        head = min(jobs, key=sort_key)
+
+        if self.affinity_window <= 1 or self._last_model is None or head.model_name == self._last_model:
+            return head
+
+        window = heapq.nsmallest(self.affinity_window, jobs, key=sort_key)
+        for index, job in enumerate(window):
+            if job.model_name == self._last_model and job.priority >= head.priority:
+                for bypassed in window[:index]:
+                    bypassed.bypassed_at = bypassed.bypassed_at or now
+                self.affinity_picks += 1
+                return job
+            # 已被推迟足够久的任务不能再被跳过
+            if job.bypassed_at is not None and now - job.bypassed_at >= self.affinity_max_wait:
+                break
+        return head
+
+    def _record_dispatch(self, job, now):
+        """记录出队的任务：客户端占用量和模型切换"""
+        self._record_usage(job.client_id, job.cost, now)
+        self.dispatched += 1
+        if self._last_model is not None and job.model_name != self._last_model:
+            self.model_swaps += 1
+            self._swap_times.append(now)
+            self._prune_swaps(now)
+        self._last_model = job.model_name
+
+    def _prune_swaps(self, now):
+        while self._swap_times and self._swap_times[0] <= now - 86400:
+            self._swap_times.popleft()
+
+    def _count_models(self):
+        counts = defaultdict(int)
+        for job in self._jobs:
+            counts[job.model_name] += 1
+        return counts
+
+    def _record_usage(self, client_id, cost, now):
+        self._client_usage[client_id] = (self.get_client_usage(client_id, now) + cost, now)
+
+
+class ThroughputMeter:
+    """按最近完成的任务估算处理吞吐量"""
+
+    def __init__(self, window=3600, max_samples=50):
+        """
+        Args:
+            window: 统计窗口（秒），更早的完成记录不参与计算
+            max_samples: 最多保留的完成记录数
+        """
+        self.window = window
+        self._completions = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, now=None):
+        """记录一个任务完成"""
+        with self._lock:
+            self._completions.append(now or time.time())
+
+    def get_rate(self, now=None):
+        """每秒完成的任务数，样本不足时返回 None"""
+        now = now or time.time()
+        with self._lock:
+            while self._completions and self._completions[0] < now - self.window:
+                self._completions.popleft()
+            if len(self._completions) < 2:
+                return None
+            span = self._completions[-1] - self._completions[0]
+            return (len(self._completions) - 1) / span if span > 0 else None
+
+
+class _SimulatedJob:
+    """回放工作负载时使用的任务"""
+
+    def __init__(self, index, record):
+        self.task_id = record.get('task_id', f'job_{index}')
+        self.model_name = record.get('model_name', 'medium')
+        self.priority = record.get('priority', 0)
+        self.client_id = record.get('client_id', 'default')
+        self.duration = record.get('duration') or DEFAULT_DURATION
+        self.arrival = record.get('arrival', 0)
+        self.submitted_at = self.arrival
+        self.bypassed_at = None
+        self.cost = estimate_cost(self.duration, self.model_name)
+
+
+def simulate_workload(policy, workload, workers=1, affinity_window=0, affinity_max_wait=300, swap_cost=0):
+    """
+    按给定策略离线回放工作负载，用于比较调度策略
+
+    Args:
+        policy: 调度策略
+        workload: 任务记录列表，每项包含 arrival（提交时间，秒）、duration、model_name、
+                  priority、client_id
+        workers: 并行工作槽数量
+        affinity_window: 模型亲和的重排窗口（任务数）
+        affinity_max_wait: 模型亲和最多推迟的等待时间（秒）
+        swap_cost: 工作槽切换到其他模型时额外的加载耗时（秒）
+
+    Returns:
+        dict: 平均/P95/最大等待时间、平均完成时间、各客户端的平均等待时间以及工作槽的模型切换次数
+    """
+    jobs = sorted((_SimulatedJob(i, r) for i, r in enumerate(workload)), key=lambda j: j.arrival)
+    scheduler = TaskScheduler(policy, affinity_window=affinity_window, affinity_max_wait=affinity_max_wait)
+    free_at = [0.0] * workers
+    slot_models = [None] * workers
+    model_swaps = 0
+    waits = []
+    turnarounds = []
+    client_waits = defaultdict(list)
+    pending = list(jobs)
+
+    while pending or scheduler._jobs:
+        # 空闲最早的工作槽
+        slot = min(range(workers), key=lambda i: free_at[i])
+        now = free_at[slot]
+        if not scheduler._jobs and pending and pending[0].arrival > now:
+            now = pending[0].arrival
+        while pending and pending[0].arrival <= now:
+            scheduler._jobs.append(pending.pop(0))
+
+        job = scheduler._select(now)
+        scheduler._jobs.remove(job)
+        scheduler._record_dispatch(job, now)
+
+        cost = job.cost
+        if slot_models[slot] != job.model_name:
+            if slot_models[slot] is not None:
+                model_swaps += 1
+            cost += swap_cost
+            slot_models[slot] = job.model_name
+
+        wait = now - job.arrival
+        free_at[slot] = now + cost
+        waits.append(wait)
+        turnarounds.append(free_at[slot] - job.arrival)
+        client_waits[job.client_id].append(wait)
+
+    if not waits:
+        return {}
+
+    ordered = sorted(waits)
+    return {
+        'policy': policy.name,
+        'jobs': len(waits),
+        'mean_wait': sum(waits) / len(waits),
+        'p95_wait': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max_wait': ordered[-1],
+        'mean_turnaround': sum(turnarounds) / len(turnarounds),
+        'model_swaps': model_swaps,
+        'client_mean_wait': {
+            client: sum(values) / len(values) for client, values in client_waits.items()
+        }
+    }
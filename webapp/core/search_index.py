@@ -0,0 +1,273 @@
+"""
+全文检索索引
+基于SQLite FTS5：task_search 索引已完成任务的标题和UP主，segment_search 索引转录片段（rowid 与片段ID相同）。
+FTS5自带的分词器不能切分中文，写入和查询前先把中日韩文字切成相邻两字的二元组、其他文字按单词切分，
+以空格连接后交给 unicode61 分词器；片段的原文和时间戳从 transcript_segments 表读取，删除片段时由触发器同步删除索引。
+任务完成时增量写入索引；非SQLite数据库或SQLite未编译FTS5时检索不可用。
+"""
+
+import re
+import html
+import logging
+
+from sqlalchemy import text, inspect
+from sqlalchemy.exc import OperationalError
+
+from webapp.core.database import db, Task, TranscriptSegment
+
+logger = logging.getLogger(__name__)
+
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+# 连续的中日韩文字，或不含中日韩文字的单词
+_TOKEN_PATTERN = re.compile(f'[{_CJK}]+|[^\\W_{_CJK}]+')
+_CJK_PATTERN = re.compile(f'[{_CJK}]')
+
+# 单次检索最多读取的片段命中数，结果按任务聚合后分页
+MAX_SEGMENT_HITS = 1000
+# 每个任务返回的片段数
+SEGMENTS_PER_TASK = 3
+# 任务得分中标题/UP主命中的权重（相对于片段命中）
+METADATA_WEIGHT = 2.0
+# 摘要长度（字符）
+SNIPPET_LENGTH = 120
+
+_available = False
+
+
+def is_search_available():
+    """全文检索是否可用"""
+    return _available
+
+
+def tokenize(value):
+    """把文本切分为索引词：中日韩文字取相邻两字的二元组，其他文字按单词切分并转为小写"""
+    tokens = []
+    for run in _TOKEN_PATTERN.findall((value or '').lower()):
+        if _CJK_PATTERN.match(run):
+            tokens.extend(run[i:i + 2] for i in range(max(len(run) - 1, 1)))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def build_match_query(query):
+    """
+    把用户输入转换为FTS5查询表达式
+
+    每个单词或连续的中文作为一个短语（二元组依次相连），各短语之间为“与”；
+    单个汉字无法组成二元组，按前缀匹配以它开头的二元组。
+
+    Returns:
+        str: FTS5查询表达式，输入中没有可检索的词时返回 None
+    """
+    phrases = []
+    for run in _TOKEN_PATTERN.findall(query.lower()):
+        if _CJK_PATTERN.match(run) and len(run) == 1:
+            phrases.append(f'"{run}"*')
+        else:
+            phrases.append('"' + ' '.join(tokenize(run)) + '"')
+    return ' AND '.join(phrases) or None
+
+
+def init_search_index():
+    """
+    创建全文检索表和同步删除的触发器，新建索引时为已完成的任务补建索引
+
+    Returns:
+        bool: 全文检索是否可用
+    """
+    global _available
+    if db.engine.dialect.name != 'sqlite':
+        logger.info("全文检索需要SQLite FTS5，当前数据库不支持")
+        return False
+
+    created = not inspect(db.engine).has_table('segment_search')
+    try:
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS task_search "
+            "USING fts5(task_id UNINDEXED, title, uploader, tokenize='unicode61')"
+        ))
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS segment_search USING fts5(text, tokenize='unicode61')"
+        ))
+        db.session.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS transcript_segments_search_delete "
+            "AFTER DELETE ON transcript_segments BEGIN "
+            "DELETE FROM segment_search WHERE rowid = old.id; END"
+        ))
+        db.session.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS tasks_search_delete "
+            "AFTER DELETE ON tasks BEGIN "
+            "DELETE FROM task_search WHERE task_id = old.task_id; END"
+        ))
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        logger.warning(f"SQLite不支持FTS5，全文检索不可用: {e}")
+        return False
+
+    _available = True
+    if created:
+        rebuild_search_index()
+    return True
+
+
+def rebuild_search_index(batch_size=100):
+    """为所有已保存转录片段的已完成任务重建索引"""
+    if not _available:
+        return 0
+
+    db.session.execute(text("DELETE FROM task_search"))
+    db.session.execute(text("DELETE FROM segment_search"))
+    db.session.commit()
+
+    indexed = 0
+    last_created = None
+    while True:
+        query = Task.query.filter(Task.status == 'completed', Task.segment_count.isnot(None))
+        if last_created is not None:
+            query = query.filter(Task.created_at > last_created)
+        tasks = query.order_by(Task.created_at).limit(batch_size).all()
+        if not tasks:
+            break
+        for task in tasks:
+            index_task(task)
+        db.session.commit()
+        indexed += len(tasks)
+        last_created = tasks[-1].created_at
+
+    logger.info(f"全文检索索引已重建: {indexed} 个任务")
+    return indexed
+
+
+def index_task(task):
+    """
+    为完成的任务写入索引（标题、UP主和已保存的转录片段），随下一次提交生效
+
+    在保存点中执行，索引失败只记录日志，不影响任务完成。
+    """
+    if not _available:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(text("DELETE FROM task_search WHERE task_id = :task_id"), {'task_id': task.task_id})
+            db.session.execute(
+                text("INSERT INTO task_search (task_id, title, uploader) VALUES (:task_id, :title, :uploader)"),
+                {
+                    'task_id': task.task_id,
+                    'title': ' '.join(tokenize(task.title)),
+                    'uploader': ' '.join(tokenize(task.get_video_info().get('uploader')))
+                }
+            )
+
+            rows = db.session.query(TranscriptSegment.id, TranscriptSegment.text).filter(
+                TranscriptSegment.task_id == task.task_id
+            ).all()
+            if rows:
+                db.session.execute(
+                    text("INSERT OR REPLACE INTO segment_search (rowid, text) VALUES (:id, :text)"),
+                    [{'id': segment_id, 'text': ' '.join(tokenize(segment_text))} for segment_id, segment_text in rows]
+                )
+    except Exception as e:
+        logger.warning(f"写入全文检索索引失败 {task.task_id}: {e}")
+
+
+def search(query, limit=20, offset=0):
+    """
+    全文检索已完成的任务
+
+    片段命中按 bm25 排序，取前 MAX_SEGMENT_HITS 条按任务聚合：任务得分为标题/UP主命中得分与
+    前 SEGMENTS_PER_TASK 个片段命中得分之和。
+
+    Returns:
+        dict: total 为命中的任务数，results 为当前页的任务及命中片段（含时间戳和高亮摘要）
+    """
+    match = build_match_query(query)
+    if not match:
+        return {'total': 0, 'results': []}
+
+    scores = {}
+    segment_hits = {}
+    # bm25 越小越相关，取相反数作为得分
+    rows = db.session.execute(text(
+        "SELECT s.task_id, s.seq, s.start, s.\"end\", s.text, bm25(segment_search) AS rank "
+        "FROM segment_search JOIN transcript_segments s ON s.id = segment_search.rowid "
+        "WHERE segment_search MATCH :match ORDER BY rank LIMIT :limit"
+    ), {'match': match, 'limit': MAX_SEGMENT_HITS}).all()
+    for task_id, seq, start, end, segment_text, rank in rows:
+        hits = segment_hits.setdefault(task_id, [])
+        if len(hits) < SEGMENTS_PER_TASK:
+            scores[task_id] = scores.get(task_id, 0) - rank
+            hits.append({'index': seq, 'start': start, 'end': end, 'text': segment_text})
+
+    metadata_hits = db.session.execute(text(
+        "SELECT task_id, bm25(task_search, 0, 2.0, 1.0) AS rank FROM task_search WHERE task_search MATCH :match"
+    ), {'match': match}).all()
+    for task_id, rank in metadata_hits:
+        scores[task_id] = scores.get(task_id, 0) - METADATA_WEIGHT * rank
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    page = ranked[offset:offset + limit]
+    tasks = {
+        task.task_id: task
+        for task in Task.query.filter(
+            Task.task_id.in_([task_id for task_id, _ in page]),
+            Task.status == 'completed'
+        ).all()
+    }
+
+    terms = _highlight_terms(query)
+    results = []
+    for task_id, score in page:
+        task = tasks.get(task_id)
+        if not task:
+            continue
+        results.append({
+            'task_id': task_id,
+            'title': task.title,
+            'uploader': task.get_video_info().get('uploader'),
+            'duration': task.duration,
+            'completed_at': task.completed_at.isoformat() if task.completed_at else None,
+            'score': round(score, 4),
+            'title_snippet': _snippet(task.title or '', terms),
+            'segments': [
+                {
+                    'index': hit['index'],
+                    'start': hit['start'],
+                    'end': hit['end'],
+                    'snippet': _snippet(hit['text'], terms)
+                }
+                for hit in segment_hits.get(task_id, [])
+            ]
+        })
+
+    return {'total': len(ranked), 'results': results}
+
+
+def _highlight_terms(query):
+    """高亮用的检索词（原文中按不区分大小写匹配）"""
+    terms = sorted(set(_TOKEN_PATTERN.findall(query.lower())), key=len, reverse=True)
+    return re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE) if terms else None
+
+
+def _snippet(value, terms):
+    """截取第一个命中附近的文本，HTML转义后用 <mark> 标记命中的检索词"""
+    value = value.strip()
+    match = terms.search(value) if terms else None
+    start = 0
+    if match and len(value) > SNIPPET_LENGTH:
+        start = max(0, min(match.start() - SNIPPET_LENGTH // 3, len(value) - SNIPPET_LENGTH))
+    window = value[start:start + SNIPPET_LENGTH]
+
+    parts = []
+    last = 0
+    for found in (terms.finditer(window) if terms else []):
+        parts.append(html.escape(window[last:found.start()]))
+        parts.append(f'<mark>{html.escape(found.group())}</mark>')
+        last = found.end()
+    parts.append(html.escape(window[last:]))
+
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if start + SNIPPET_LENGTH < len(value) else ''
+    return prefix + ''.join(parts) + suffix
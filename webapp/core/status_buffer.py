@@ -0,0 +1,146 @@
+"""
+任务状态写缓冲
+同一状态内的进度和阶段更新先合并在内存中，由后台线程按固定间隔在一个事务内批量写入；
+状态变化（包括完成、失败、取消等终态）仍然立即提交，并带上缓冲区中尚未写入的进度
+"""
+
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StatusBuffer:
+    """任务进度写缓冲"""
+
+    def __init__(self):
+        self.app = None
+        self.interval = 0
+        self.flushes = 0
+        self.coalesced = 0
+        self.written = 0
+        # task_id -> (缓冲时的任务状态, 待写入字段)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self._thread is not None
+
+    def init_app(self, app, interval=1.0):
+        """
+        启动批量写入线程
+
+        Args:
+            app: Flask应用
+            interval: 写入间隔（秒），0 表示不缓冲，每次更新立即提交
+        """
+        self.app = app
+        self.interval = interval
+        if interval <= 0 or self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name='task-status-buffer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止写入线程并写入剩余的更新"""
+        thread, self._thread = self._thread, None
+        if thread:
+            self._stop_event.set()
+            thread.join(timeout=5)
+        self.flush()
+
+    def put(self, task_id, status, values):
+        """
+        合并任务的待写入字段
+
+        Args:
+            task_id: 任务ID
+            status: 当前任务状态，写入时任务状态已变化则放弃这些字段
+            values: 待写入的字段
+        """
+        with self._lock:
+            pending = self._pending.get(task_id)
+            if pending is None or pending[0] != status:
+                self._pending[task_id] = (status, dict(values))
+            else:
+                pending[1].update(values)
+                self.coalesced += 1
+
+    def peek(self, task_id):
+        """获取任务尚未写入的字段"""
+        with self._lock:
+            pending = self._pending.get(task_id)
+            return dict(pending[1]) if pending else {}
+
+    def pop(self, task_id):
+        """取出任务尚未写入的字段，由调用方随状态变化一起提交"""
+        with self._lock:
+            pending = self._pending.pop(task_id, None)
+            return pending[1] if pending else {}
+
+    def flush(self):
+        """
+        在一个事务内写入所有待写入的更新
+
+        只更新状态与缓冲时相同的任务，状态已变化（例如已进入终态）时旧的进度不会覆盖新状态。
+        """
+        from webapp.core.database import db, Task
+        from webapp.core.task_cache import task_cache
+
+        with self._lock:
+            if not self._pending or not self.app:
+                return 0
+            pending, self._pending = self._pending, {}
+        # 取出后读取时不再叠加这些进度，先同步到任务状态缓存
+        task_cache.apply_progress(pending)
+
+        try:
+            with self.app.app_context():
+                for task_id, (status, values) in pending.items():
+                    Task.query.filter(
+                        Task.task_id == task_id,
+                        Task.status == status
+                    ).update(
+                        {getattr(Task, key): value for key, value in values.items()},
+                        synchronize_session=False
+                    )
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"批量写入任务进度失败: {e}")
+            # 放回缓冲区等待下次写入，期间产生的新值优先
+            with self._lock:
+                for task_id, (status, values) in pending.items():
+                    newer = self._pending.get(task_id)
+                    if newer is None:
+                        self._pending[task_id] = (status, values)
+                    elif newer[0] == status:
+                        self._pending[task_id] = (status, dict(values, **newer[1]))
+            return 0
+
+        with self._lock:
+            self.flushes += 1
+            self.written += len(pending)
+        return len(pending)
+
+    def get_stats(self):
+        """获取写缓冲统计信息"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'interval': self.interval,
+                'pending': len(self._pending),
+                'flushes': self.flushes,
+                'written': self.written,
+                'coalesced': self.coalesced
+            }
+
+    def _loop(self):
+        while not self._stop_event.wait(self.interval):
+            self.flush()
+
+
+status_buffer = StatusBuffer()
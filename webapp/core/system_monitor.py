@@ -9,37 +9,64 @@ import threading
 import logging
 import psutil
 from datetime import datetime, timedelta
-from collections import deque
 
-from webapp.core.database import db, Task, SystemStatus, get_tasks_by_status
+from src.transcriber import get_model_pool
+from webapp.core.database import db, get_tasks_by_status
+from webapp.core.task_counters import task_counters
+from webapp.core.timeseries import TimeSeriesStore
 
 logger = logging.getLogger(__name__)
 
+# 性能历史记录的指标 -> 系统信息中的字段
+HISTORY_METRICS = {
+    'cpu': 'cpu_usage',
+    'memory': 'memory_usage',
+    'disk': 'disk_usage',
+    'gpu_memory': 'gpu_memory_usage',
+    'active_tasks': 'active_tasks',
+    'pending_tasks': 'pending_tasks'
+}
+
+# 进程内正在采样的监控器：多个监控器会重复计入同一分钟、小时的汇总，并争抢同一次小时压缩
+_active_monitor = None
+_active_monitor_lock = threading.Lock()
+
 class SystemMonitor:
     """系统监控器"""
     
-    def __init__(self):
+    def __init__(self, history_limit=720, minute_retention_hours=48, hour_retention_days=90):
         self.start_time = datetime.utcnow()
         self.monitoring = False
         self.monitor_thread = None
-        self.performance_history = {
-            'cpu': deque(maxlen=100),
-            'memory': deque(maxlen=100),
-            'disk': deque(maxlen=100),
-            'timestamps': deque(maxlen=100)
-        }
+        self.performance_history = TimeSeriesStore(
+            HISTORY_METRICS,
+            raw_capacity=history_limit,
+            minute_retention_hours=minute_retention_hours,
+            hour_retention_days=hour_retention_days
+        )
         
         logger.info("系统监控器已初始化")
     
-    def start_monitoring(self, interval=5):
-        """开始监控"""
+    def start_monitoring(self, interval=5, app=None):
+        """开始监控，app 为空时使用当前应用；同一进程只有一个监控器采样"""
+        global _active_monitor
         if self.monitoring:
             return
         
+        if app is None:
+            from flask import current_app
+            app = current_app._get_current_object()
+        
+        with _active_monitor_lock:
+            if _active_monitor is not None and _active_monitor is not self:
+                logger.warning("本进程已有系统监控器在运行，不再重复启动")
+                return
+            _active_monitor = self
+        
         self.monitoring = True
         self.monitor_thread = threading.Thread(
             target=self._monitor_loop,
-            args=(interval,),
+            args=(app, interval),
             daemon=True
         )
         self.monitor_thread.start()
@@ -47,26 +74,28 @@ class SystemMonitor:
     
     def stop_monitoring(self):
         """停止监控"""
+        global _active_monitor
         self.monitoring = False
         if self.monitor_thread:
             self.monitor_thread.join(timeout=5)
+        with _active_monitor_lock:
+            if _active_monitor is self:
+                _active_monitor = None
         logger.info("系统监控已停止")
     
-    def _monitor_loop(self, interval):
+    def _monitor_loop(self, app, interval):
         """监控循环"""
         while self.monitoring:
             try:
-                # 收集系统信息
-                system_info = self._collect_system_info()
-                
-                # 保存到数据库
-                self._save_system_status(system_info)
-                
-                # 更新性能历史
-                self._update_performance_history(system_info)
-                
-                # 广播系统状态更新
-                self._broadcast_system_update(system_info)
+                with app.app_context():
+                    # 收集系统信息
+                    system_info = self._collect_system_info()
+                    
+                    # 记录到时间序列（原始采样在内存中，按分钟汇总写入数据库）
+                    self._update_performance_history(system_info)
+                    
+                    # 广播系统状态更新
+                    self._broadcast_system_update(system_info)
                 
                 time.sleep(interval)
                 
@@ -118,6 +147,8 @@ class SystemMonitor:
                 'failed_tasks': task_stats['failed'],
                 'uptime': uptime,
                 'version': '2.0.0',
+                'model_pool': self._get_model_pool_stats(),
+                'media_cache': self._get_cache_stats(),
                 'timestamp': datetime.utcnow()
             }
             
@@ -142,67 +173,45 @@ class SystemMonitor:
             'failed_tasks': task_stats['failed'],
             'uptime': uptime,
             'version': '2.0.0',
+            'model_pool': self._get_model_pool_stats(),
+            'media_cache': self._get_cache_stats(),
             'timestamp': datetime.utcnow()
         }
     
     def _get_task_statistics(self):
-        """获取任务统计"""
+        """获取任务统计（读取内存中的状态计数，不查询数据库）"""
+        return {
+            'active': task_counters.get('downloading', 'transcribing'),
+            'pending': task_counters.get('pending'),
+            'completed': task_counters.get('completed'),
+            'failed': task_counters.get('failed')
+        }
+    
+    def _get_model_pool_stats(self):
+        """获取模型池统计（启用转录进程池时为各工作进程的汇总）"""
         try:
-            active_count = Task.query.filter(
-                Task.status.in_(['downloading', 'transcribing'])
-            ).count()
-            
-            pending_count = Task.query.filter_by(status='pending').count()
-            completed_count = Task.query.filter_by(status='completed').count()
-            failed_count = Task.query.filter_by(status='failed').count()
-            
-            return {
-                'active': active_count,
-                'pending': pending_count,
-                'completed': completed_count,
-                'failed': failed_count
-            }
+            from flask import current_app
+            if hasattr(current_app, 'task_manager'):
+                return current_app.task_manager.get_model_pool_stats()
         except Exception as e:
-            logger.error(f"获取任务统计失败: {e}")
-            return {
-                'active': 0,
-                'pending': 0,
-                'completed': 0,
-                'failed': 0
-            }
+            logger.warning(f"获取模型池统计失败: {e}")
+        return get_model_pool().get_stats()
     
-    def _save_system_status(self, system_info):
-        """保存系统状态到数据库"""
+    def _get_cache_stats(self):
+        """获取音频与转录缓存统计"""
         try:
-            status = SystemStatus(
-                cpu_usage=system_info['cpu_usage'],
-                memory_usage=system_info['memory_usage'],
-                disk_usage=system_info['disk_usage'],
-                gpu_available=system_info['gpu_available'],
-                gpu_memory_usage=system_info['gpu_memory_usage'],
-                active_tasks=system_info['active_tasks'],
-                pending_tasks=system_info['pending_tasks'],
-                completed_tasks=system_info['completed_tasks'],
-                failed_tasks=system_info['failed_tasks'],
-                uptime=system_info['uptime'],
-                version=system_info['version']
-            )
-            
-            db.session.add(status)
-            db.session.commit()
-            
+            from flask import current_app
+            if hasattr(current_app, 'task_manager'):
+                return current_app.task_manager.get_cache_stats()
         except Exception as e:
-            logger.error(f"保存系统状态失败: {e}")
-            db.session.rollback()
+            logger.warning(f"获取缓存统计失败: {e}")
+        return {}
     
     def _update_performance_history(self, system_info):
         """更新性能历史数据"""
-        timestamp = system_info['timestamp']
-        
-        self.performance_history['cpu'].append(system_info['cpu_usage'])
-        self.performance_history['memory'].append(system_info['memory_usage'])
-        self.performance_history['disk'].append(system_info['disk_usage'])
-        self.performance_history['timestamps'].append(timestamp)
+        self.performance_history.add_sample(system_info['timestamp'], {
+            metric: system_info.get(field) for metric, field in HISTORY_METRICS.items()
+        })
     
     def _broadcast_system_update(self, system_info):
         """广播系统状态更新"""
@@ -221,34 +230,13 @@ class SystemMonitor:
         return self._collect_system_info()
     
     def get_performance_history(self, hours=1):
-        """获取性能历史数据"""
+        """获取性能历史数据，按时间范围从内存原始采样、分钟汇总或小时汇总中读取"""
         cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-        
-        # 从数据库获取历史数据
         try:
-            history_records = SystemStatus.query.filter(
-                SystemStatus.timestamp >= cutoff_time
-            ).order_by(SystemStatus.timestamp.asc()).all()
-            
-            history_data = {
-                'cpu': [record.cpu_usage for record in history_records],
-                'memory': [record.memory_usage for record in history_records],
-                'disk': [record.disk_usage for record in history_records],
-                'timestamps': [record.timestamp.isoformat() for record in history_records]
-            }
-            
-            return history_data
-            
+            return self.performance_history.get_history(cutoff_time)
         except Exception as e:
             logger.error(f"获取性能历史数据失败: {e}")
-            
-            # 返回内存中的数据
-            return {
-                'cpu': list(self.performance_history['cpu']),
-                'memory': list(self.performance_history['memory']),
-                'disk': list(self.performance_history['disk']),
-                'timestamps': [ts.isoformat() for ts in self.performance_history['timestamps']]
-            }
+            return {'resolution': 'raw', 'timestamps': []}
     
     def get_system_health(self):
         """获取系统健康状态"""
@@ -337,7 +325,15 @@ class SystemMonitor:
                 queue_size = current_app.task_manager.get_queue_size()
                 services['task_manager'] = {
                     'status': 'running',
-                    'message': f'活跃任务: {active_tasks}, 队列: {queue_size}'
+                    'message': f'活跃任务: {active_tasks}, 队列: {queue_size}',
+                    'stages': current_app.task_manager.get_stage_status(),
+                    'scheduler': current_app.task_manager.get_scheduler_status(),
+                    'watchdog': current_app.task_manager.get_watchdog_status(),
+                    'concurrency': current_app.task_manager.get_concurrency_status(),
+                    'status_buffer': current_app.task_manager.get_status_buffer_stats(),
+                    'task_counters': current_app.task_manager.get_task_counter_stats(),
+                    'task_cache': current_app.task_manager.get_task_cache_stats(),
+                    'transcribe_processes': current_app.task_manager.get_transcribe_pool_stats()
                 }
             else:
                 services['task_manager'] = {
@@ -408,24 +404,9 @@ class SystemMonitor:
         
         return services
     
-    def cleanup_old_records(self, days=7):
-        """清理旧的监控记录"""
-        try:
-            cutoff_date = datetime.utcnow() - timedelta(days=days)
-            
-            deleted_count = SystemStatus.query.filter(
-                SystemStatus.timestamp < cutoff_date
-            ).delete()
-            
-            db.session.commit()
-            logger.info(f"已清理 {deleted_count} 条旧的系统状态记录")
-            
-            return deleted_count
-            
-        except Exception as e:
-            logger.error(f"清理旧记录失败: {e}")
-            db.session.rollback()
-            return 0
+    def cleanup_old_records(self):
+        """立即执行一次压缩，清理超过保留期的监控记录（监控循环每小时自动执行）"""
+        return self.performance_history.compact()['deleted']
     
     def get_resource_alerts(self):
         """获取资源警告"""
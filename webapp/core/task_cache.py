@@ -0,0 +1,204 @@
+"""
+任务状态缓存
+任务详情、WebSocket状态查询和结果下载按任务ID频繁轮询，缓存任务的 to_dict() 结果，
+命中时不查询数据库，也不重复解析 options / video_info 的JSON。
+
+缓存是写穿透的：会话 flush 时为新建和修改的任务生成快照，事务提交后写入缓存，回滚时失效，
+删除的任务提交后移出缓存；写缓冲批量写入的进度在写入后同步到缓存，尚未写入的进度在读取时叠加。
+缓存按最近使用淘汰，未结束的任务常驻，已结束的任务超过 TTL 后重新从数据库读取。
+"""
+
+import copy
+import threading
+import logging
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from webapp.core.database import db, Task, get_task_by_id, UNFINISHED_STATUSES
+from webapp.core.status_buffer import status_buffer
+
+logger = logging.getLogger(__name__)
+
+# 会话中已 flush、等待提交的任务快照：{task_id: 快照，删除的任务为 None}
+_SESSION_KEY = 'task_cache_snapshots'
+
+
+class TaskStateCache:
+    """任务状态缓存"""
+
+    def __init__(self, max_size=1000, finished_ttl=300):
+        """
+        Args:
+            max_size: 最多缓存的任务数，0 表示不缓存
+            finished_ttl: 已结束任务的缓存时长（秒）
+        """
+        self.max_size = max_size
+        self.finished_ttl = finished_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # task_id -> (任务快照, 过期时间，未结束的任务为 None)
+        self._entries = OrderedDict()
+        # 每次写入或失效时递增，读库回填前后不一致时放弃回填，避免旧数据覆盖新写入的快照
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def configure(self, max_size=None, finished_ttl=None):
+        """调整缓存大小和已结束任务的缓存时长"""
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if finished_ttl is not None:
+                self.finished_ttl = finished_ttl
+            self._evict()
+
+    def load(self, task_id):
+        """
+        获取任务快照，未命中时从数据库读取并回填
+
+        Returns:
+            dict: 与 Task.to_dict() 相同（包含写缓冲中尚未写入的进度），任务不存在时返回 None
+        """
+        data = self.get(task_id)
+        if data is not None:
+            return data
+
+        with self._lock:
+            version = self._version
+        task = get_task_by_id(task_id)
+        if not task:
+            return None
+        data = task.to_dict()
+        with self._lock:
+            if self._version == version:
+                self._store(task_id, data)
+        # 与 get() 一致返回副本，调用方修改返回值不影响缓存的快照
+        return copy.copy(data)
+
+    def get(self, task_id):
+        """获取缓存的任务快照，未缓存或已过期时返回 None"""
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is not None and entry[1] is not None and entry[1] <= time.time():
+                del self._entries[task_id]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(task_id)
+            self.hits += 1
+            data = copy.copy(entry[0])
+
+        data.update(status_buffer.peek(task_id))
+        return data
+
+    def put(self, task_id, data):
+        """写入任务快照"""
+        with self._lock:
+            self._version += 1
+            self._store(task_id, data)
+
+    def invalidate(self, task_id):
+        """移除任务快照"""
+        with self._lock:
+            self._version += 1
+            self._entries.pop(task_id, None)
+
+    def apply_progress(self, updates):
+        """
+        同步写缓冲已写入数据库的进度
+
+        Args:
+            updates: {task_id: (缓冲时的任务状态, 已写入的字段)}，状态与快照不同的跳过
+        """
+        with self._lock:
+            for task_id, (status, values) in updates.items():
+                entry = self._entries.get(task_id)
+                if entry is not None and entry[0]['status'] == status:
+                    self._entries[task_id] = (dict(entry[0], **values), entry[1])
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'finished_ttl': self.finished_ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+    def _store(self, task_id, data):
+        if self.max_size <= 0:
+            return
+        finished = data['status'] not in UNFINISHED_STATUSES
+        if finished and self.finished_ttl <= 0:
+            self._entries.pop(task_id, None)
+            return
+        expires_at = time.time() + self.finished_ttl if finished else None
+        self._entries[task_id] = (data, expires_at)
+        self._entries.move_to_end(task_id)
+        self._evict()
+
+    def _evict(self):
+        while len(self._entries) > max(self.max_size, 0):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+task_cache = TaskStateCache()
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_tasks(session, flush_context):
+    """记录本次 flush 写入和删除的任务，快照在 flush 完成后生成"""
+    pending = session.info.setdefault(_SESSION_KEY, {})
+    written = session.info.setdefault(_SESSION_KEY + '_written', [])
+    for obj in session.deleted:
+        if isinstance(obj, Task):
+            pending[obj.task_id] = None
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Task):
+            written.append(obj)
+
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def _snapshot_tasks(session, flush_context):
+    written = session.info.pop(_SESSION_KEY + '_written', None)
+    if not written:
+        return
+    pending = session.info.setdefault(_SESSION_KEY, {})
+    for task in written:
+        try:
+            pending[task.task_id] = task.to_dict()
+        except Exception as e:
+            logger.warning(f"生成任务快照失败 {task.task_id}: {e}")
+            pending[task.task_id] = None
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_snapshots(session):
+    pending = session.info.pop(_SESSION_KEY, None)
+    for task_id, data in (pending or {}).items():
+        if data is None:
+            task_cache.invalidate(task_id)
+        else:
+            task_cache.put(task_id, data)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_snapshots(session):
+    session.info.pop(_SESSION_KEY + '_written', None)
+    for task_id in session.info.pop(_SESSION_KEY, None) or {}:
+        task_cache.invalidate(task_id)
@@ -0,0 +1,181 @@
+"""
+任务状态计数
+在内存中维护各状态的任务数，供系统监控、健康检查等频繁读取，不必每次对 tasks 表执行 COUNT。
+计数由会话事件驱动：flush 时记录新建、删除和状态变化（Task.update_status 设置的状态）的任务，
+事务提交后计入，回滚时丢弃；后台线程定期用一次 GROUP BY 查询与数据库对账，修正漏记或多进程写入造成的偏差。
+"""
+
+import threading
+import logging
+import time
+
+from sqlalchemy import event, inspect
+
+from webapp.core.database import db, Task
+
+logger = logging.getLogger(__name__)
+
+# 会话中已 flush、等待提交的状态变化：[(原状态, 新状态)]
+_SESSION_KEY = 'task_status_transitions'
+
+
+class TaskCounters:
+    """任务状态计数器"""
+
+    def __init__(self):
+        self.app = None
+        self.interval = 0
+        self.reconciles = 0
+        self.corrections = 0
+        self.reconciled_at = None
+        # 首次对账之前不计入状态变化
+        self._counts = None
+        # 每次计入状态变化时递增，用于判断对账查询期间计数是否变化
+        self._version = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def init_app(self, app, interval=60):
+        """
+        从数据库加载计数，并启动定期对账线程
+
+        Args:
+            app: Flask应用
+            interval: 对账间隔（秒），0 表示只在启动时加载一次
+        """
+        self.app = app
+        self.interval = interval
+        self.reconcile()
+        if interval <= 0 or self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name='task-counters', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止对账线程"""
+        thread, self._thread = self._thread, None
+        if thread:
+            self._stop_event.set()
+            thread.join(timeout=5)
+
+    def apply(self, transitions):
+        """
+        计入已提交的状态变化
+
+        Args:
+            transitions: [(原状态, 新状态)]，新建任务的原状态和删除任务的新状态为 None
+        """
+        with self._lock:
+            if self._counts is None:
+                return
+            for old, new in transitions:
+                if old:
+                    self._counts[old] = self._counts.get(old, 0) - 1
+                if new:
+                    self._counts[new] = self._counts.get(new, 0) + 1
+            self._version += 1
+
+    def reconcile(self):
+        """
+        与数据库对账
+
+        查询期间有新的状态变化计入时放弃本次结果（无法确定查询是否已包含这些变化），等下次对账。
+
+        Returns:
+            int: 修正的状态数，放弃或失败时返回 None
+        """
+        if not self.app:
+            return None
+
+        with self._lock:
+            version = self._version
+        try:
+            with self.app.app_context():
+                rows = db.session.query(Task.status, db.func.count(Task.id)).group_by(Task.status).all()
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"任务状态计数对账失败: {e}")
+            return None
+        actual = {status: count for status, count in rows}
+
+        with self._lock:
+            if self._version != version:
+                logger.debug("对账期间任务状态发生变化，跳过本次对账")
+                return None
+            first = self._counts is None
+            drift = {} if first else {
+                status: actual.get(status, 0) - self._counts.get(status, 0)
+                for status in set(actual) | set(self._counts)
+                if actual.get(status, 0) != self._counts.get(status, 0)
+            }
+            self._counts = actual
+            self.reconciles += 1
+            self.corrections += len(drift)
+            self.reconciled_at = time.time()
+
+        if drift:
+            logger.warning(f"任务状态计数与数据库不一致，已修正: {drift}")
+        return len(drift)
+
+    def get(self, *statuses):
+        """指定状态的任务数之和"""
+        with self._lock:
+            counts = self._counts or {}
+            return sum(max(counts.get(status, 0), 0) for status in statuses)
+
+    def snapshot(self):
+        """各状态的任务数"""
+        with self._lock:
+            return {status: max(count, 0) for status, count in (self._counts or {}).items() if count}
+
+    def get_stats(self):
+        """获取计数器状态"""
+        with self._lock:
+            return {
+                'loaded': self._counts is not None,
+                'interval': self.interval,
+                'reconciles': self.reconciles,
+                'corrections': self.corrections,
+                'reconciled_at': self.reconciled_at
+            }
+
+    def _loop(self):
+        while not self._stop_event.wait(self.interval):
+            self.reconcile()
+
+
+task_counters = TaskCounters()
+
+
+@event.listens_for(db.session, 'before_flush')
+def _record_transitions(session, flush_context, instances):
+    """记录本次 flush 中任务的新建、删除和状态变化"""
+    transitions = []
+    for obj in session.new:
+        if isinstance(obj, Task):
+            transitions.append((None, obj.status or 'pending'))
+    for obj in session.deleted:
+        if isinstance(obj, Task):
+            history = inspect(obj).attrs.status.history
+            transitions.append(((history.deleted or [obj.status])[0], None))
+    for obj in session.dirty:
+        if isinstance(obj, Task):
+            history = inspect(obj).attrs.status.history
+            if history.deleted and history.added and history.deleted[0] != history.added[0]:
+                transitions.append((history.deleted[0], history.added[0]))
+    if transitions:
+        session.info.setdefault(_SESSION_KEY, []).extend(transitions)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_transitions(session):
+    transitions = session.info.pop(_SESSION_KEY, None)
+    if transitions:
+        task_counters.apply(transitions)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_transitions(session):
+    session.info.pop(_SESSION_KEY, None)
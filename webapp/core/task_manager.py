@@ -10,9 +10,12 @@ import queue
 import time
 import subprocess
 import json
+import socket
+import uuid
 import logging
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
@@ -24,46 +27,367 @@ except ImportError:
     WHISPER_AVAILABLE = False
     logging.warning("Whisper未安装，将使用模拟模式")
 
-from webapp.core.database import db, get_task_by_id, update_task_statistics
-from webapp.api.websocket_handlers import broadcast_task_update, notify_task_completion
+from src.transcriber import (
+    get_model_pool, get_decoded_audio_cache, transcribe_windowed, StreamingAudio, probe_duration,
+    TranscriptionProcessPool, TranscriptionCancelled
+)
+from webapp.core.database import (
+    db, get_task_by_id, update_task_statistics,
+    claim_task_lease, renew_task_leases, get_orphaned_tasks,
+    save_transcript_segments, delete_transcript_segments
+)
+from webapp.core.pipeline import Pipeline, PipelineJob, PipelineStage, ConcurrencyLimiter
+from webapp.core.cancellation import TaskCancelledException
+from webapp.core.watchdog import Watchdog
+from webapp.core.status_buffer import status_buffer
+from webapp.core.task_counters import task_counters
+from webapp.core.task_cache import task_cache
+from webapp.core.search_index import index_task
+from webapp.core.worker_registry import WorkerRegistry
+from webapp.core.remote_worker import start_local_workers
+from webapp.core.error_handler import BusinessException, ErrorCode
+from webapp.core.scheduler import TaskScheduler, ThroughputMeter, create_policy, estimate_cost
+from webapp.core.media_cache import (
+    MediaCache, transcribe_options, normalize_video_url, transcript_cache_key,
+    file_sha256, link_or_copy
+)
+from webapp.api.websocket_handlers import broadcast_task_update, broadcast_task_segments, notify_task_completion
 
 logger = logging.getLogger(__name__)
 
 class TaskManager:
     """任务管理器"""
     
-    def __init__(self):
-        self.task_queue = queue.Queue()
+    def __init__(self, app=None):
+        self.app = None
         self.active_tasks = {}
         self.cancelled_tasks = set()
-        self.executor = ThreadPoolExecutor(max_workers=3)
+        self.inflight = {}
+        self.model_pool = get_model_pool()
+        self.transcribe_pool = None
+        self.running = False
+        self.pipeline = None
+        self.concurrency = None
+        self.scheduler = None
+        self.throughput = ThroughputMeter()
+        self.probe_executor = None
+        self.media_cache = None
+        self.decoded_cache = None
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_ttl = 60
+        self.heartbeat_interval = 15
+        self.max_recovery_attempts = 3
+        self.task_timeout = 3600
+        self.stage_timeouts = {}
+        self.timeout_grace = 10
+        self.transcribe_window = 180
+        self.streaming_decode = True
+        self.streaming_min_duration = 1800
+        self.watchdog = None
+        self.workers = WorkerRegistry()
+        self.worker_lease_ttl = 60
+        self.local_workers = None
+        self.lease_thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        
+        if app:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """初始化应用并启动任务流水线"""
+        self.app = app
+        config = app.config
+        self.lease_ttl = config.get('TASK_LEASE_TTL', 60)
+        self.heartbeat_interval = config.get('TASK_HEARTBEAT_INTERVAL', 15)
+        self.max_recovery_attempts = config.get('TASK_MAX_RECOVERY_ATTEMPTS', 3)
+        self.worker_lease_ttl = config.get('WORKER_LEASE_TTL', 60)
+        
+        # 各阶段超时，任务选项 timeouts 可按阶段覆盖
+        self.task_timeout = config.get('TASK_TIMEOUT', 3600)
+        self.stage_timeouts = {
+            'download': config.get('TASK_DOWNLOAD_TIMEOUT', 1800),
+            'decode': config.get('TASK_DECODE_TIMEOUT', 600),
+            'transcribe': config.get('TASK_TRANSCRIBE_TIMEOUT', self.task_timeout),
+            'write': config.get('TASK_WRITE_TIMEOUT', 300)
+        }
+        self.timeout_grace = config.get('TASK_TIMEOUT_GRACE', 10)
+        self.transcribe_window = config.get('TRANSCRIBE_WINDOW_SECONDS', 180)
+        self.streaming_decode = config.get('STREAMING_DECODE_ENABLED', True)
+        self.streaming_min_duration = config.get('STREAMING_DECODE_MIN_DURATION', 1800)
+        self.watchdog = Watchdog(config.get('TASK_WATCHDOG_INTERVAL', 1.0))
+        self.watchdog.start()
+        
+        # 进度更新写缓冲，减少转录过程中的数据库写事务
+        status_buffer.init_app(app, config.get('TASK_STATUS_FLUSH_INTERVAL', 1.0))
+        
+        # 各状态的任务数在内存中维护，定期与数据库对账
+        task_counters.init_app(app, config.get('TASK_COUNTER_RECONCILE_INTERVAL', 60))
+        
+        # 任务详情和状态轮询优先读取内存中的任务快照
+        task_cache.configure(
+            max_size=config.get('TASK_STATE_CACHE_SIZE', 1000),
+            finished_ttl=config.get('TASK_STATE_CACHE_FINISHED_TTL', 300)
+        )
+        
+        # 下载阶段按调度策略出队，而不是先进先出；同一模型的任务尽量连续调度，复用已加载的模型
+        self.scheduler = TaskScheduler(
+            create_policy(
+                config.get('TASK_SCHEDULER_POLICY', 'fair'),
+                aging_factor=config.get('TASK_SCHEDULER_AGING_FACTOR', 1.0)
+            ),
+            affinity_window=config.get('TASK_SCHEDULER_AFFINITY_WINDOW', 8),
+            affinity_max_wait=config.get('TASK_SCHEDULER_AFFINITY_MAX_WAIT', 300)
+        )
+        self.probe_executor = ThreadPoolExecutor(max_workers=2)
+        
+        # 音频与转录结果缓存
+        if config.get('MEDIA_CACHE_ENABLED', True):
+            self.media_cache = MediaCache(
+                config.get('CACHE_STORAGE_PATH', os.path.join(config['STORAGE_ROOT'], 'cache')),
+                config.get('AUDIO_CACHE_MAX_SIZE', 10 * 1024 ** 3),
+                config.get('TRANSCRIPT_CACHE_MAX_SIZE', 1024 ** 3)
+            )
+        
+        # 同时处理的任务数受 MAX_CONCURRENT_TASKS 限制，任务从调度队列取出时占用一个槽，离开流水线时释放
+        self.concurrency = ConcurrencyLimiter(config.get('MAX_CONCURRENT_TASKS', 3))
+        
+        # 解码音频缓存，进程启动时登记已有的缓存文件
+        if config.get('DECODED_AUDIO_CACHE_ENABLED', True):
+            self.decoded_cache = get_decoded_audio_cache()
+            self.decoded_cache.set_max_size(config.get('DECODED_AUDIO_CACHE_MAX_SIZE', 5 * 1024 ** 3))
+            self.decoded_cache.scan(config['AUDIO_STORAGE_PATH'], config.get('CACHE_STORAGE_PATH', ''))
+        
+        # 转录阶段的输入队列有界，解码后的音频最多预取一份，避免占用过多内存
+        transcribe_workers = config.get('PIPELINE_TRANSCRIBE_WORKERS', 2)
+        
+        # Whisper推理放到独立的工作进程中，避免占用Web进程的GIL
+        if WHISPER_AVAILABLE and config.get('TRANSCRIBE_PROCESS_POOL_ENABLED', True):
+            self.transcribe_pool = TranscriptionProcessPool(
+                size=config.get('TRANSCRIBE_PROCESSES') or transcribe_workers,
+                threads=config.get('TRANSCRIBE_PROCESS_THREADS', 0),
+                memory_budget_gb=config.get('WHISPER_MODEL_POOL_BUDGET_GB', 12),
+                cancel_grace=self.timeout_grace
+            )
+        stages = [
+            PipelineStage('download', self._stage_runner(self._stage_download),
+                          workers=config.get('PIPELINE_DOWNLOAD_WORKERS', 2),
+                          input_queue=self.scheduler,
+                          on_exit=self._finish_job,
+                          limiter=self.concurrency),
+            PipelineStage('decode', self._stage_runner(self._stage_decode),
+                          workers=config.get('PIPELINE_DECODE_WORKERS', 1),
+                          on_exit=self._finish_job),
+            PipelineStage('transcribe', self._stage_runner(self._stage_transcribe),
+                          workers=transcribe_workers,
+                          input_queue=queue.Queue(maxsize=transcribe_workers),
+                          on_exit=self._finish_job),
+            PipelineStage('write', self._stage_runner(self._stage_write),
+                          workers=config.get('PIPELINE_WRITE_WORKERS', 1),
+                          on_exit=self._finish_job)
+        ]
+        self.pipeline = Pipeline(stages)
+        self.pipeline.start()
         self.running = True
         
-        # 启动任务处理线程
-        self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
-        self.worker_thread.start()
+        # 租约心跳线程，同时负责接管崩溃或重启后遗留的未完成任务
+        self.lease_thread = threading.Thread(target=self._lease_loop, daemon=True)
+        self.lease_thread.start()
         
-        logger.info("任务管理器已启动")
+        logger.info(f"任务管理器已启动: {self.owner_id}")
+    
+    def start_local_workers(self):
+        """
+        启动进程内替身工作节点，通过工作节点接口领取任务，用于单机测试远程工作节点协议
+
+        替身工作节点通过测试客户端发送请求，需要在注册完路由之后调用。
+        """
+        count = self.app.config.get('LOCAL_WORKERS', 0)
+        if count > 0 and not self.local_workers:
+            self.local_workers = start_local_workers(self.app, count)
     
     def submit_task(self, task):
         """提交任务到队列"""
         try:
-            self.task_queue.put(task.task_id)
+            if not claim_task_lease(task.task_id, self.owner_id, self.lease_ttl):
+                logger.warning(f"任务租约已被其他进程持有: {task.task_id}")
+                return
+            
+            stage, job = self._prepare_cached_job(task)
+            self._enqueue(task, stage=stage, job=job)
             logger.info(f"任务已提交到队列: {task.task_id}")
         except Exception as e:
             logger.error(f"提交任务失败: {e}")
             raise
     
+    def _create_job(self, task):
+        """根据任务记录创建流水线任务"""
+        options = task.get_options()
+        return PipelineJob(
+            task.task_id,
+            model_name=task.model_name,
+            priority=int(options.get('priority', 0)),
+            client_id=task.client_id or options.get('client_id'),
+            duration=task.duration or options.get('duration')
+        )
+    
+    def _prepare_cached_job(self, task):
+        """
+        提交时检查缓存：音频已缓存时跳过下载，转录结果也已缓存时直接写出
+
+        Returns:
+            tuple: (起始阶段, 流水线任务)，未命中缓存时返回 (None, None)
+        """
+        if not self.media_cache:
+            return None, None
+        
+        video_key = normalize_video_url(task.url, resolve=False)
+        if not video_key or not self.media_cache.audio.contains(video_key, MediaCache.AUDIO_SUFFIX):
+            return None, None
+        
+        try:
+            job = self._create_job(task)
+            job.video_key = video_key
+            audio_path = self._task_audio_path(task.task_id)
+            meta = self.media_cache.link_audio(video_key, audio_path)
+            if not meta:
+                return None, None
+            
+            job.audio_sha256 = meta.get('sha256')
+            self._apply_video_info(task, job, audio_path, meta.get('video_info', {}))
+            
+            result = self._lookup_transcript(task, job)
+            if result is None:
+                task.update_status('pending', stage='命中音频缓存，等待转录...')
+                return 'decode', job
+            
+            job.result = result
+            task.update_status('transcribing', progress=95, stage='命中转录缓存')
+            logger.info(f"任务命中转录缓存: {task.task_id}")
+            return 'write', job
+        except Exception as e:
+            logger.warning(f"读取缓存失败 {task.task_id}: {e}")
+            db.session.rollback()
+            return None, None
+    
+    def _lookup_transcript(self, task, job):
+        """查找已缓存的转录结果"""
+        if not self.media_cache or not WHISPER_AVAILABLE:
+            return None
+        return self.media_cache.lookup_transcript(self._transcript_key(task, job))
+    
+    def _transcript_key(self, task, job):
+        """转录结果缓存键：音频哈希 + 模型 + 传给 Whisper 的转录参数"""
+        if not job.transcript_key:
+            if not job.audio_sha256:
+                job.audio_sha256 = file_sha256(job.audio_path)
+            job.transcript_key = transcript_cache_key(job.audio_sha256, task.model_name, task.get_options())
+        return job.transcript_key
+    
+    def _apply_video_info(self, task, job, audio_path, video_info):
+        """记录下载完成的音频和视频信息"""
+        job.audio_path = audio_path
+        job.video_info = video_info
+        task.set_video_info(video_info)
+        task.title = video_info.get('title', '')
+        task.duration = video_info.get('duration', 0)
+        task.completed_stage = 'download'
+    
+    def _task_audio_path(self, task_id):
+        """任务音频文件路径"""
+        return os.path.join(self.app.config['AUDIO_STORAGE_PATH'], task_id, 'audio.m4a')
+    
+    def get_cache_stats(self):
+        """获取缓存命中统计"""
+        stats = self.media_cache.get_stats() if self.media_cache else {}
+        if self.decoded_cache:
+            stats['decoded_audio'] = self.decoded_cache.get_stats()
+        return stats
+    
+    def _coalesce_key(self, task):
+        """合并键：同一视频、模型和转录参数的任务共享一次执行（输出格式在下载时渲染，不影响合并）"""
+        decoding = tuple(sorted(transcribe_options(task.get_options()).items()))
+        video = normalize_video_url(task.url, resolve=False) or task.url.strip()
+        return (video, task.model_name, decoding)
+    
+    def _enqueue(self, task, stage=None, job=None):
+        """将任务加入流水线，stage 为空时从下载阶段开始"""
+        leader = None
+        with self._lock:
+            if task.task_id in self.active_tasks:
+                return False
+            
+            if job is None:
+                # 相同的任务正在执行时，作为跟随者挂到领导者上，不再重复下载和转录
+                key = self._coalesce_key(task)
+                leader = self.inflight.get(key)
+                if leader and leader.accepting_followers:
+                    leader.followers.append(task.task_id)
+                    self.active_tasks[task.task_id] = leader
+                else:
+                    leader = None
+                    job = self._create_job(task)
+                    job.coalesce_key = key
+                    self.inflight[key] = job
+            
+            if leader is None:
+                self.active_tasks[task.task_id] = job
+        
+        if leader:
+            task.update_status(task.status, stage=f'已合并到相同视频的任务 {leader.task_id}')
+            logger.info(f"任务 {task.task_id} 已合并到正在执行的任务 {leader.task_id}")
+            return True
+        
+        try:
+            self.pipeline.submit(job, stage)
+        except Exception:
+            self._finish_job(job)
+            raise
+        
+        # 异步探测视频时长，用于估算任务成本
+        if stage is None and not job.duration:
+            options = task.get_options()
+            self.probe_executor.submit(
+                self._probe_duration, task.task_id, task.url, options.get('use_proxy')
+            )
+        return True
+    
     def cancel_task(self, task_id):
         """取消任务"""
         try:
             self.cancelled_tasks.add(task_id)
             
-            # 如果任务正在执行，尝试停止
-            if task_id in self.active_tasks:
-                future = self.active_tasks[task_id]
-                future.cancel()
-                logger.info(f"已取消正在执行的任务: {task_id}")
+            with self._lock:
+                job = self.active_tasks.get(task_id)
+                
+                # 跟随者只需从领导者上摘除，不影响共享的执行
+                if job and job.task_id != task_id:
+                    if task_id in job.followers:
+                        job.followers.remove(task_id)
+                    self.active_tasks.pop(task_id, None)
+                    self.cancelled_tasks.discard(task_id)
+                    logger.info(f"已从合并任务 {job.task_id} 中移除跟随者: {task_id}")
+                    return
+                
+                # 有跟随者的领导者继续执行，在下一阶段开始前由跟随者接替
+                if job and job.followers:
+                    logger.info(f"任务已标记为取消，由跟随者接替执行: {task_id}")
+                    return
+                
+                # 中止正在执行的下载、解码或转录，不再接收新的跟随者
+                if job:
+                    job.accepting_followers = False
+                    if job.coalesce_key and self.inflight.get(job.coalesce_key) is job:
+                        del self.inflight[job.coalesce_key]
+                    job.cancel_token.cancel()
+            
+            # 尚在排队的任务直接移出调度队列
+            queued_job = self.scheduler.remove(task_id) if self.scheduler else None
+            if queued_job:
+                self._finish_job(queued_job)
+                logger.info(f"已从队列移除任务: {task_id}")
+            elif job:
+                logger.info(f"已中止正在执行的任务: {task_id}")
             
             logger.info(f"任务已标记为取消: {task_id}")
         except Exception as e:
@@ -74,126 +398,831 @@ class TaskManager:
         """获取活跃任务列表"""
         return list(self.active_tasks.keys())
     
+    def get_active_count(self):
+        """活跃任务数（排队和处理中，含合并的跟随者）"""
+        return len(self.active_tasks)
+    
+    def get_backlog_size(self):
+        """等待调度的任务数"""
+        return self.scheduler.qsize() if self.scheduler else 0
+    
+    def get_queue_estimate(self, task_id):
+        """
+        估算任务的排队位置和开始时间
+
+        开始前需要完成的任务数除以近期吞吐量；尚无吞吐量数据时按前面任务的预估成本和并发数估算。
+
+        Returns:
+            dict: queue_position、estimated_wait_seconds、estimated_start_time；任务不在管理器中时返回 None
+        """
+        with self._lock:
+            job = self.active_tasks.get(task_id)
+            if not job:
+                return None
+            # 远程工作节点处理的任务不占用本地并发槽
+            jobs = {active_job for active_job in self.active_tasks.values() if not active_job.worker_id}
+        
+        if job.holds_slot or job.worker_id:
+            position, wait_seconds = 0, 0.0
+        else:
+            # 已出队、等待并发槽的任务排在调度队列之前
+            running = sum(1 for active_job in jobs if active_job.holds_slot)
+            waiting = max(0, len(jobs) - running - self.scheduler.qsize())
+            queued_ahead, cost_ahead = self.scheduler.get_position(job.task_id)
+            if queued_ahead is None:
+                position = queued_ahead = 0
+            else:
+                position = waiting + queued_ahead
+            
+            limit = max(1, self.concurrency.limit)
+            completions_needed = max(0, running + position + 1 - limit)
+            rate = self.throughput.get_rate()
+            if not completions_needed:
+                wait_seconds = 0.0
+            elif rate:
+                wait_seconds = completions_needed / rate
+            else:
+                # 尚无吞吐量数据：处理中和等待槽的任务按本任务的预估成本计
+                job_cost = job.cost or estimate_cost(job.duration, job.model_name)
+                wait_seconds = (cost_ahead + max(0, completions_needed - queued_ahead) * job_cost) / limit
+        
+        return {
+            'queue_position': position,
+            'estimated_wait_seconds': round(wait_seconds, 1),
+            'estimated_start_time': datetime.utcfromtimestamp(time.time() + wait_seconds).isoformat()
+        }
+    
     def get_queue_size(self):
         """获取队列大小"""
-        return self.task_queue.qsize()
+        return self.pipeline.get_queue_size() if self.pipeline else 0
     
-    def _worker_loop(self):
-        """工作线程主循环"""
-        while self.running:
-            try:
-                # 从队列获取任务
-                task_id = self.task_queue.get(timeout=1)
-                
-                # 检查任务是否已被取消
-                if task_id in self.cancelled_tasks:
-                    self.cancelled_tasks.remove(task_id)
-                    continue
-                
-                # 提交任务到线程池
-                future = self.executor.submit(self._process_task, task_id)
-                self.active_tasks[task_id] = future
-                
-                # 任务完成后清理
-                future.add_done_callback(lambda f: self._cleanup_task(task_id))
-                
-            except queue.Empty:
-                continue
-            except Exception as e:
-                logger.error(f"工作线程错误: {e}")
-    
-    def _cleanup_task(self, task_id):
-        """清理完成的任务"""
-        if task_id in self.active_tasks:
-            del self.active_tasks[task_id]
-        if task_id in self.cancelled_tasks:
-            self.cancelled_tasks.remove(task_id)
-    
-    def _process_task(self, task_id):
-        """处理单个任务"""
-        task = None
+    def get_stage_status(self):
+        """获取各阶段队列深度和工作线程状态"""
+        return self.pipeline.get_status() if self.pipeline else {}
+    
+    def get_scheduler_status(self):
+        """获取调度器状态"""
+        return self.scheduler.get_status() if self.scheduler else {}
+    
+    def set_concurrency(self, max_concurrent_tasks=None, stage_workers=None):
+        """
+        运行时调整并发度，缩减时不会中断正在处理的任务
+
+        Args:
+            max_concurrent_tasks: 同时处理的任务数上限
+            stage_workers: 各阶段工作线程数，如 {'transcribe': 4}
+        """
+        if max_concurrent_tasks is not None:
+            self.concurrency.resize(max_concurrent_tasks)
+            logger.info(f"最大并发任务数调整为 {max_concurrent_tasks}")
+        
+        for name, workers in (stage_workers or {}).items():
+            stage = self.pipeline.get_stage(name)
+            if stage:
+                stage.resize(workers)
+        
+        return self.get_concurrency_status()
+    
+    def get_concurrency_status(self):
+        """获取并发度配置与占用情况"""
+        if not self.concurrency:
+            return {}
+        with self._lock:
+            running = sum(1 for job in set(self.active_tasks.values()) if job.holds_slot)
+        return {
+            'max_concurrent_tasks': self.concurrency.limit,
+            'running_tasks': running,
+            'stage_workers': {stage.name: stage.workers for stage in self.pipeline.stages}
+        }
+    
+    def get_task_counter_stats(self):
+        """获取任务状态计数器信息"""
+        return dict(task_counters.get_stats(), counts=task_counters.snapshot())
+    
+    def get_task_cache_stats(self):
+        """获取任务状态缓存统计信息"""
+        return task_cache.get_stats()
+    
+    def get_status_buffer_stats(self):
+        """获取进度写缓冲统计信息"""
+        return status_buffer.get_stats()
+    
+    def get_model_pool_stats(self):
+        """获取模型池统计：启用转录进程池时汇总各工作进程的模型池，否则为进程内模型池"""
+        if self.transcribe_pool:
+            return self.transcribe_pool.get_model_pool_stats()
+        return self.model_pool.get_stats()
+    
+    def get_transcribe_pool_stats(self):
+        """获取转录进程池统计信息，未启用时返回 None"""
+        return self.transcribe_pool.get_stats() if self.transcribe_pool else None
+    
+    def get_watchdog_status(self):
+        """获取看门狗状态"""
+        return self.watchdog.get_status() if self.watchdog else {}
+    
+    def _probe_duration(self, task_id, url, use_proxy=False):
+        """通过yt-dlp探测视频时长（不下载）"""
         try:
-            # 获取任务信息
-            task = get_task_by_id(task_id)
-            if not task:
-                logger.error(f"任务不存在: {task_id}")
-                return
-            
-            logger.info(f"开始处理任务: {task_id}")
+            cmd = ['yt-dlp', '--skip-download', '--no-playlist', '--print', 'duration']
+            if use_proxy and self.app.config.get('PROXY_URL'):
+                cmd.extend(['--proxy', self.app.config['PROXY_URL']])
+            cmd.append(url)
             
-            # 检查是否被取消
-            if task_id in self.cancelled_tasks:
-                task.update_status('cancelled', stage='任务已取消')
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+            if result.returncode != 0:
                 return
             
-            # 更新任务状态为下载中
-            task.update_status('downloading', progress=0, stage='正在下载视频...')
-            self._broadcast_update(task_id, 'downloading', 0, '正在下载视频...')
+            duration = float(result.stdout.strip().splitlines()[-1])
+            if self.scheduler.update_duration(task_id, duration):
+                logger.info(f"已探测视频时长 {task_id}: {duration:.0f} 秒")
+        except (ValueError, IndexError, subprocess.TimeoutExpired):
+            pass
+        except Exception as e:
+            logger.warning(f"探测视频时长失败 {task_id}: {e}")
+    
+    def _lease_loop(self):
+        """租约心跳与任务恢复循环"""
+        while not self._stop_event.is_set():
+            try:
+                with self._app_context():
+                    renew_task_leases(list(self.active_tasks.keys()), self.owner_id, self.lease_ttl)
+                    self._expire_remote_leases()
+                    self._recover_tasks()
+            except Exception as e:
+                logger.error(f"租约心跳失败: {e}")
+                db.session.rollback()
             
-            # 下载视频
-            audio_path, video_info = self._download_video(task)
+            self._stop_event.wait(self.heartbeat_interval)
+    
+    def _recover_tasks(self):
+        """接管没有有效租约的未完成任务"""
+        for task in get_orphaned_tasks(exclude=list(self.active_tasks.keys())):
+            if not claim_task_lease(task.task_id, self.owner_id, self.lease_ttl):
+                continue
             
-            # 检查是否被取消
-            if task_id in self.cancelled_tasks:
-                self._cleanup_files(audio_path)
-                task.update_status('cancelled', stage='任务已取消')
-                return
+            task.attempts = (task.attempts or 0) + 1
+            if task.attempts > self.max_recovery_attempts:
+                error = f'任务多次中断，已放弃恢复（{self.max_recovery_attempts}次）'
+                task.update_status('failed', stage='处理失败', error=error)
+                update_task_statistics(task)
+                logger.warning(f"{error}: {task.task_id}")
+                continue
             
-            # 更新视频信息
-            task.set_video_info(video_info)
-            task.title = video_info.get('title', '')
-            task.duration = video_info.get('duration', 0)
+            self._resume_task(task)
+    
+    def _resume_task(self, task):
+        """从最后完成的阶段恢复任务，复用已下载的音频和已完成的转录"""
+        job = self._create_job(task)
+        audio_path = self._task_audio_path(task.task_id)
+        checkpoint_path = self._checkpoint_path(task.task_id)
+        
+        stage = None
+        if os.path.exists(audio_path):
+            job.audio_path = audio_path
+            job.video_info = task.get_video_info()
+        
+        if task.completed_stage == 'transcribe' and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, 'r', encoding='utf-8') as f:
+                job.result = json.load(f)
+            stage = 'write'
+        elif task.completed_stage in ('download', 'transcribe') and job.audio_path:
+            stage = 'decode'
+        
+        task.update_status(task.status, stage=f'任务已恢复，从{stage or "download"}阶段继续')
+        if self._enqueue(task, stage=stage, job=job):
+            logger.info(f"已恢复任务 {task.task_id}，从 {stage or 'download'} 阶段继续")
+    
+    def lease_remote_task(self, worker_id, models=None, info=None):
+        """
+        远程工作节点领取一个排队中的任务
+
+        任务按调度策略从调度队列中取出（只取工作节点支持的模型），数据库中的租约转给工作节点，
+        工作节点需要在租约到期前上报进度续约，否则任务重新排队。
+
+        Args:
+            worker_id: 工作节点ID
+            models: 工作节点支持的模型列表，为空表示不限
+            info: 工作节点附带的信息（主机名、设备等）
+
+        Returns:
+            dict: 任务描述，没有可领取的任务时返回 None
+        """
+        self.workers.touch(worker_id, models, info)
+        
+        while True:
+            # 从中间阶段开始的任务（命中缓存、恢复中断）依赖本机已有的文件，只由本地流水线处理
+            job = self.scheduler.take(
+                lambda queued: not queued.enter_at and (not models or queued.model_name in models)
+            )
+            if job is None:
+                return None
             
-            # 更新任务状态为转录中
-            task.update_status('transcribing', progress=10, stage='正在转录音频...')
-            self._broadcast_update(task_id, 'transcribing', 10, '正在转录音频...')
+            task = get_task_by_id(job.task_id)
+            if task and not job.cancel_token.cancelled and task.status != 'cancelled':
+                break
+            # 排队期间已取消的任务直接结束
+            self._finish_job(job)
+        
+        lease = self.workers.grant(worker_id, job, self.worker_lease_ttl)
+        job.worker_id = worker_id
+        job.started_at = job.started_at or time.time()
+        job.timings.setdefault('queue', time.time() - job.submitted_at)
+        # 远程任务同样受阶段超时和任务总超时约束，工作节点上报进入转录后按转录阶段重新计时
+        job.stage = 'download'
+        self.watchdog.arm(job, self._stage_deadline(task, job), self._on_remote_timeout)
+        task.lease_owner = f'worker:{worker_id}'
+        task.lease_expires_at = datetime.utcfromtimestamp(lease.expires_at)
+        self._update_status(task, job, 'downloading', 0, f'已分配给工作节点 {worker_id}')
+        logger.info(f"任务 {job.task_id} 已分配给工作节点 {worker_id}")
+        
+        return {
+            'task_id': lease.task_id,
+            'url': task.url,
+            'model_name': task.model_name,
+            'options': task.get_options(),
+            'duration': task.duration or job.duration,
+            'lease_ttl': self.worker_lease_ttl,
+            'heartbeat_interval': max(1, min(self.heartbeat_interval, self.worker_lease_ttl / 3))
+        }
+    
+    def report_remote_progress(self, worker_id, task_id, status=None, progress=None, stage=None,
+                               segments=None, decoded_seconds=None, total_seconds=None):
+        """
+        工作节点上报进度并续约
+
+        Returns:
+            dict: cancelled 为 True 时工作节点应停止处理该任务
+        """
+        lease = self._get_remote_lease(worker_id, task_id)
+        job = lease.job
+        task = get_task_by_id(job.task_id)
+        
+        # 领导者被取消但还有跟随者时由跟随者接替，工作节点继续处理
+        if task and self._is_cancelled(task) and job.followers and not job.cancel_token.cancelled:
+            task = self._promote_follower(job)
+        
+        if not task or job.cancel_token.cancelled or task.status == 'cancelled':
+            self.watchdog.disarm(job)
+            if not self.workers.release(lease, 'failed' if job.cancel_token.reason == 'timeout' else None):
+                return {'cancelled': True}
+            if task:
+                if job.cancel_token.reason == 'timeout':
+                    self._fail_job(task, job, TimeoutError(job.timeout_reason))
+                else:
+                    self._cancel_job(task, job)
+            self._finish_job(job)
+            return {'cancelled': True}
+        
+        self.workers.renew(lease, self.worker_lease_ttl)
+        renew_task_leases([job.task_id], f'worker:{worker_id}', self.worker_lease_ttl)
+        
+        if (status == 'transcribing' or segments is not None) and job.stage != 'transcribe':
+            job.stage = 'transcribe'
+            self.watchdog.arm(job, self._stage_deadline(task, job), self._on_remote_timeout)
+        
+        if segments is not None and decoded_seconds is not None:
+            self._on_segments(task, job, segments, decoded_seconds, total_seconds or decoded_seconds)
+        elif status in ('downloading', 'transcribing'):
+            self._update_status(task, job, status, progress, stage)
+        return {'cancelled': False}
+    
+    def complete_remote_task(self, worker_id, task_id, result, video_info=None, audio_sha256=None,
+                             timings=None):
+        """工作节点上传转录结果，由写出阶段保存结果并完成任务"""
+        lease = self._get_remote_lease(worker_id, task_id)
+        self.workers.release(lease, 'completed')
+        job = lease.job
+        self.watchdog.disarm(job)
+        task = get_task_by_id(job.task_id)
+        
+        # 工作节点上报的下载和转录耗时（解码在工作节点上与转录合并进行）
+        timings = timings or {}
+        for stage in ('download', 'transcribe'):
+            if isinstance(timings.get(stage), (int, float)):
+                job.timings[stage] = float(timings[stage])
+        if isinstance(timings.get('bytes_downloaded'), int):
+            job.bytes_downloaded = timings['bytes_downloaded']
+        
+        self._apply_video_info(task, job, None, video_info or {})
+        job.audio_sha256 = audio_sha256
+        job.result = result
+        self._save_transcript(task, job, cache=bool(audio_sha256))
+        
+        # 远程任务不占用本地并发槽
+        self.pipeline.submit(job, 'write', admit=False)
+        logger.info(f"工作节点 {worker_id} 已完成任务 {job.task_id}")
+    
+    def fail_remote_task(self, worker_id, task_id, error):
+        """工作节点上报任务失败"""
+        lease = self._get_remote_lease(worker_id, task_id)
+        self.workers.release(lease, 'failed')
+        job = lease.job
+        self.watchdog.disarm(job)
+        task = get_task_by_id(job.task_id)
+        if task:
+            self._fail_job(task, job, Exception(f'工作节点 {worker_id}: {error}'))
+        self._finish_job(job)
+    
+    def get_worker_status(self):
+        """获取远程工作节点状态"""
+        return self.workers.get_status()
+    
+    def _get_remote_lease(self, worker_id, task_id):
+        """获取工作节点持有的租约，租约已过期或被收回时抛出 LEASE_LOST"""
+        self.workers.touch(worker_id)
+        lease = self.workers.get(task_id, worker_id)
+        if not lease:
+            raise BusinessException(ErrorCode.LEASE_LOST, f'工作节点 {worker_id} 未持有任务租约: {task_id}', status_code=409)
+        return lease
+    
+    def _expire_remote_leases(self):
+        """租约到期的远程任务重新排队，由其他工作节点或本地流水线处理"""
+        for lease in self.workers.pop_expired():
+            job = lease.job
+            self.watchdog.disarm(job)
+            task = get_task_by_id(job.task_id)
+            if task and job.cancel_token.reason == 'timeout':
+                self._fail_job(task, job, TimeoutError(job.timeout_reason))
+                self._finish_job(job)
+                continue
+            if not task or task.status == 'cancelled' or job.cancel_token.cancelled:
+                if task:
+                    self._cancel_job(task, job)
+                self._finish_job(job)
+                continue
             
-            # 转录音频
-            result_path = self._transcribe_audio(task, audio_path)
+            task.attempts = (task.attempts or 0) + 1
+            if task.attempts > self.max_recovery_attempts:
+                self._fail_job(task, job, Exception(f'任务多次中断，已放弃恢复（{self.max_recovery_attempts}次）'))
+                self._finish_job(job)
+                continue
             
-            # 检查是否被取消
-            if task_id in self.cancelled_tasks:
-                self._cleanup_files(audio_path, result_path)
-                task.update_status('cancelled', stage='任务已取消')
-                return
+            logger.warning(f"工作节点 {lease.worker_id} 的任务租约已过期，重新排队: {job.task_id}")
+            job.worker_id = None
+            task.lease_owner = self.owner_id
+            task.lease_expires_at = datetime.utcnow() + timedelta(seconds=self.lease_ttl)
+            self._update_status(task, job, 'pending', 0, f'工作节点 {lease.worker_id} 失联，任务已重新排队')
+            self.pipeline.submit(job)
+    
+    def _partial_result_path(self, task_id):
+        """转录过程中逐段追加的部分结果文件路径"""
+        return os.path.join(self.app.config['RESULT_STORAGE_PATH'], task_id, 'partial.txt')
+    
+    def get_partial_result_path(self, task_id):
+        """获取处理中任务的部分结果文件，合并的跟随者返回领导者的文件"""
+        job = self.active_tasks.get(task_id)
+        if not job:
+            return None
+        path = self._partial_result_path(job.task_id)
+        return path if os.path.exists(path) else None
+    
+    def _checkpoint_path(self, task_id):
+        """转录结果检查点文件路径"""
+        return os.path.join(self.app.config['RESULT_STORAGE_PATH'], task_id, 'checkpoint.json')
+    
+    def _stage_runner(self, handler):
+        """包装阶段处理函数：进入应用上下文、检查取消、统一处理失败"""
+        def run(job):
+            with self._app_context():
+                task = get_task_by_id(job.task_id)
+                if not task:
+                    logger.error(f"任务不存在: {job.task_id}")
+                    return False
+                
+                if job.cancel_token.reason == 'timeout':
+                    self._fail_job(task, job, TimeoutError(job.timeout_reason))
+                    return False
+                
+                if job.cancel_token.cancelled or job.task_id in self.cancelled_tasks or task.status == 'cancelled':
+                    if job.cancel_token.cancelled or not job.followers:
+                        self._cancel_job(task, job)
+                        return False
+                    
+                    task.update_status('cancelled', stage='任务已取消')
+                    task = self._promote_follower(job)
+                    if not task:
+                        return False
+                
+                self.watchdog.arm(job, self._stage_deadline(task, job), self._on_stage_timeout)
+                job.stage_started_at = time.time()
+                job.timings.setdefault('queue', job.stage_started_at - job.submitted_at)
+                try:
+                    return handler(task, job)
+                except TaskCancelledException as e:
+                    db.session.rollback()
+                    if job.abandoned:
+                        return False
+                    if e.reason == 'timeout':
+                        self._fail_job(task, job, TimeoutError(job.timeout_reason))
+                    else:
+                        self._cancel_job(task, job)
+                    return False
+                except Exception as e:
+                    if job.abandoned:
+                        db.session.rollback()
+                        return False
+                    self._fail_job(task, job, e)
+                    return False
+                finally:
+                    self.watchdog.disarm(job)
+                    self._record_stage_time(job)
+                    job.stage_started_at = None
+        return run
+    
+    def _record_stage_time(self, job):
+        """累计当前阶段的耗时（阶段可能因租约丢失等原因重复执行）"""
+        if job.stage_started_at is None:
+            return
+        now = time.time()
+        job.timings[job.stage] = job.timings.get(job.stage, 0) + now - job.stage_started_at
+        job.stage_started_at = now
+    
+    def _apply_timings(self, task, job):
+        """将已完成阶段的耗时写入任务记录"""
+        self._record_stage_time(job)
+        task.set_timings(job.timings, job.bytes_downloaded)
+    
+    def _stage_deadline(self, task, job):
+        """计算当前阶段的截止时间：阶段超时与任务总超时取先到者"""
+        now = time.time()
+        job.started_at = job.started_at or now
+        
+        timeouts = dict(self.stage_timeouts, total=self.task_timeout)
+        timeouts.update(task.get_options().get('timeouts') or {})
+        
+        stage_deadline = now + timeouts.get(job.stage, timeouts['total'])
+        total_deadline = job.started_at + timeouts['total']
+        if stage_deadline <= total_deadline:
+            job.timeout_reason = f'{job.stage}阶段超时（{timeouts.get(job.stage, timeouts["total"])}秒）'
+            return stage_deadline
+        job.timeout_reason = f'任务处理超时（{timeouts["total"]}秒）'
+        return total_deadline
+    
+    def _on_stage_timeout(self, job):
+        """
+        阶段超时回调
+
+        先通过取消令牌终止子进程并在下一个检查点中止；宽限期后工作线程仍未返回，
+        则放弃该线程、启动替代线程并直接将任务标记为失败。
+        """
+        if job.cancel_token.reason != 'timeout':
+            logger.warning(f"任务超时 {job.task_id}: {job.timeout_reason}")
+            job.cancel_token.cancel('timeout')
+            self.watchdog.arm(job, time.time() + self.timeout_grace, self._on_stage_timeout)
+            return
+        
+        stage = self.pipeline.get_stage(job.stage)
+        if not stage or not stage.abandon(job):
+            return
+        
+        with self._app_context():
+            task = get_task_by_id(job.task_id)
+            if task:
+                self._fail_job(task, job, TimeoutError(f'{job.timeout_reason}，工作线程无响应'))
+        self._finish_job(job)
+    
+    def _on_remote_timeout(self, job):
+        """
+        远程任务超时回调
+
+        先通过取消令牌通知工作节点（下次上报进度时停止处理，任务标记为失败）；
+        一个租约周期加宽限期后工作节点仍未上报，则收回租约并直接将任务标记为失败。
+        """
+        if job.cancel_token.reason != 'timeout':
+            logger.warning(f"远程任务超时 {job.task_id}: {job.timeout_reason}")
+            job.cancel_token.cancel('timeout')
+            self.watchdog.arm(job, time.time() + self.worker_lease_ttl + self.timeout_grace, self._on_remote_timeout)
+            return
+        
+        lease = self.workers.find_by_job(job)
+        if not lease or not self.workers.release(lease, 'failed'):
+            return
+        
+        with self._app_context():
+            task = get_task_by_id(job.task_id)
+            if task:
+                self._fail_job(task, job, TimeoutError(f'{job.timeout_reason}，工作节点无响应'))
+        self._finish_job(job)
+    
+    def _app_context(self):
+        """获取应用上下文"""
+        if self.app:
+            return self.app.app_context()
+        return nullcontext()
+    
+    def _promote_follower(self, job):
+        """领导者被取消时由第一个跟随者接替，继续使用已下载的文件"""
+        with self._lock:
+            previous_id = job.task_id
+            job.task_id = job.followers.pop(0)
+            self.active_tasks.pop(previous_id, None)
+            self.cancelled_tasks.discard(previous_id)
+        
+        logger.info(f"任务 {previous_id} 已取消，由跟随者 {job.task_id} 接替执行")
+        return get_task_by_id(job.task_id)
+    
+    def _finish_job(self, job):
+        """任务离开流水线后清理"""
+        job.audio = None
+        with self._lock:
+            if job.holds_slot:
+                job.holds_slot = False
+                self.concurrency.release()
+                self.throughput.record()
+            for task_id in [job.task_id] + job.followers:
+                self.active_tasks.pop(task_id, None)
+                self.cancelled_tasks.discard(task_id)
+            if job.coalesce_key and self.inflight.get(job.coalesce_key) is job:
+                del self.inflight[job.coalesce_key]
+    
+    def _close_followers(self, job):
+        """停止接收新的跟随者，返回当前跟随者列表"""
+        with self._lock:
+            job.accepting_followers = False
+            if job.coalesce_key and self.inflight.get(job.coalesce_key) is job:
+                del self.inflight[job.coalesce_key]
+            return list(job.followers)
+    
+    def _is_cancelled(self, task):
+        """任务是否已被取消（取消请求先登记在 cancelled_tasks，随后才把状态写入数据库）"""
+        return task.task_id in self.cancelled_tasks or task.status == 'cancelled'
+    
+    def _update_status(self, task, job, status, progress=None, stage=None):
+        """
+        更新领导者和所有跟随者的状态，并向各自的任务房间广播
+
+        有跟随者的领导者被取消后继续执行到下一阶段开始，期间只更新跟随者，不覆盖领导者的取消状态。
+        """
+        if not self._is_cancelled(task):
+            task.update_status(status, progress=progress, stage=stage)
+            self._broadcast_update(task.task_id, status, progress, stage)
+        
+        for follower_id in list(job.followers):
+            follower = get_task_by_id(follower_id)
+            if follower and follower.status != 'cancelled':
+                follower.update_status(status, progress=progress, stage=stage)
+                self._broadcast_update(follower_id, status, progress, stage)
+    
+    def _cancel_job(self, task, job):
+        """取消任务并清理中间文件"""
+        self._cleanup_audio(job.audio_path)
+        self._cleanup_files(self._partial_result_path(job.task_id))
+        delete_transcript_segments(job.task_id)
+        self._apply_timings(task, job)
+        task.update_status('cancelled', stage='任务已取消')
+        logger.info(f"任务已取消: {job.task_id}")
+    
+    def _fail_job(self, task, job, error):
+        """标记任务失败"""
+        logger.error(f"任务处理失败 {job.task_id}: {error}")
+        
+        db.session.rollback()
+        tasks = [task] + [get_task_by_id(task_id) for task_id in self._close_followers(job)]
+        self._apply_timings(task, job)
+        for failed_task in tasks:
+            if not failed_task or failed_task.status == 'cancelled':
+                continue
             
-            # 保存文件路径
-            task.result_file_path = result_path
-            options = task.get_options()
-            if options.get('keep_audio', True):
-                task.audio_file_path = audio_path
-            else:
-                self._cleanup_files(audio_path)
+            failed_task.update_status('failed', stage='处理失败', error=str(error))
+            self._broadcast_update(failed_task.task_id, 'failed', None, '处理失败', str(error))
+            self._notify_completion(failed_task.task_id, False, f'任务失败: {str(error)}')
             
-            # 获取文件大小
-            if os.path.exists(result_path):
-                task.file_size = os.path.getsize(result_path)
+            # 更新统计信息
+            update_task_statistics(failed_task)
+    
+    def _stage_download(self, task, job):
+        """下载阶段：下载视频并提取音频"""
+        logger.info(f"开始处理任务: {job.task_id}")
+        
+        # 更新任务状态为下载中
+        self._update_status(task, job, 'downloading', 0, '正在下载视频...')
+        
+        # 同一视频的音频只下载一次
+        meta = None
+        if self.media_cache:
+            job.video_key = job.video_key or normalize_video_url(task.url)
+            if job.video_key:
+                meta = self.media_cache.link_audio(job.video_key, self._task_audio_path(task.task_id))
+        
+        if meta:
+            logger.info(f"任务命中音频缓存: {job.task_id} ({job.video_key})")
+            audio_path, video_info = self._task_audio_path(task.task_id), meta.get('video_info', {})
+            job.audio_sha256 = meta.get('sha256')
+            job.bytes_downloaded = 0
+        else:
+            audio_path, video_info = self._download_video(task, job)
+            job.bytes_downloaded = os.path.getsize(audio_path)
+            if job.video_key:
+                try:
+                    job.audio_sha256 = self.media_cache.store_audio(job.video_key, audio_path, video_info)
+                except OSError as e:
+                    logger.warning(f"缓存音频失败 {job.task_id}: {e}")
+        
+        # 更新视频信息
+        self._apply_video_info(task, job, audio_path, video_info)
+        self._update_status(task, job, 'downloading', 5, '下载完成，等待转录...')
+        
+        # 相同音频和参数的转录结果已缓存时直接写出
+        result = self._lookup_transcript(task, job)
+        if result is not None:
+            logger.info(f"任务命中转录缓存: {job.task_id}")
+            job.result = result
+            job.skip_to = 'write'
+        return True
+    
+    def _stage_decode(self, task, job):
+        """解码阶段：将音频解码为16kHz单声道波形"""
+        self._update_status(task, job, 'transcribing', 10, '正在解码音频...')
+        
+        if WHISPER_AVAILABLE:
+            if self._should_stream(task, job):
+                # 长音频不整段解码，转录阶段通过ffmpeg管道按窗口读取
+                job.stream_audio = True
+                return True
             
-            # 更新任务状态为完成
-            task.update_status('completed', progress=100, stage='转录完成')
-            self._broadcast_update(task_id, 'completed', 100, '转录完成')
+            if self.transcribe_pool and not self.decoded_cache:
+                # 没有解码缓存时由转录进程自行解码，避免在进程间传递整段波形
+                return True
             
-            # 更新统计信息
-            update_task_statistics(task)
+            decoder = lambda path: self._load_audio(path, job.cancel_token)
+            if self.decoded_cache:
+                job.audio = self.decoded_cache.load(self._decode_source(job), decoder)
+            else:
+                job.audio = decoder(job.audio_path)
+        return True
+    
+    def _should_stream(self, task, job):
+        """
+        是否流式解码
+
+        分窗转录时，时长超过 STREAMING_DECODE_MIN_DURATION 且没有解码缓存的音频流式解码，
+        每个任务只保留约两个窗口的波形；已有解码缓存时内存映射加载同样不占用整段内存。
+        """
+        if not self.streaming_decode or self.transcribe_window <= 0:
+            return False
+        
+        source = self._decode_source(job)
+        if self.decoded_cache and self.decoded_cache.contains(source):
+            return False
+        
+        job.duration = task.duration or job.duration or probe_duration(source)
+        return bool(job.duration) and job.duration >= self.streaming_min_duration
+    
+    def _decode_source(self, job):
+        """
+        解码缓存使用的源文件
+
+        任务音频与媒体缓存中的音频是同一文件（硬链接）时使用缓存中的路径，
+        同一视频的其他任务（换模型、换语言）可以复用解码结果。
+        """
+        if self.media_cache and job.video_key:
+            cached_path = self.media_cache.audio_path(job.video_key)
+            try:
+                if os.path.samefile(cached_path, job.audio_path):
+                    return cached_path
+            except OSError:
+                pass
+        return job.audio_path
+    
+    def _load_audio(self, audio_path, cancel_token, sample_rate=16000):
+        """使用ffmpeg解码为16kHz单声道波形（与 whisper.load_audio 一致），取消时终止ffmpeg"""
+        import numpy as np
+        
+        cmd = [
+            'ffmpeg', '-nostdin', '-threads', '0',
+            '-i', audio_path,
+            '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(sample_rate),
+            '-'
+        ]
+        result = cancel_token.run_process(cmd, text=False)
+        if result.returncode != 0:
+            raise Exception(f"音频解码失败: {result.stderr.decode('utf-8', errors='ignore')}")
+        
+        return np.frombuffer(result.stdout, np.int16).flatten().astype(np.float32) / 32768.0
+    
+    def _stage_transcribe(self, task, job):
+        """转录阶段"""
+        self._update_status(task, job, 'transcribing', 15, '正在转录音频...')
+        self._cleanup_files(self._partial_result_path(task.task_id))
+        
+        if WHISPER_AVAILABLE:
+            # 使用真实的Whisper进行转录
+            job.result = self._whisper_transcribe(task, job)
+        else:
+            # 模拟转录过程
+            job.result = self._simulate_transcribe(task, job)
+        
+        job.audio = None
+        if job.result is None:
+            return False
+        
+        # 模拟模式的结果不缓存
+        self._save_transcript(task, job, cache=WHISPER_AVAILABLE)
+        return True
+    
+    def _save_transcript(self, task, job, cache=True):
+        """保存检查点（进程重启后可直接从写出阶段恢复）并缓存转录结果"""
+        checkpoint_path = self._checkpoint_path(task.task_id)
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+        with open(checkpoint_path, 'w', encoding='utf-8') as f:
+            json.dump(job.result, f, ensure_ascii=False, default=float)
+        task.completed_stage = 'transcribe'
+        db.session.commit()
+        
+        if self.media_cache and cache:
+            try:
+                self.media_cache.store_transcript(self._transcript_key(task, job), job.result, {
+                    'task_id': task.task_id,
+                    'model': task.model_name
+                })
+            except OSError as e:
+                logger.warning(f"缓存转录结果失败 {job.task_id}: {e}")
+    
+    def _stage_write(self, task, job):
+        """写出阶段：保存转录片段并完成任务，各种输出格式在下载时按需渲染"""
+        followers = self._close_followers(job)
+        self._update_status(task, job, 'transcribing', 95, '正在保存结果...')
+        
+        segments = _result_segments(job.result, task.duration)
+        transcript = {
+            'language': job.result.get('language') or None,
+            'file_size': sum(len(segment['text'].encode('utf-8')) for segment in segments)
+        }
+        job.result = None
+        
+        # 跟随者获得各自的任务记录和片段副本（跟随者先提交，失败回滚时不影响领导者）
+        for follower_id in followers:
+            self._complete_follower(task, job, follower_id, segments, transcript)
+        
+        # 保存结果期间领导者被取消：跟随者已完成，领导者按取消处理
+        if self._is_cancelled(task):
+            self._cleanup_files(self._checkpoint_path(task.task_id))
+            self._cancel_job(task, job)
+            return False
+        
+        task.segment_count = save_transcript_segments(task.task_id, segments)
+        task.language = transcript['language']
+        task.file_size = transcript['file_size']
+        index_task(task)
+        if task.get_options().get('keep_audio', True):
+            task.audio_file_path = job.audio_path
+        else:
+            self._cleanup_audio(job.audio_path)
+        
+        # 更新任务状态为完成
+        self._apply_timings(task, job)
+        task.update_status('completed', progress=100, stage='转录完成')
+        self._cleanup_files(self._checkpoint_path(task.task_id), self._partial_result_path(task.task_id))
+        self._broadcast_update(job.task_id, 'completed', 100, '转录完成')
+        
+        # 更新统计信息
+        update_task_statistics(task)
+        
+        # 发送完成通知
+        self._notify_completion(job.task_id, True, '任务完成')
+        
+        logger.info(f"任务处理完成: {job.task_id}")
+        return True
+    
+    def _complete_follower(self, leader, job, follower_id, segments, transcript):
+        """完成跟随者任务：复制领导者的转录片段，共享视频信息"""
+        try:
+            follower = get_task_by_id(follower_id)
+            if not follower or follower.status == 'cancelled':
+                return
             
-            # 发送完成通知
-            self._notify_completion(task_id, True, '任务完成')
+            follower.segment_count = save_transcript_segments(follower_id, segments)
+            follower.language = transcript['language']
+            follower.file_size = transcript['file_size']
             
-            logger.info(f"任务处理完成: {task_id}")
+            if follower.get_options().get('keep_audio', True) and job.audio_path and os.path.exists(job.audio_path):
+                audio_path = self._task_audio_path(follower_id)
+                os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+                link_or_copy(job.audio_path, audio_path)
+                follower.audio_file_path = audio_path
             
-        except Exception as e:
-            logger.error(f"任务处理失败 {task_id}: {e}")
+            follower.title = leader.title
+            follower.duration = leader.duration
+            follower.video_info = leader.video_info
+            index_task(follower)
+            follower.completed_stage = 'transcribe'
+            follower.update_status('completed', progress=100, stage='转录完成')
+            self._broadcast_update(follower_id, 'completed', 100, '转录完成')
+            update_task_statistics(follower)
+            self._notify_completion(follower_id, True, '任务完成')
             
-            if task:
-                task.update_status('failed', stage='处理失败', error=str(e))
-                self._broadcast_update(task_id, 'failed', None, '处理失败', str(e))
-                self._notify_completion(task_id, False, f'任务失败: {str(e)}')
-                
-                # 更新统计信息
-                update_task_statistics(task)
+            logger.info(f"合并任务处理完成: {follower_id}（领导者 {leader.task_id}）")
+        except Exception as e:
+            logger.error(f"完成合并任务失败 {follower_id}: {e}")
+            db.session.rollback()
+            follower = get_task_by_id(follower_id)
+            if follower:
+                follower.update_status('failed', stage='处理失败', error=str(e))
+                self._broadcast_update(follower_id, 'failed', None, '处理失败', str(e))
     
-    def _download_video(self, task):
-        """下载视频并提取音频"""
+    def _download_video(self, task, job):
+        """下载视频并提取音频，取消时立即终止yt-dlp进程"""
         try:
             from flask import current_app
             
@@ -224,7 +1253,7 @@ class TaskManager:
             
             # 执行下载
             logger.info(f"执行下载命令: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=1800)  # 30分钟超时
+            result = job.cancel_token.run_process(cmd, timeout=1800)  # 30分钟超时
             
             if result.returncode != 0:
                 raise Exception(f"下载失败: {result.stderr}")
@@ -257,103 +1286,115 @@ class TaskManager:
             
         except subprocess.TimeoutExpired:
             raise Exception("下载超时")
-        except Exception as e:
-            logger.error(f"下载视频失败: {e}")
+        except TaskCancelledException:
             raise
-    
-    def _transcribe_audio(self, task, audio_path):
-        """转录音频"""
-        try:
-            from flask import current_app
-            
-            # 创建结果目录
-            result_dir = os.path.join(current_app.config['RESULT_STORAGE_PATH'], task.task_id)
-            os.makedirs(result_dir, exist_ok=True)
-            
-            options = task.get_options()
-            output_format = options.get('output_format', 'txt')
-            
-            if WHISPER_AVAILABLE:
-                # 使用真实的Whisper进行转录
-                result_path = self._whisper_transcribe(task, audio_path, result_dir, output_format)
-            else:
-                # 模拟转录过程
-                result_path = self._simulate_transcribe(task, audio_path, result_dir, output_format)
-            
-            return result_path
-            
         except Exception as e:
-            logger.error(f"转录音频失败: {e}")
+            logger.error(f"下载视频失败: {e}")
             raise
     
-    def _whisper_transcribe(self, task, audio_path, result_dir, output_format):
+    def _whisper_transcribe(self, task, job):
         """使用Whisper进行真实转录"""
         try:
-            # 加载模型
-            model = whisper.load_model(task.model_name)
-            
-            # 获取语言设置
-            options = task.get_options()
-            language = options.get('language')
+            # 转录参数（与转录缓存键一致）
+            whisper_options = transcribe_options(task.get_options())
             
-            # 转录参数
-            transcribe_options = {}
-            if language and language != 'auto':
-                transcribe_options['language'] = language
-            
-            # 执行转录
             logger.info(f"开始Whisper转录: {task.task_id}")
-            result = model.transcribe(audio_path, **transcribe_options)
-            
-            # 保存结果
-            result_path = os.path.join(result_dir, f'result.{output_format}')
-            
-            if output_format == 'txt':
-                with open(result_path, 'w', encoding='utf-8') as f:
-                    f.write(result['text'])
-            elif output_format == 'md':
-                with open(result_path, 'w', encoding='utf-8') as f:
-                    f.write(f"# 转录结果\n\n")
-                    f.write(f"**视频标题**: {task.title}\n\n")
-                    f.write(f"**转录时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-                    f.write(f"**使用模型**: {task.model_name}\n\n")
-                    f.write("## 内容\n\n")
-                    f.write(result['text'])
-            elif output_format == 'json':
-                with open(result_path, 'w', encoding='utf-8') as f:
-                    json.dump({
-                        'text': result['text'],
-                        'segments': result.get('segments', []),
-                        'language': result.get('language', ''),
-                        'task_info': {
-                            'task_id': task.task_id,
-                            'model': task.model_name,
-                            'timestamp': datetime.now().isoformat()
-                        }
-                    }, f, ensure_ascii=False, indent=2)
+            if self.transcribe_pool:
+                return self._pool_transcribe(task, job, whisper_options)
             
-            return result_path
+            with self.model_pool.lease(task.model_name) as pooled_model:
+                if job.stream_audio:
+                    # 流式解码：ffmpeg按窗口输出，内存占用与音频时长无关
+                    with StreamingAudio(self._decode_source(job), duration=job.duration) as stream, \
+                            job.cancel_token.track(stream.process):
+                        return self._transcribe_windows(task, job, pooled_model, stream, whisper_options)
+                
+                if job.audio is not None and self.transcribe_window > 0:
+                    return self._transcribe_windows(task, job, pooled_model, job.audio, whisper_options)
+                
+                audio = job.audio if job.audio is not None else job.audio_path
+                return pooled_model.transcribe(
+                    audio, before_window=job.cancel_token.raise_if_cancelled, **whisper_options
+                )
             
+        except TaskCancelledException:
+            raise
         except Exception as e:
+            # 取消时ffmpeg被终止导致的读取失败按取消处理
+            job.cancel_token.raise_if_cancelled()
             logger.error(f"Whisper转录失败: {e}")
             raise
     
-    def _simulate_transcribe(self, task, audio_path, result_dir, output_format):
-        """模拟转录过程（用于开发测试）"""
+    def _pool_transcribe(self, task, job, transcribe_options):
+        """
+        在转录进程池中转录
+
+        解码缓存以内存映射文件的路径传给工作进程，流式解码和未解码的音频由工作进程自行读取，
+        分窗片段回调仍在当前线程中执行。
+        """
+        if job.stream_audio:
+            audio = {'mode': 'stream', 'path': self._decode_source(job), 'duration': job.duration}
+        elif getattr(job.audio, 'filename', None):
+            audio = {'mode': 'npy', 'path': job.audio.filename}
+        else:
+            audio = {'mode': 'file', 'path': job.audio_path}
+        
         try:
-            # 模拟转录进度
-            for progress in range(20, 100, 10):
-                if task.task_id in self.cancelled_tasks:
-                    return None
-                
-                task.update_status('transcribing', progress=progress, stage=f'转录进度 {progress}%')
-                self._broadcast_update(task.task_id, 'transcribing', progress, f'转录进度 {progress}%')
-                time.sleep(1)  # 模拟处理时间
-            
-            # 生成模拟结果
-            result_path = os.path.join(result_dir, f'result.{output_format}')
+            result = self.transcribe_pool.transcribe(
+                task.model_name, audio, transcribe_options,
+                window_seconds=self.transcribe_window,
+                on_segments=lambda segments, decoded, total: self._on_segments(task, job, segments, decoded, total),
+                is_cancelled=lambda: job.cancel_token.cancelled
+            )
+        except TranscriptionCancelled:
+            job.cancel_token.raise_if_cancelled()
+            raise
+        job.cancel_token.raise_if_cancelled()
+        return result
+    
+    def _transcribe_windows(self, task, job, pooled_model, audio, transcribe_options):
+        """按窗口转录，每个窗口完成后推送片段和进度"""
+        result = transcribe_windowed(
+            pooled_model, audio,
+            window_seconds=self.transcribe_window,
+            on_segments=lambda segments, decoded, total: self._on_segments(task, job, segments, decoded, total),
+            before_window=job.cancel_token.raise_if_cancelled,
+            **transcribe_options
+        )
+        # 取消时ffmpeg被终止，流式音频会提前结束，不能作为完整结果
+        job.cancel_token.raise_if_cancelled()
+        return result
+    
+    def _on_segments(self, task, job, segments, decoded_seconds, total_seconds):
+        """窗口转录完成：按已解码的音频时长更新进度，追加部分结果并推送片段"""
+        progress = 15 + int(75 * min(decoded_seconds, total_seconds) / total_seconds) if total_seconds else 90
+        
+        if segments:
+            partial_path = self._partial_result_path(task.task_id)
+            os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+            with open(partial_path, 'a', encoding='utf-8') as f:
+                for segment in segments:
+                    f.write(f"[{_format_timestamp(segment['start'])} --> {_format_timestamp(segment['end'])}] "
+                            f"{segment['text'].strip()}\n")
             
-            mock_text = f"""这是一个模拟的转录结果。
+            for task_id in [task.task_id] + list(job.followers):
+                self._broadcast_segments(task_id, segments, progress)
+        
+        self._update_status(
+            task, job, 'transcribing', progress,
+            f'转录进度 {_format_timestamp(decoded_seconds)} / {_format_timestamp(total_seconds)}'
+        )
+    
+    def _simulate_transcribe(self, task, job):
+        """模拟转录过程（用于开发测试）"""
+        # 模拟转录进度
+        for progress in range(20, 100, 10):
+            job.cancel_token.raise_if_cancelled()
+            self._update_status(task, job, 'transcribing', progress, f'转录进度 {progress}%')
+            job.cancel_token.wait(1)  # 模拟处理时间
+        job.cancel_token.raise_if_cancelled()
+        
+        mock_text = f"""这是一个模拟的转录结果。
 
 任务ID: {task.task_id}
 视频URL: {task.url}
@@ -368,48 +1409,26 @@ class TaskManager:
 人工智能技术正在快速发展，它已经深入到我们生活的各个方面。
 从智能手机的语音助手，到自动驾驶汽车，再到医疗诊断系统，AI无处不在。
 让我们一起探索这个令人兴奋的技术领域。"""
-            
-            if output_format == 'txt':
-                with open(result_path, 'w', encoding='utf-8') as f:
-                    f.write(mock_text)
-            elif output_format == 'md':
-                with open(result_path, 'w', encoding='utf-8') as f:
-                    f.write(f"# 转录结果\n\n")
-                    f.write(f"**视频标题**: {task.title or '未知标题'}\n\n")
-                    f.write(f"**转录时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-                    f.write(f"**使用模型**: {task.model_name}\n\n")
-                    f.write("## 内容\n\n")
-                    f.write(mock_text)
-            elif output_format == 'json':
-                with open(result_path, 'w', encoding='utf-8') as f:
-                    json.dump({
-                        'text': mock_text,
-                        'segments': [
-                            {
-                                'start': 0.0,
-                                'end': 5.0,
-                                'text': '大家好，欢迎观看这个视频。'
-                            },
-                            {
-                                'start': 5.0,
-                                'end': 10.0,
-                                'text': '今天我们要讨论的话题是人工智能在现代社会中的应用。'
-                            }
-                        ],
-                        'language': 'zh',
-                        'task_info': {
-                            'task_id': task.task_id,
-                            'model': task.model_name,
-                            'timestamp': datetime.now().isoformat(),
-                            'note': '这是模拟转录结果'
-                        }
-                    }, f, ensure_ascii=False, indent=2)
-            
-            return result_path
-            
-        except Exception as e:
-            logger.error(f"模拟转录失败: {e}")
-            raise
+        
+        result = {
+            'text': mock_text,
+            'segments': [
+                {
+                    'start': 0.0,
+                    'end': 5.0,
+                    'text': '大家好，欢迎观看这个视频。'
+                },
+                {
+                    'start': 5.0,
+                    'end': 10.0,
+                    'text': '今天我们要讨论的话题是人工智能在现代社会中的应用。'
+                }
+            ],
+            'language': 'zh',
+            'note': '这是模拟转录结果'
+        }
+        self._on_segments(task, job, result['segments'], 10.0, 10.0)
+        return result
     
     def _cleanup_files(self, *file_paths):
         """清理文件"""
@@ -421,6 +1440,12 @@ class TaskManager:
                 except Exception as e:
                     logger.warning(f"删除文件失败 {file_path}: {e}")
     
+    def _cleanup_audio(self, audio_path):
+        """删除任务音频及其解码缓存"""
+        if audio_path and self.decoded_cache:
+            self.decoded_cache.invalidate(audio_path)
+        self._cleanup_files(audio_path)
+    
     def _broadcast_update(self, task_id, status, progress=None, stage=None, error=None):
         """广播任务更新"""
         try:
@@ -430,6 +1455,15 @@ class TaskManager:
         except Exception as e:
             logger.warning(f"广播任务更新失败: {e}")
     
+    def _broadcast_segments(self, task_id, segments, progress=None):
+        """推送转录片段"""
+        try:
+            from flask import current_app
+            if hasattr(current_app, 'socketio'):
+                broadcast_task_segments(current_app.socketio, task_id, segments, progress)
+        except Exception as e:
+            logger.warning(f"推送转录片段失败: {e}")
+    
     def _notify_completion(self, task_id, success, message):
         """发送完成通知"""
         try:
@@ -442,5 +1476,34 @@ class TaskManager:
     def shutdown(self):
         """关闭任务管理器"""
         self.running = False
-        self.executor.shutdown(wait=True)
-        logger.info("任务管理器已关闭") 
\ No newline at end of file
+        self._stop_event.set()
+        if self.local_workers:
+            self.local_workers[0].set()
+        if self.watchdog:
+            self.watchdog.stop()
+        if self.probe_executor:
+            self.probe_executor.shutdown(wait=False)
+        if self.pipeline:
+            self.pipeline.stop(wait=True)
+        if self.transcribe_pool:
+            self.transcribe_pool.shutdown()
+        status_buffer.stop()
+        task_counters.stop()
+        logger.info("任务管理器已关闭") 
+
+
+def _result_segments(result, duration=None):
+    """转录结果的片段列表，只有全文没有片段的结果整体作为一个片段"""
+    segments = result.get('segments') or []
+    if not segments and result.get('text', '').strip():
+        segments = [{'start': 0.0, 'end': float(duration or 0), 'text': result['text']}]
+    return segments
+
+
+def _format_timestamp(seconds):
+    """格式化时间戳为 HH:MM:SS.mmm"""
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
@@ -0,0 +1,243 @@
+"""
+系统指标时间序列
+原始采样只保存在内存环形缓冲中；每分钟结束时把该分钟的最小值、平均值和最大值写入数据库，
+每小时压缩一次：由分钟汇总生成小时汇总，并按保留期删除过期的分钟和小时汇总。
+历史查询按时间范围选择分辨率：内存中覆盖得到的用原始采样，分钟汇总保留期内用分钟汇总，更早的用小时汇总。
+"""
+
+import threading
+import logging
+from datetime import datetime, timedelta
+from collections import deque
+
+from sqlalchemy.exc import IntegrityError
+
+from webapp.core.database import db, SystemMetricRollup, SystemStatus
+
+logger = logging.getLogger(__name__)
+
+
+class TimeSeriesStore:
+    """系统指标时间序列存储"""
+
+    def __init__(self, metrics, raw_capacity=720, minute_retention_hours=48, hour_retention_days=90):
+        """
+        Args:
+            metrics: 记录的指标名称
+            raw_capacity: 内存中保留的原始采样数
+            minute_retention_hours: 分钟汇总的保留时长（小时）
+            hour_retention_days: 小时汇总的保留时长（天）
+        """
+        self.metrics = list(metrics)
+        self.raw = deque(maxlen=raw_capacity)
+        self.minute_retention = timedelta(hours=minute_retention_hours)
+        self.hour_retention = timedelta(days=hour_retention_days)
+        # 正在累积的一分钟：(分钟起点, {指标: [最小值, 总和, 最大值, 采样数]})
+        self._minute = None
+        self._compacted_hour = None
+        self._lock = threading.Lock()
+
+    def add_sample(self, timestamp, values):
+        """
+        记录一个原始采样（需要在应用上下文中调用）
+
+        跨入新的一分钟时写入上一分钟的汇总，跨入新的一小时时执行压缩。
+        """
+        bucket = timestamp.replace(second=0, microsecond=0)
+        finished = None
+        with self._lock:
+            self.raw.append((timestamp, {metric: values.get(metric) for metric in self.metrics}))
+            if self._minute and self._minute[0] != bucket:
+                finished, self._minute = self._minute, None
+            if self._minute is None:
+                self._minute = (bucket, {})
+
+            accumulators = self._minute[1]
+            for metric in self.metrics:
+                value = values.get(metric)
+                if value is None:
+                    continue
+                acc = accumulators.get(metric)
+                if acc is None:
+                    accumulators[metric] = [value, value, value, 1]
+                else:
+                    acc[0] = min(acc[0], value)
+                    acc[1] += value
+                    acc[2] = max(acc[2], value)
+                    acc[3] += 1
+
+        if finished:
+            self._persist_minute(*finished)
+
+        hour = bucket.replace(minute=0)
+        if self._compacted_hour != hour:
+            self.compact(timestamp)
+            self._compacted_hour = hour
+
+    def _persist_minute(self, bucket_start, accumulators):
+        """写入一分钟的汇总，进程重启前后同一分钟的汇总合并为一行"""
+        for metric, (minimum, total, maximum, count) in accumulators.items():
+            row = SystemMetricRollup(
+                resolution='minute', metric=metric, bucket_start=bucket_start,
+                min_value=minimum, avg_value=total / count, max_value=maximum, samples=count
+            )
+            try:
+                with db.session.begin_nested():
+                    db.session.add(row)
+            except IntegrityError:
+                existing = SystemMetricRollup.query.filter_by(
+                    resolution='minute', metric=metric, bucket_start=bucket_start
+                ).first()
+                if existing:
+                    samples = existing.samples + count
+                    existing.avg_value = (existing.avg_value * existing.samples + total) / samples
+                    existing.min_value = min(existing.min_value, minimum)
+                    existing.max_value = max(existing.max_value, maximum)
+                    existing.samples = samples
+        try:
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"保存系统指标汇总失败: {e}")
+            db.session.rollback()
+
+    def compact(self, now=None):
+        """
+        压缩：为已结束的小时生成小时汇总，删除过期的分钟汇总、小时汇总和旧版原始状态记录
+
+        Returns:
+            dict: 生成的小时数和删除的行数
+        """
+        now = now or datetime.utcnow()
+        current_hour = now.replace(minute=0, second=0, microsecond=0)
+        result = {'hours_rolled_up': 0, 'deleted': 0}
+        try:
+            result['hours_rolled_up'] = self._rollup_hours(current_hour)
+
+            minute_cutoff = now - self.minute_retention
+            result['deleted'] += SystemMetricRollup.query.filter(
+                SystemMetricRollup.resolution == 'minute',
+                SystemMetricRollup.bucket_start < minute_cutoff
+            ).delete(synchronize_session=False)
+            result['deleted'] += SystemMetricRollup.query.filter(
+                SystemMetricRollup.resolution == 'hour',
+                SystemMetricRollup.bucket_start < now - self.hour_retention
+            ).delete(synchronize_session=False)
+            result['deleted'] += SystemStatus.query.filter(
+                SystemStatus.timestamp < minute_cutoff
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"压缩系统指标失败: {e}")
+            db.session.rollback()
+            return result
+
+        if result['hours_rolled_up'] or result['deleted']:
+            logger.info(f"系统指标已压缩: 生成 {result['hours_rolled_up']} 个小时汇总，删除 {result['deleted']} 行")
+        return result
+
+    def _rollup_hours(self, current_hour):
+        """由分钟汇总生成 current_hour 之前各小时的汇总（跳过没有数据的小时）"""
+        last = db.session.query(db.func.max(SystemMetricRollup.bucket_start)).filter(
+            SystemMetricRollup.resolution == 'hour'
+        ).scalar()
+        start = last + timedelta(hours=1) if last else None
+
+        hours = 0
+        while True:
+            query = db.session.query(db.func.min(SystemMetricRollup.bucket_start)).filter(
+                SystemMetricRollup.resolution == 'minute',
+                SystemMetricRollup.bucket_start < current_hour
+            )
+            if start is not None:
+                query = query.filter(SystemMetricRollup.bucket_start >= start)
+            first = query.scalar()
+            if first is None:
+                return hours
+
+            hour = first.replace(minute=0, second=0, microsecond=0)
+            for metric, (minimum, average, maximum, count) in self._aggregate_minutes(hour).items():
+                db.session.add(SystemMetricRollup(
+                    resolution='hour', metric=metric, bucket_start=hour,
+                    min_value=minimum, avg_value=average, max_value=maximum, samples=count
+                ))
+            hours += 1
+            start = hour + timedelta(hours=1)
+
+    def _aggregate_minutes(self, hour):
+        """汇总一小时内的分钟汇总：{指标: (最小值, 平均值, 最大值, 采样数)}"""
+        rows = db.session.query(
+            SystemMetricRollup.metric,
+            db.func.min(SystemMetricRollup.min_value),
+            db.func.sum(SystemMetricRollup.avg_value * SystemMetricRollup.samples),
+            db.func.max(SystemMetricRollup.max_value),
+            db.func.sum(SystemMetricRollup.samples)
+        ).filter(
+            SystemMetricRollup.resolution == 'minute',
+            SystemMetricRollup.bucket_start >= hour,
+            SystemMetricRollup.bucket_start < hour + timedelta(hours=1)
+        ).group_by(SystemMetricRollup.metric).all()
+        return {
+            metric: (minimum, total / count, maximum, count)
+            for metric, minimum, total, maximum, count in rows
+        }
+
+    def get_history(self, start, now=None):
+        """
+        查询 start 之后的指标历史
+
+        Returns:
+            dict: resolution 为 raw/minute/hour；timestamps 和各指标的值列表一一对应，
+                  汇总分辨率下各指标的值为平均值，另有 <指标>_min 和 <指标>_max 列表
+        """
+        now = now or datetime.utcnow()
+        with self._lock:
+            raw = list(self.raw)
+            current_minute = (self._minute[0], {
+                metric: (acc[0], acc[1] / acc[3], acc[2], acc[3]) for metric, acc in self._minute[1].items()
+            }) if self._minute else None
+
+        if raw and raw[0][0] <= start:
+            samples = [(timestamp, values) for timestamp, values in raw if timestamp >= start]
+            history = {'resolution': 'raw', 'timestamps': [timestamp.isoformat() for timestamp, _ in samples]}
+            for metric in self.metrics:
+                history[metric] = [values.get(metric) for _, values in samples]
+            return history
+
+        resolution = 'minute' if start >= now - self.minute_retention else 'hour'
+        rows = SystemMetricRollup.query.filter(
+            SystemMetricRollup.resolution == resolution,
+            SystemMetricRollup.bucket_start >= start.replace(second=0, microsecond=0)
+        ).order_by(SystemMetricRollup.bucket_start).all()
+
+        buckets = {}
+        for row in rows:
+            buckets.setdefault(row.bucket_start, {})[row.metric] = (
+                row.min_value, row.avg_value, row.max_value, row.samples
+            )
+
+        # 补上尚未汇总的最后一段：正在累积的一分钟，或当前小时内已写入的分钟汇总
+        if resolution == 'minute' and current_minute:
+            buckets[current_minute[0]] = current_minute[1]
+        elif resolution == 'hour':
+            current_hour = now.replace(minute=0, second=0, microsecond=0)
+            if current_hour not in buckets:
+                buckets[current_hour] = self._aggregate_minutes(current_hour)
+            if not buckets[current_hour]:
+                del buckets[current_hour]
+
+        history = {'resolution': resolution, 'timestamps': [bucket.isoformat() for bucket in buckets]}
+        for metric in self.metrics:
+            points = [bucket.get(metric) for bucket in buckets.values()]
+            history[metric] = [point[1] if point else None for point in points]
+            history[f'{metric}_min'] = [point[0] if point else None for point in points]
+            history[f'{metric}_max'] = [point[2] if point else None for point in points]
+        return history
+
+    def get_stats(self):
+        """获取内存缓冲状态"""
+        with self._lock:
+            return {
+                'raw_samples': len(self.raw),
+                'raw_capacity': self.raw.maxlen,
+                'oldest_raw_sample': self.raw[0][0].isoformat() if self.raw else None
+            }
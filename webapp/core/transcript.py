@@ -0,0 +1,106 @@
+"""
+转录结果渲染
+转录结果只以片段形式保存在数据库中，下载时按请求的格式逐段渲染，
+输出为字符串块的生成器，不需要把整份结果加载到内存或预先写出结果文件
+"""
+
+import json
+import logging
+from datetime import datetime
+
+from webapp.core.database import iter_transcript_segments
+
+logger = logging.getLogger(__name__)
+
+# 输出格式 -> MIME类型
+TRANSCRIPT_FORMATS = {
+    'txt': 'text/plain',
+    'md': 'text/markdown',
+    'json': 'application/json',
+    'srt': 'application/x-subrip'
+}
+
+
+def render_transcript(task, output_format):
+    """
+    按格式渲染任务的转录结果
+
+    Args:
+        task: 任务快照（Task.to_dict() 的结果，需要已保存转录片段）
+        output_format: 输出格式，见 TRANSCRIPT_FORMATS
+
+    Returns:
+        generator: 依次产生渲染结果的字符串块
+    """
+    renderers = {
+        'txt': _render_txt,
+        'md': _render_md,
+        'json': _render_json,
+        'srt': _render_srt
+    }
+    return renderers[output_format](task)
+
+
+def _render_txt(task):
+    for segment in iter_transcript_segments(task['task_id']):
+        text = segment.text.strip()
+        if text:
+            yield text + '\n'
+
+
+def _render_md(task):
+    completed_at = task['completed_at']
+    completed_at = datetime.fromisoformat(completed_at).strftime('%Y-%m-%d %H:%M:%S') if completed_at else '未知'
+    yield "# 转录结果\n\n"
+    yield f"**视频标题**: {task['title'] or '未知标题'}\n\n"
+    yield f"**转录时间**: {completed_at}\n\n"
+    yield f"**使用模型**: {task['model_name']}\n\n"
+    yield "## 内容\n\n"
+    yield from _render_txt(task)
+
+
+def _render_json(task):
+    # 第一遍输出拼接的全文，第二遍输出片段列表
+    yield '{\n  "text": "'
+    first = True
+    for segment in iter_transcript_segments(task['task_id']):
+        text = segment.text.lstrip() if first else segment.text
+        if text:
+            first = False
+            yield json.dumps(text, ensure_ascii=False)[1:-1]
+    yield '",\n  "segments": ['
+    separator = '\n    '
+    for segment in iter_transcript_segments(task['task_id']):
+        yield separator + json.dumps({
+            'id': segment.seq,
+            'start': segment.start,
+            'end': segment.end,
+            'text': segment.text
+        }, ensure_ascii=False)
+        separator = ',\n    '
+    task_info = {
+        'task_id': task['task_id'],
+        'model': task['model_name'],
+        'timestamp': task['completed_at']
+    }
+    yield '\n  ],\n  "language": ' + json.dumps(task['language'] or '')
+    yield ',\n  "task_info": ' + json.dumps(task_info, ensure_ascii=False) + '\n}\n'
+
+
+def _render_srt(task):
+    number = 0
+    for segment in iter_transcript_segments(task['task_id']):
+        text = segment.text.strip()
+        if not text:
+            continue
+        number += 1
+        yield f"{number}\n{_srt_timestamp(segment.start)} --> {_srt_timestamp(segment.end)}\n{text}\n\n"
+
+
+def _srt_timestamp(seconds):
+    """格式化SRT时间戳 HH:MM:SS,mmm"""
+    milliseconds = int(round(max(seconds, 0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
@@ -0,0 +1,82 @@
+"""
+看门狗
+跟踪任务各阶段的截止时间，到期后回调处理（终止子进程、标记超时、释放工作线程）
+"""
+
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Watchdog:
+    """截止时间监视线程"""
+
+    def __init__(self, interval=1.0):
+        """
+        初始化看门狗
+
+        Args:
+            interval: 检查间隔（秒）
+        """
+        self.interval = interval
+        self.expired = 0
+        self._deadlines = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动监视线程"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name='task-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止监视线程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def arm(self, key, deadline, callback):
+        """
+        设置截止时间，重复设置时覆盖之前的截止时间
+
+        Args:
+            key: 被监视对象
+            deadline: 截止时间戳
+            callback: 到期回调 callback(key)
+        """
+        with self._lock:
+            self._deadlines[key] = (deadline, callback)
+
+    def disarm(self, key):
+        """取消监视"""
+        with self._lock:
+            self._deadlines.pop(key, None)
+
+    def get_status(self):
+        """获取看门狗状态"""
+        with self._lock:
+            return {
+                'watched': len(self._deadlines),
+                'expired': self.expired
+            }
+
+    def _loop(self):
+        """到期检查循环，回调在锁外执行，回调中可以重新设置截止时间"""
+        while not self._stop_event.wait(self.interval):
+            now = time.time()
+            with self._lock:
+                due = [(key, callback) for key, (deadline, callback) in self._deadlines.items() if deadline <= now]
+                for key, _ in due:
+                    del self._deadlines[key]
+                self.expired += len(due)
+
+            for key, callback in due:
+                try:
+                    callback(key)
+                except Exception as e:
+                    logger.error(f"看门狗回调失败: {e}")
@@ -0,0 +1,137 @@
+"""
+远程工作节点登记
+记录工作节点的最近心跳和它们租用的任务，租约到期未续约的任务由任务管理器重新排队
+"""
+
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteLease:
+    """工作节点对一个任务的租约"""
+
+    def __init__(self, task_id, worker_id, job, ttl):
+        self.task_id = task_id
+        self.worker_id = worker_id
+        self.job = job
+        self.leased_at = time.time()
+        self.expires_at = self.leased_at + ttl
+
+
+class WorkerRegistry:
+    """远程工作节点与任务租约"""
+
+    def __init__(self, offline_after=300):
+        """
+        初始化登记表
+
+        Args:
+            offline_after: 超过该时间（秒）没有请求的工作节点不再显示为在线
+        """
+        self.offline_after = offline_after
+        self._workers = {}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def touch(self, worker_id, models=None, info=None):
+        """记录工作节点的请求"""
+        with self._lock:
+            worker = self._workers.setdefault(worker_id, {
+                'worker_id': worker_id,
+                'first_seen': time.time(),
+                'leased': 0,
+                'completed': 0,
+                'failed': 0,
+                'expired': 0
+            })
+            worker['last_seen'] = time.time()
+            if models is not None:
+                worker['models'] = list(models)
+            if info:
+                worker['info'] = dict(info)
+
+    def grant(self, worker_id, job, ttl):
+        """将任务租给工作节点"""
+        lease = RemoteLease(job.task_id, worker_id, job, ttl)
+        with self._lock:
+            self._leases[lease.task_id] = lease
+            self._workers[worker_id]['leased'] += 1
+        return lease
+
+    def get(self, task_id, worker_id):
+        """获取工作节点持有的租约，租约不存在或属于其他节点时返回 None"""
+        with self._lock:
+            lease = self._leases.get(task_id)
+            if lease and lease.worker_id == worker_id:
+                return lease
+        return None
+
+    def renew(self, lease, ttl):
+        """续约"""
+        with self._lock:
+            lease.expires_at = time.time() + ttl
+
+    def release(self, lease, outcome=None):
+        """
+        结束租约
+
+        Args:
+            lease: 租约
+            outcome: completed、failed 或 expired，用于统计
+        """
+        with self._lock:
+            if self._leases.get(lease.task_id) is not lease:
+                return False
+            del self._leases[lease.task_id]
+            worker = self._workers.get(lease.worker_id)
+            if worker and outcome in ('completed', 'failed', 'expired'):
+                worker[outcome] += 1
+        return True
+
+    def find_by_job(self, job):
+        """查找任务对应的租约"""
+        with self._lock:
+            for lease in self._leases.values():
+                if lease.job is job:
+                    return lease
+        return None
+
+    def pop_expired(self, now=None):
+        """取出所有已过期的租约"""
+        now = now or time.time()
+        with self._lock:
+            expired = [lease for lease in self._leases.values() if lease.expires_at <= now]
+            for lease in expired:
+                del self._leases[lease.task_id]
+                worker = self._workers.get(lease.worker_id)
+                if worker:
+                    worker['expired'] += 1
+        return expired
+
+    def get_status(self):
+        """获取工作节点和租约状态"""
+        now = time.time()
+        with self._lock:
+            leases_by_worker = {}
+            for lease in self._leases.values():
+                leases_by_worker.setdefault(lease.worker_id, []).append({
+                    'task_id': lease.task_id,
+                    'leased_at': lease.leased_at,
+                    'expires_in': round(lease.expires_at - now, 1)
+                })
+
+            workers = []
+            for worker_id, worker in self._workers.items():
+                online = now - worker['last_seen'] < self.offline_after
+                if not online and worker_id not in leases_by_worker:
+                    continue
+                workers.append(dict(worker, online=online, tasks=leases_by_worker.get(worker_id, [])))
+
+            return {
+                'workers': workers,
+                'online': sum(1 for worker in workers if worker['online']),
+                'leased_tasks': len(self._leases)
+            }
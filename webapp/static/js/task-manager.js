@@ -442,7 +442,7 @@ class TaskManager {
                             <tr><td>视频URL</td><td><a href="${task.url}" target="_blank">${task.title || '查看视频'}</a></td></tr>
                             ${task.file_size ? `<tr><td>文件大小</td><td>${window.Bili2Text.Utils.formatFileSize(task.file_size)}</td></tr>` : ''}
                             ${task.duration ? `<tr><td>音频时长</td><td>${window.Bili2Text.Utils.formatDuration(task.duration)}</td></tr>` : ''}
-                            ${task.result_file_path ? `<tr><td>结果文件</td><td>✅ 已生成</td></tr>` : ''}
+                            ${task.segment_count != null || task.result_file_path ? `<tr><td>结果文件</td><td>✅ 已生成</td></tr>` : ''}
                             ${task.audio_file_path ? `<tr><td>音频文件</td><td>✅ 已保留</td></tr>` : ''}
                         </table>
                     </div>